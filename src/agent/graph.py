@@ -1,25 +1,59 @@
-from typing import Dict, Any, List, TypedDict, Optional, TYPE_CHECKING, Tuple # <--- AÑADIR Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, TypedDict, Optional, TYPE_CHECKING, Tuple, Annotated
 from langchain_core.prompts import ChatPromptTemplate
 #from langchain_core.pydantic_v1 import BaseModel, Field as PydanticField # Ya no se necesita aquí
 from langgraph.graph import StateGraph, END
 import os # Para getenv en generate_shopping_plan
 
 from src.utils import data_loader
-from src.utils.config import get_llm
-from .search_handler import search_products_node
+from src.utils.config import compact_prompts_enabled, get_llm, speculative_search_enabled
+from src.utils.llm_scheduler import PRIORITY_BATCH, invoke_llm_chain
+from src.utils.catalog_store import get_catalog_store, index_for
+from src.utils.conversation_memory import bounded_append, evicted_entries, fold_into_summary
+from src.utils.result_projection import project_search_page
+from src.utils.cooccurrence_index import ensure_cooccurrence_index
+from src.utils.text_normalization import NormalizedColumnsIndex, normalize_text
+from src.utils.trigram_index import TrigramIndex
+from src.utils.wishlist_dedup import cluster_wishlist_items, merge_duplicate_items
+from src.utils.vector_index import TfidfVectorIndex
+from .search_handler import search_catalog_cached, search_result_cache, DEFAULT_PAGE_SIZE
 from .wishlist_agent import run_wishlist_agent
-from .planner_models import PurchaseAdvice, SHOPPING_ADVICE_PROMPT_TEMPLATE
-from .master_agent import run_conversational_master_agent, MasterAgentDecision # Importar MasterAgent
+from .planner_models import (
+    AdviceText, COMPACT_SHOPPING_ADVICE_PROMPT_TEMPLATE, PurchaseAdvice, SHOPPING_ADVICE_PROMPT_TEMPLATE,
+    compact_advice_payload,
+)
+from .master_agent import run_conversational_master_agent, MasterAgentDecision, describe_search # Importar MasterAgent
 
 if TYPE_CHECKING:
     pass
 
 # --- Definición del Estado del Agente ---
+def append_history(
+    current: Optional[List[Tuple[str, str]]],
+    update: Optional[List[Tuple[str, str]]]
+) -> List[Tuple[str, str]]:
+    """
+    Reducer del historial de conversación: los nodos devuelven solo los turnos nuevos y
+    LangGraph los agrega al final del historial existente (nunca lo reemplaza). Solo se
+    conservan las últimas `HISTORY_MAX_ENTRIES` entradas; las anteriores quedan resumidas
+    en `conversation_summary`.
+    """
+    return bounded_append(current, update)
+
+
 class AgentState(TypedDict):
     """
     Estado del agente que se pasa entre los nodos del grafo.
+
+    Los nodos no mutan ni devuelven el estado completo: devuelven un diccionario solo con
+    las claves que cambian y LangGraph lo combina. `conversation_history` usa un reducer
+    de solo-agregar (`append_history`); el resto de campos son salidas de reemplazo
+    (canal por defecto de LangGraph), que además rechaza dos escrituras de la misma clave
+    en un mismo paso, lo que permite ejecutar ramas en paralelo de forma segura.
     """
-    marketplace_products: Optional[List[Dict[str, Any]]]
+    # El catálogo no viaja en el estado: vive en el CatalogStore compartido del proceso
+    # (`get_catalog_store()`) y aquí solo se guarda la versión con la que se trabajó.
+    catalog_version: Optional[int]
     instagram_saves: Optional[Dict[str, Any]]
     pinterest_boards: Optional[Dict[str, Any]]
     abandoned_carts: Optional[List[Dict[str, Any]]]
@@ -39,61 +73,61 @@ class AgentState(TypedDict):
     wishlist_agent_error: Optional[str] # Para capturar errores del WishlistAgent
 
     raw_cart_items: Optional[List[Dict[str, Any]]] # Items de carritos procesados antes del matching
+    wishlist_clusters: Optional[List[Dict[str, Any]]] # Grupos de items duplicados entre fuentes (antes del LLM)
 
     # Para el MasterAgent Conversacional
-    conversation_history: Optional[List[Tuple[str, str]]]
+    conversation_history: Annotated[List[Tuple[str, str]], append_history] # Los nodos devuelven solo los turnos nuevos
+    conversation_summary: Optional[str] # Resumen de los turnos que ya salieron del historial acotado
     current_user_input: Optional[str]
     master_agent_decision: Optional[Dict[str, Any]] # Salida del MasterAgent (ej: qué hacer después)
-    catalog_search_output: Optional[List[Dict[str, Any]]] # Resultado de la herramienta de búsqueda
+    catalog_search_output: Optional[Dict[str, Any]] # Página proyectada de la búsqueda: {"results" (compactos), "result_ids", "facets", "total_count", ...}
     # ... más campos según sea necesario
 
 # --- Nodos del Grafo ---
 
-def load_marketplace_data(state: AgentState) -> AgentState:
+def load_marketplace_data(state: AgentState) -> Dict[str, Any]:
     """Nodo para cargar los productos del marketplace."""
     print("---CARGANDO DATOS DEL MARKETPLACE---")
-    products = data_loader.get_marketplace_products()
-    state['marketplace_products'] = products
-    if products:
-        print(f"Cargados {len(products)} productos del marketplace.")
+    # El catálogo se carga una sola vez en el store compartido (mapa de IDs, índices y
+    # deltas posteriores); el estado solo registra su versión.
+    catalog = get_catalog_store()
+    if catalog.ensure_loaded():
+        print(f"Cargados {len(catalog)} productos del marketplace (versión {catalog.version}).")
     else:
         print("No se pudieron cargar los productos del marketplace.")
-    return state
+    return {'catalog_version': catalog.version}
 
-def load_instagram_data(state: AgentState) -> AgentState:
+def load_instagram_data(state: AgentState) -> Dict[str, Any]:
     """Nodo para cargar los 'saves' de Instagram."""
     print("---CARGANDO DATOS DE INSTAGRAM---")
     insta_saves = data_loader.get_instagram_saves()
-    state['instagram_saves'] = insta_saves
     if insta_saves:
         print(f"Cargados {len(insta_saves.get('saved_items', []))} items de Instagram.")
     else:
         print("No se pudieron cargar los datos de Instagram.")
-    return state
+    return {'instagram_saves': insta_saves}
 
-def load_pinterest_data(state: AgentState) -> AgentState:
+def load_pinterest_data(state: AgentState) -> Dict[str, Any]:
     """Nodo para cargar los datos de Pinterest."""
     print("---CARGANDO DATOS DE PINTEREST---")
     pinterest_data = data_loader.get_pinterest_boards()
-    state['pinterest_boards'] = pinterest_data
     if pinterest_data:
         print(f"Cargados {len(pinterest_data.get('boards', []))} tableros de Pinterest.")
     else:
         print("No se pudieron cargar los datos de Pinterest.")
-    return state
+    return {'pinterest_boards': pinterest_data}
 
-def load_abandoned_carts_data(state: AgentState) -> AgentState:
+def load_abandoned_carts_data(state: AgentState) -> Dict[str, Any]:
     """Nodo para cargar los carritos abandonados."""
     print("---CARGANDO DATOS DE CARRITOS ABANDONADOS---")
     carts = data_loader.get_abandoned_carts()
-    state['abandoned_carts'] = carts
     if carts:
         print(f"Cargados {len(carts)} carritos abandonados.")
     else:
         print("No se pudieron cargar los carritos abandonados.")
-    return state
+    return {'abandoned_carts': carts}
 
-def initial_data_processing(state: AgentState) -> AgentState:
+def initial_data_processing(state: AgentState) -> Dict[str, Any]:
     """
     Nodo para un procesamiento inicial de los datos cargados.
     Por ahora, solo imprimirá un resumen. Más adelante, aquí se identificarán
@@ -133,33 +167,46 @@ def initial_data_processing(state: AgentState) -> AgentState:
                     "details": item
                 })
 
-    state['identified_user_wishlist'] = wishlist
+    updates: Dict[str, Any] = {'identified_user_wishlist': wishlist}
     print(f"Identificados {len(wishlist)} items de interés iniciales.")
-    # Inicializar otros campos del estado si es necesario
-    if 'user_profile' not in state or state['user_profile'] is None:
-        state['user_profile'] = {}
-    if 'enriched_wishlist' not in state or state['enriched_wishlist'] is None:
-        state['enriched_wishlist'] = []
-    if 'shopping_plan' not in state or state['shopping_plan'] is None:
-        state['shopping_plan'] = {}
-    if 'search_criteria' not in state: # No sobrescribir si ya existe
-        state['search_criteria'] = None
+    # Inicializar otros campos del estado si es necesario (sin sobrescribir los existentes)
+    for key in ('user_profile', 'enriched_wishlist', 'shopping_plan'):
+        if state.get(key) is None:
+            updates[key] = [] if key == 'enriched_wishlist' else {}
+    if 'search_criteria' not in state:
+        updates['search_criteria'] = None
     if 'search_results' not in state:
-        state['search_results'] = None
-    if 'raw_cart_items' not in state: # Nuevo campo
-        state['raw_cart_items'] = []
-    if 'ia_categorized_wishlist' not in state: # Nuevo campo
-        state['ia_categorized_wishlist'] = []
-    if 'wishlist_agent_error' not in state: # Nuevo campo
-        state['wishlist_agent_error'] = None
-    return state
+        updates['search_results'] = None
+    if 'raw_cart_items' not in state:
+        updates['raw_cart_items'] = []
+    if 'ia_categorized_wishlist' not in state:
+        updates['ia_categorized_wishlist'] = []
+    if 'wishlist_agent_error' not in state:
+        updates['wishlist_agent_error'] = None
+    return updates
 
 # El nodo initial_data_processing se elimina. Su funcionalidad de extracción simple
 # es reemplazada por run_wishlist_agent para items de redes sociales
 # y un nuevo nodo extract_cart_data para los carritos.
 
+def deduplicate_wishlist_sources(state: AgentState) -> Dict[str, Any]:
+    """
+    Agrupa los items de Instagram, Pinterest y carritos que son el mismo producto (por ID,
+    enlace del pin o nombre detectado) antes del WishlistAgent, para que el LLM analice un
+    solo representante por grupo y el matching fusione las señales de todas las fuentes.
+    """
+    print("---DEDUPLICANDO ITEMS ENTRE FUENTES---")
+    catalog = get_catalog_store()
+    columns_index = index_for(catalog.products, "normalized_columns", NormalizedColumnsIndex)
+    name_to_product_id = {columns_index.get(p)['name']: p['id'] for p in catalog.products if p.get('name')}
+    clusters = cluster_wishlist_items(state.get('instagram_saves'), state.get('pinterest_boards'),
+                                      state.get('abandoned_carts'), name_to_product_id)
+    duplicates = sum(len(c['members']) - 1 for c in clusters)
+    print(f"{len(clusters)} grupos de items repetidos entre fuentes; {duplicates} duplicados no se analizarán por separado.")
+    return {'wishlist_clusters': clusters}
+
 # Nuevo nodo para procesar carritos abandonados y prepararlos para el matching
-def extract_cart_data(state: AgentState) -> AgentState:
+def extract_cart_data(state: AgentState) -> Dict[str, Any]:
     """
     Extrae items de carritos abandonados y los formatea para el proceso de matching.
     Estos items no pasan por el LLM en esta fase.
@@ -177,27 +224,30 @@ def extract_cart_data(state: AgentState) -> AgentState:
                     "cart_id": cart.get('cart_id'),
                     "user_id": cart.get('user_id')
                 })
-    state['raw_cart_items'] = processed_cart_items
     print(f"Extraídos {len(processed_cart_items)} items de carritos abandonados para matching directo.")
-    return state
+    return {'raw_cart_items': processed_cart_items}
+
+# Similitud coseno mínima para aceptar un match por vectores TF-IDF.
+VECTOR_MATCH_MIN_SCORE = 0.25
 
-def product_matching_and_enrichment(state: AgentState) -> AgentState:
+def product_matching_and_enrichment(state: AgentState) -> Dict[str, Any]:
     """
     Intenta hacer coincidir productos de ia_categorized_wishlist (proveniente del WishlistAgent)
     y raw_cart_items con el catálogo del marketplace y enriquece la información.
     """
     print("---REALIZANDO MATCHING Y ENRIQUECIMIENTO DE PRODUCTOS (POST-IA Y CARRITOS)---")
     enriched_items_final = []
-    marketplace_products = state.get('marketplace_products', [])
+    catalog = get_catalog_store()
+    marketplace_products = catalog.products
 
-    ia_wishlist = state.get('ia_categorized_wishlist', [])
-    raw_cart_items = state.get('raw_cart_items', [])
+    ia_wishlist = state.get('ia_categorized_wishlist') or []
+    raw_cart_items = state.get('raw_cart_items') or []
 
     if not marketplace_products:
         print("Advertencia: No hay productos del marketplace para hacer matching.")
         # Combinar ia_wishlist y raw_cart_items (formateando raw_cart_items para que se parezcan)
         # y devolverlos sin detalles del marketplace.
-        all_items_without_match = ia_wishlist # ya están en formato CategorizedItem (como dict)
+        all_items_without_match = list(ia_wishlist) # Copia: ya están en formato CategorizedItem (como dict)
         for cart_item_info in raw_cart_items:
             all_items_without_match.append({
                 'original_text': f"Item de carrito: ID {cart_item_info.get('product_id')}",
@@ -208,30 +258,42 @@ def product_matching_and_enrichment(state: AgentState) -> AgentState:
                 'original_item_details': cart_item_info,
                 'marketplace_details': None, 'price': None, 'in_stock': False
             })
-        state['enriched_wishlist'] = all_items_without_match
-        return state
+        return {'enriched_wishlist': all_items_without_match, 'catalog_version': catalog.version}
 
     # 1. Procesar items de la ia_categorized_wishlist (Instagram, Pinterest)
     print(f"Procesando {len(ia_wishlist)} items de la IA Wishlist para matching...")
-    for ia_item_dict in ia_wishlist: # ia_item_dict es un dict del modelo CategorizedItem
+    trigram_index = None # Se construye/obtiene solo si algún item necesita el fallback difuso
+    # Nombres y categorías del catálogo ya normalizados (sin tildes ni puntuación) al cargarlo.
+    columns_index = index_for(marketplace_products, "normalized_columns", NormalizedColumnsIndex)
+    item_matches: List[Tuple[Optional[Dict[str, Any]], Optional[str], Optional[float]]] = []
+    unmatched_positions: List[int] = [] # Items con nombre que no machearon por ID, nombre ni trigramas
+    for position, ia_item_dict in enumerate(ia_wishlist): # ia_item_dict es un dict del modelo CategorizedItem
         matched_product = None
+        match_method = None
+        match_score = None
         product_name_from_ia = ia_item_dict.get('identified_product_name')
 
-        if product_name_from_ia:
-            category_from_ia = ia_item_dict.get('category', '').lower()
+        resolved_product = catalog.get(ia_item_dict['resolved_product_id']) if ia_item_dict.get('resolved_product_id') else None
+        if resolved_product is not None:
+            # Resuelto sin LLM por enlace o nombre exacto: no hace falta el matching difuso.
+            matched_product, match_method, match_score = resolved_product, ia_item_dict.get('resolution_method'), 1.0
+        elif product_name_from_ia:
+            category_from_ia = normalize_text(ia_item_dict.get('category'))
+            name_from_ia_normalized = normalize_text(product_name_from_ia)
 
             best_match = None
             weak_match = None
 
             for mp_item in marketplace_products:
-                mp_name_lower = mp_item['name'].lower()
-                mp_category_lower = mp_item.get('category', '').lower()
+                mp_columns = columns_index.get(mp_item)
+                mp_name_normalized = mp_columns['name']
+                mp_category_normalized = mp_columns['category']
 
-                name_match = product_name_from_ia.lower() in mp_name_lower or \
-                             mp_name_lower in product_name_from_ia.lower()
+                name_match = name_from_ia_normalized in mp_name_normalized or \
+                             mp_name_normalized in name_from_ia_normalized
 
                 if name_match:
-                    if category_from_ia and mp_category_lower and category_from_ia == mp_category_lower:
+                    if category_from_ia and mp_category_normalized and category_from_ia == mp_category_normalized:
                         best_match = mp_item # Match fuerte (nombre y categoría)
                         break # Tomar el primer match fuerte
                     elif not weak_match: # Si aún no tenemos un match débil
@@ -241,10 +303,45 @@ def product_matching_and_enrichment(state: AgentState) -> AgentState:
                 matched_product = best_match
             elif weak_match:
                 matched_product = weak_match # Usar match débil si no hubo fuerte
-                if category_from_ia and matched_product.get('category') and category_from_ia != matched_product.get('category','').lower():
+                if category_from_ia and matched_product.get('category') and category_from_ia != columns_index.get(matched_product)['category']:
                     print(f"Info: Producto IA '{product_name_from_ia}' (Cat IA: {ia_item_dict.get('category')}) macheado con '{matched_product['name']}' (Cat MP: {matched_product.get('category')}) por nombre, pero categorías difieren.")
-            # else: matched_product sigue siendo None
 
+            if matched_product:
+                mp_name_normalized = columns_index.get(matched_product)['name']
+                if mp_name_normalized == name_from_ia_normalized:
+                    match_method, match_score = "exact", 1.0
+                else:
+                    shorter, longer = sorted((len(mp_name_normalized), len(name_from_ia_normalized)))
+                    match_method, match_score = "substring", round(shorter / longer, 4)
+            else:
+                # Fallback difuso: similitud de trigramas sobre los nombres del catálogo.
+                if trigram_index is None:
+                    trigram_index = index_for(marketplace_products, "trigram_names", TrigramIndex)
+                candidates = trigram_index.search(product_name_from_ia, top_k=3)
+                # Preferir el candidato más similar de la misma categoría, si lo hay.
+                same_category = [c for c in candidates if category_from_ia and columns_index.get(c[0])['category'] == category_from_ia]
+                if same_category or candidates:
+                    matched_product, match_score = (same_category or candidates)[0]
+                    match_method = "trigram"
+                else:
+                    unmatched_positions.append(position)
+        item_matches.append((matched_product, match_method, match_score))
+
+    # Último nivel: similitud TF-IDF de los items que siguen sin match (nombre + características),
+    # en un solo lote (un producto matricial disperso en lugar de un bucle por item).
+    if unmatched_positions:
+        vector_index = index_for(marketplace_products, "tfidf", TfidfVectorIndex)
+        batch_queries = [
+            " ".join([ia_wishlist[i]['identified_product_name']] + list(ia_wishlist[i].get('key_features') or []))
+            for i in unmatched_positions
+        ]
+        for position, candidates in zip(unmatched_positions, vector_index.query_batch(batch_queries, top_k=3, min_score=VECTOR_MATCH_MIN_SCORE)):
+            if candidates:
+                matched_product, match_score = candidates[0]
+                item_matches[position] = (matched_product, "tfidf", match_score)
+
+    for ia_item_dict, (matched_product, match_method, match_score) in zip(ia_wishlist, item_matches):
+        product_name_from_ia = ia_item_dict.get('identified_product_name')
         # ia_item_dict ya tiene la estructura base de CategorizedItem
         # Solo necesitamos añadir/actualizar los detalles del marketplace
         enriched_item_from_ia = ia_item_dict.copy()
@@ -253,11 +350,15 @@ def product_matching_and_enrichment(state: AgentState) -> AgentState:
             enriched_item_from_ia['price'] = matched_product.get('price')
             enriched_item_from_ia['currency'] = matched_product.get('currency')
             enriched_item_from_ia['in_stock'] = matched_product.get('stock', 0) > 0
-            print(f"Producto IA '{product_name_from_ia}' macheado con '{matched_product['name']}'")
+            enriched_item_from_ia['match_method'] = match_method
+            enriched_item_from_ia['match_score'] = match_score
+            print(f"Producto IA '{product_name_from_ia}' macheado con '{matched_product['name']}' ({match_method}, score={match_score})")
         else:
             enriched_item_from_ia['marketplace_details'] = None # Asegurar que esté explícitamente
             enriched_item_from_ia['price'] = None
             enriched_item_from_ia['in_stock'] = False
+            enriched_item_from_ia['match_method'] = None
+            enriched_item_from_ia['match_score'] = None
             print(f"Producto IA '{product_name_from_ia}' no encontrado en el marketplace.")
         enriched_items_final.append(enriched_item_from_ia)
 
@@ -282,10 +383,7 @@ def product_matching_and_enrichment(state: AgentState) -> AgentState:
         }
 
         if product_id:
-            for mp_item in marketplace_products:
-                if mp_item['id'] == product_id:
-                    matched_product = mp_item
-                    break
+            matched_product = catalog.get(product_id) # Búsqueda O(1) en el mapa de IDs
 
         if matched_product:
             cart_item_for_enrichment['identified_product_name'] = matched_product.get('name')
@@ -299,11 +397,37 @@ def product_matching_and_enrichment(state: AgentState) -> AgentState:
             print(f"Item de carrito ID '{product_id}' no encontrado en el marketplace.")
         enriched_items_final.append(cart_item_for_enrichment)
 
-    state['enriched_wishlist'] = enriched_items_final
-    print(f"Total de items en wishlist enriquecida (IA + Carritos): {len(enriched_items_final)}")
-    return state
+    # 3. Fusionar los duplicados entre fuentes (mismo grupo o mismo producto del catálogo).
+    merged_items = merge_duplicate_items(enriched_items_final, state.get('wishlist_clusters'))
+    print(f"Total de items en wishlist enriquecida (IA + Carritos): {len(merged_items)} "
+          f"({len(enriched_items_final) - len(merged_items)} duplicados fusionados)")
+    return {'enriched_wishlist': merged_items, 'catalog_version': catalog.version}
 
-def generate_shopping_plan(state: AgentState) -> AgentState:
+def frequently_bought_together(product_ids: List[str], limit: int = 3) -> List[Dict[str, Any]]:
+    """
+    Productos que suelen ir junto a `product_ids` (cross-sell/bundles), según el índice de
+    co-ocurrencias de carritos y tableros. Excluye los productos dados y los que no están en
+    el catálogo o sin stock; el peso de un candidato suma el de todos los productos con que
+    co-ocurre.
+    """
+    catalog = get_catalog_store()
+    index = ensure_cooccurrence_index()
+    excluded = set(product_ids)
+    candidates: Dict[str, Dict[str, Any]] = {}
+    for product_id in product_ids:
+        for neighbor_id, weight in index.frequently_together(product_id):
+            product = catalog.get(neighbor_id)
+            if neighbor_id in excluded or product is None or product.get('stock', 0) <= 0:
+                continue
+            entry = candidates.setdefault(neighbor_id, {
+                "id": neighbor_id, "name": product.get('name'), "price": product.get('price'),
+                "currency": product.get('currency'), "score": 0.0, "bought_with": [],
+            })
+            entry["score"] += weight
+            entry["bought_with"].append(product_id)
+    return sorted(candidates.values(), key=lambda c: c["score"], reverse=True)[:limit]
+
+def generate_shopping_plan(state: AgentState) -> Dict[str, Any]:
     """
     Genera un plan de compra basado en la wishlist enriquecida y el perfil del usuario.
     También intenta generar consejos de compra personalizados usando un LLM para algunos items.
@@ -361,15 +485,19 @@ def generate_shopping_plan(state: AgentState) -> AgentState:
             })
 
 
+    # Cross-sell: lo que suele comprarse junto a lo que ya está en el plan.
+    ensure_cooccurrence_index(state.get('abandoned_carts'), state.get('pinterest_boards'))
+    plan_ids = [item['marketplace_details']['id'] for item in items_to_buy if item['marketplace_details'].get('id')]
+
     shopping_plan = {
         "budget": budget,
         "estimated_total_cost": current_cost,
         "items_to_buy": items_to_buy,
         "recommendations_for_later": recommendations,
+        "frequently_bought_together": frequently_bought_together(plan_ids),
         "currency": items_to_buy[0].get('currency') if items_to_buy else None # Asume misma moneda
     }
 
-    state['shopping_plan'] = shopping_plan
     print(f"Plan de compra generado con {len(items_to_buy)} items para comprar (antes de consejos IA).")
     print(f"Costo total estimado: {current_cost} {shopping_plan['currency'] if shopping_plan['currency'] else ''}")
     print(f"{len(recommendations)} recomendaciones adicionales generadas.")
@@ -379,8 +507,14 @@ def generate_shopping_plan(state: AgentState) -> AgentState:
         try:
             llm = get_llm(temperature=0.7, model_name=os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini")) # Temp más alta para creatividad
 
-            advice_prompt = ChatPromptTemplate.from_template(SHOPPING_ADVICE_PROMPT_TEMPLATE)
-            advice_chain = advice_prompt | llm.with_structured_output(PurchaseAdvice)
+            # En modo compacto el LLM recibe el producto en JSON minificado y devuelve solo el consejo.
+            compact = compact_prompts_enabled()
+            if compact:
+                advice_prompt = ChatPromptTemplate.from_template(COMPACT_SHOPPING_ADVICE_PROMPT_TEMPLATE)
+                advice_chain = advice_prompt | llm.with_structured_output(AdviceText)
+            else:
+                advice_prompt = ChatPromptTemplate.from_template(SHOPPING_ADVICE_PROMPT_TEMPLATE)
+                advice_chain = advice_prompt | llm.with_structured_output(PurchaseAdvice)
 
             items_with_advice = []
             # Generar consejo para los primeros N items (ej. 2)
@@ -405,12 +539,13 @@ def generate_shopping_plan(state: AgentState) -> AgentState:
 
                 try:
                     print(f"Generando consejo IA para: {product_name}")
-                    advice_response = advice_chain.invoke(item_payload)
+                    payload = compact_advice_payload(item_payload) if compact else item_payload
+                    advice_response = invoke_llm_chain(advice_chain, payload, priority=PRIORITY_BATCH, stage="purchase_advice")
                     # Añadir el consejo al item
                     item_copy = item_to_advise.copy()
                     item_copy['purchase_advice'] = advice_response.advice
                     items_with_advice.append(item_copy)
-                    print(f"Consejo para '{advice_response.item_name}': {advice_response.advice}")
+                    print(f"Consejo para '{product_name}': {advice_response.advice}")
                 except Exception as e_advice:
                     print(f"Error generando consejo IA para '{product_name}': {e_advice}")
                     items_with_advice.append(item_to_advise) # Añadir sin consejo si falla
@@ -423,22 +558,79 @@ def generate_shopping_plan(state: AgentState) -> AgentState:
         except Exception as e_gen:
             print(f"Error inesperado durante la generación de consejos IA: {e_gen}. No se añadirán consejos IA.")
 
-    state['shopping_plan'] = shopping_plan
-    return state
+    return {'shopping_plan': shopping_plan}
 
 # SHOPPING_ADVICE_PROMPT_TEMPLATE y PurchaseAdvice ahora se importan de .planner_models
 
+def run_catalog_search(tool_input: Optional[Dict[str, Any]]) -> Any:
+    """
+    Ejecuta `catalog_search_tool` sobre el catálogo compartido: una página de resultados (el
+    total va en `total_count`) con el cross-sell del resultado más relevante, o
+    `[{"error": ...}]` si no hay catálogo. La usan el nodo de herramientas y la búsqueda
+    especulativa del MasterAgent.
+
+    La página se entrega proyectada (`project_search_page`): registros compactos de los primeros
+    resultados más facets, para no llevar los productos completos al estado ni al MasterAgent.
+    Los productos completos se recuperan por ID del catálogo (`hydrate_results`).
+    """
+    catalog = get_catalog_store()
+    if not len(catalog):
+        print("ADVERTENCIA: No hay productos del marketplace cargados para la búsqueda.")
+        return [{"error": "No hay productos del marketplace cargados."}]
+    # Se pide solo una página de resultados (el total se informa en `total_count`).
+    full_tool_input = {"limit": DEFAULT_PAGE_SIZE, **(tool_input or {}), "marketplace_products": catalog.products}
+    print(f"Llamando a catalog_search_tool con input: {tool_input}")
+    page = search_catalog_cached(**full_tool_input)
+    if page['results']: # Cross-sell para el resultado más relevante
+        page = {**page, 'frequently_bought_together': frequently_bought_together([page['results'][0]['id']])}
+    print(f"Resultado de catalog_search_tool: {page['total_count']} items encontrados ({len(page['results'])} en la página).")
+    print(f"Caché de búsqueda: {'acierto' if page.get('cached') else 'fallo'} ({search_result_cache.stats()})")
+    return project_search_page(page)
+
+
+# Máximo de búsquedas de un mismo turno que se ejecutan a la vez.
+MAX_CONCURRENT_TOOL_CALLS = 4
+
+
+def _safe_catalog_search(tool_input: Dict[str, Any]) -> Any:
+    try:
+        return run_catalog_search(tool_input)
+    except Exception as e_tool:
+        print(f"Error ejecutando catalog_search_tool: {e_tool}")
+        return [{"error": f"Error en la herramienta: {str(e_tool)}"}]
+
+
+def run_catalog_searches(tool_inputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Ejecuta varias búsquedas del mismo turno a la vez (ej: "auriculares y una cafetera de menos
+    de 300") y las agrupa como `{"by_query": {etiqueta: página}}`, con la etiqueta de
+    `describe_search`. Las búsquedas repetidas se ejecutan una sola vez; un error en una no
+    afecta a las demás.
+    """
+    unique_inputs = {}
+    for tool_input in tool_inputs:
+        unique_inputs.setdefault(describe_search(tool_input), tool_input)
+    if not unique_inputs:
+        return {"by_query": {}}
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_TOOL_CALLS, len(unique_inputs)), thread_name_prefix="tool-call") as executor:
+        pages = list(executor.map(_safe_catalog_search, unique_inputs.values()))
+    return {"by_query": dict(zip(unique_inputs.keys(), pages))}
+
+
 # --- Construcción del Grafo Conversacional (Esqueleto) ---
-def create_conversational_graph():
+def create_conversational_graph(checkpointer=None):
     """
     Crea y configura el grafo del agente conversacional principal (esqueleto).
     Este grafo gestionará la interacción con el usuario y, en el futuro,
     delegará tareas a agentes/herramientas especializados.
+
+    Con un `checkpointer` (ej: `SqliteCheckpointer`) el estado de cada sesión se persiste por
+    `thread_id` y cada invocación solo necesita enviar la entrada nueva del usuario.
     """
     workflow = StateGraph(AgentState)
 
     # --- Nodos para el ciclo conversacional ---
-    def get_user_input_node(state: AgentState) -> AgentState:
+    def get_user_input_node(state: AgentState) -> Dict[str, Any]:
         # Este nodo es un placeholder. En una app real con UI, aquí se manejaría la espera de input.
         # En nuestra simulación con `main.py`, `current_user_input` se poblará externamente
         # antes de cada invocación del grafo en el bucle de `main.py`.
@@ -447,46 +639,53 @@ def create_conversational_graph():
             print(f"Input recibido en el grafo: {state['current_user_input']}")
         else:
             print("No hay nuevo input de usuario en el estado actual del grafo.")
-        return state
+        return {} # Solo inspecciona el estado; no hay cambios que aplicar
 
-    def master_agent_node(state: AgentState) -> AgentState:
+    def master_agent_node(state: AgentState) -> Dict[str, Any]:
         print("--- (Grafo) Master Agent Procesando ---")
         user_input = state.get("current_user_input", "") # Puede ser None si venimos de un tool_result
-        history = state.get("conversation_history", [])
+        history = state.get("conversation_history") or []
         search_results = state.get("catalog_search_output") # Obtener resultados de la herramienta
 
         # Llamar a la lógica del MasterAgent
+        summary = state.get("conversation_summary")
         decision_obj = run_conversational_master_agent(
             user_input=user_input if user_input is not None else "", # Pasar string vacío si es None
             conversation_history=history,
-            catalog_search_results=search_results
+            catalog_search_results=search_results,
+            conversation_summary=summary,
+            speculative_search=run_catalog_search if speculative_search_enabled() else None
         )
 
-        # Limpiar el output de la herramienta después de que el MasterAgent lo haya visto/procesado
-        state['catalog_search_output'] = None
-
-        # Actualizar historial y decisión en el estado
         # Solo añadir a historial si hubo input real y respuesta.
         # No añadir el prompt inicial de "bienvenida" del MasterAgent si no hay input de usuario,
-        # ya que el historial debe reflejar un diálogo.
-        new_history = history
+        # ya que el historial debe reflejar un diálogo. El reducer `append_history` agrega
+        # estos turnos nuevos al historial existente.
+        new_turns = []
         if user_input: # Solo si hubo un input real del usuario para este turno
-            new_history = history + [("user", user_input)]
+            new_turns.append(("user", user_input))
             if decision_obj.response_text:
-                 new_history = new_history + [("ai", decision_obj.response_text)]
+                new_turns.append(("ai", decision_obj.response_text))
 
-        state['master_agent_decision'] = decision_obj.model_dump()
-        state['conversation_history'] = new_history
-        state['current_user_input'] = None # Limpiar input después de procesarlo en este turno del grafo
-        return state
+        updates = {
+            'master_agent_decision': decision_obj.model_dump(),
+            'conversation_history': new_turns,
+            'current_user_input': None, # Limpiar input después de procesarlo en este turno del grafo
+            'catalog_search_output': None, # El MasterAgent ya vio/procesó el output de la herramienta
+        }
+        # Los turnos que el reducer va a descartar del historial acotado pasan al resumen.
+        evicted = evicted_entries(history, new_turns)
+        if evicted:
+            updates['conversation_summary'] = fold_into_summary(summary, evicted)
+        return updates
 
-    def respond_to_user_node(state: AgentState) -> AgentState:
+    def respond_to_user_node(state: AgentState) -> Dict[str, Any]:
         # Este nodo es principalmente para la claridad del flujo.
         # La respuesta real al usuario se gestionará en `main.py` basado en `master_agent_decision`.
         decision = state.get('master_agent_decision')
         if decision and decision.get('response_text'):
             print(f"--- (Grafo) Respuesta para el usuario preparada: {decision['response_text'][:100]}...")
-        return state
+        return {}
 
     # Añadir nodos al workflow
     # workflow.add_node("get_input", get_user_input_node) # Movido abajo
@@ -495,47 +694,47 @@ def create_conversational_graph():
 
 
     # --- Nodo para Ejecutar Herramientas ---
-    def execute_tool_node(state: AgentState) -> AgentState:
+    def execute_tool_node(state: AgentState) -> Dict[str, Any]:
         print("--- (Grafo) Ejecutando Herramienta ---")
-        decision = state.get('master_agent_decision')
+        decision = state.get('master_agent_decision') or {}
         tool_name = decision.get('tool_to_call')
         tool_input = decision.get('tool_input')
-
-        if tool_name == "catalog_search_tool":
+        updates: Dict[str, Any] = {}
+
+        # Varias llamadas en un turno (`tool_calls`) o la llamada única de siempre.
+        tool_calls = decision.get('tool_calls') or []
+        search_inputs = [call.get('tool_input') or {} for call in tool_calls if call.get('tool_to_call') == "catalog_search_tool"]
+        for call in tool_calls:
+            if call.get('tool_to_call') != "catalog_search_tool":
+                print(f"Advertencia: Herramienta desconocida en tool_calls: {call.get('tool_to_call')}")
+
+        if search_inputs:
+            # Las búsquedas corren en paralelo y sus páginas se agrupan por query.
+            updates['catalog_version'] = get_catalog_store().version
+            print(f"Ejecutando {len(search_inputs)} búsquedas en paralelo: {[describe_search(i) for i in search_inputs]}")
+            updates['catalog_search_output'] = run_catalog_searches(search_inputs)
+        elif tool_name == "catalog_search_tool":
             if tool_input is None: # Asegurar que tool_input no sea None
                 tool_input = {}
 
-            # La herramienta necesita marketplace_products, que está en el estado global.
-            marketplace_products = state.get("marketplace_products", [])
-            if not marketplace_products:
-                print("ADVERTENCIA: No hay productos del marketplace cargados para la búsqueda.")
-                state['catalog_search_output'] = [{"error": "No hay productos del marketplace cargados."}]
-            else:
-                # Pasar marketplace_products como parte del input a la herramienta
-                full_tool_input = {**tool_input, "marketplace_products": marketplace_products}
-                try:
-                    print(f"Llamando a catalog_search_tool con input: {tool_input}") # No imprimir marketplace_products aquí por verbosidad
-                    # La herramienta se invoca con un solo diccionario de argumentos
-                    results = catalog_search_tool.invoke(full_tool_input)
-                    state['catalog_search_output'] = results
-                    print(f"Resultado de catalog_search_tool: {len(results)} items encontrados.")
-                except Exception as e_tool:
-                    print(f"Error ejecutando catalog_search_tool: {e_tool}")
-                    state['catalog_search_output'] = [{"error": f"Error en la herramienta: {str(e_tool)}"}]
+            # La búsqueda se hace sobre el catálogo compartido (no viaja en el estado).
+            updates['catalog_version'] = get_catalog_store().version
+            updates['catalog_search_output'] = _safe_catalog_search(tool_input)
         else:
             print(f"Advertencia: Herramienta desconocida o no especificada: {tool_name}")
             # Podríamos poner un error genérico en el output si es necesario
 
         # Limpiar la decisión de la herramienta para que no se vuelva a ejecutar indefinidamente.
         # El MasterAgent deberá procesar el output de la herramienta en su siguiente turno.
-        state['master_agent_decision'] = {
-            **(state.get('master_agent_decision') or {}), # mantener otras partes de la decisión si las hubiera
+        updates['master_agent_decision'] = {
+            **decision, # mantener otras partes de la decisión si las hubiera
             'tool_to_call': None,
-            'tool_input': None
+            'tool_input': None,
+            'tool_calls': None
             # 'next_action' ya no se establece a 'process_tool_result' aquí,
             # el MasterAgent detectará el output de la herramienta directamente.
         }
-        return state
+        return updates
 
     # 1. Definir todas las funciones de los nodos (get_user_input_node, master_agent_node, respond_to_user_node, execute_tool_node)
     #    (Ya están definidas arriba en el código)
@@ -556,8 +755,9 @@ def create_conversational_graph():
         if decision and decision.get('next_action') == "end_conversation":
             print("--- (Grafo) Decisión del MasterAgent: Terminar Conversación ---")
             return "end_conversation"
-        elif decision and decision.get('tool_to_call') and decision.get('next_action') == "call_tool":
-            print(f"--- (Grafo) Decisión del MasterAgent: Llamar Herramienta '{decision['tool_to_call']}' ---")
+        elif decision and (decision.get('tool_to_call') or decision.get('tool_calls')) and decision.get('next_action') == "call_tool":
+            tools = [c['tool_to_call'] for c in decision.get('tool_calls') or []] or [decision['tool_to_call']]
+            print(f"--- (Grafo) Decisión del MasterAgent: Llamar Herramienta(s) {tools} ---")
             return "call_tool"
 
         print("--- (Grafo) Decisión del MasterAgent: Responder al Usuario Directamente ---")
@@ -581,7 +781,10 @@ def create_conversational_graph():
         decision = state.get('master_agent_decision')
         if decision and decision.get('next_action') == "end_conversation":
             return END # Terminar el grafo
-        return "get_input" # Volver a pedir input
+        if state.get('current_user_input'):
+            return "get_input" # Hay una nueva entrada pendiente de procesar
+        # El turno terminó: la GUI invocará el grafo de nuevo con la siguiente entrada.
+        return END
 
     workflow.add_conditional_edges(
         "respond_to_user",
@@ -592,7 +795,7 @@ def create_conversational_graph():
     # no se conectan en este grafo principal por ahora. Serán herramientas.
     # El nodo initial_data_processing() ya no se usa/define.
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 
 # Mantener la función create_graph original por si se necesita temporalmente o para referencia,
@@ -606,6 +809,7 @@ def create_pipeline_graph():
     workflow.add_node("load_instagram", load_instagram_data)
     workflow.add_node("load_pinterest", load_pinterest_data)
     workflow.add_node("load_carts", load_abandoned_carts_data)
+    workflow.add_node("dedup_sources", deduplicate_wishlist_sources)
     workflow.add_node("wishlist_analyzer_node", run_wishlist_agent)
     workflow.add_node("extract_cart_data_node", extract_cart_data)
     workflow.add_node("product_matching", product_matching_and_enrichment)
@@ -614,10 +818,13 @@ def create_pipeline_graph():
     # El nodo initial_data_processing() ya no está.
 
     workflow.set_entry_point("load_marketplace")
+    # Las cargas de Instagram, Pinterest y carritos escriben claves distintas del estado, así que
+    # se ejecutan como ramas paralelas; la deduplicación entre fuentes espera a que terminen las tres.
     workflow.add_edge("load_marketplace", "load_instagram")
-    workflow.add_edge("load_instagram", "load_pinterest")
-    workflow.add_edge("load_pinterest", "load_carts")
-    workflow.add_edge("load_carts", "wishlist_analyzer_node")
+    workflow.add_edge("load_marketplace", "load_pinterest")
+    workflow.add_edge("load_marketplace", "load_carts")
+    workflow.add_edge(["load_instagram", "load_pinterest", "load_carts"], "dedup_sources")
+    workflow.add_edge("dedup_sources", "wishlist_analyzer_node")
     workflow.add_edge("wishlist_analyzer_node", "extract_cart_data_node")
     workflow.add_edge("extract_cart_data_node", "product_matching")
     workflow.add_edge("product_matching", "generate_plan")
@@ -639,7 +846,7 @@ if __name__ == '__main__':
         "conversation_history": [],
         "current_user_input": "Hola agente",
         # ... otros campos del estado inicializados a None o [] según AgentState
-        "marketplace_products": None, "instagram_saves": None, "pinterest_boards": None,
+        "catalog_version": None, "instagram_saves": None, "pinterest_boards": None,
         "abandoned_carts": None, "identified_user_wishlist": [], "user_profile": {},
         "enriched_wishlist": [], "shopping_plan": {}, "search_criteria": None,
         "search_results": [], "ia_categorized_wishlist": [], "wishlist_agent_error": None,
@@ -1,10 +1,25 @@
-from typing import Dict, Any, List, Tuple, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Tuple, Optional, Union
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from src.utils.config import get_llm
+from src.utils.config import get_llm, speculative_search_workers
+from src.utils.llm_scheduler import CircuitOpenError, PRIORITY_INTERACTIVE, get_llm_scheduler, invoke_llm_chain
+from src.utils.text_normalization import normalize_text
+from src.utils.vector_index import SPANISH_STOPWORDS, tokenize
 
 # --- Modelos Pydantic para la Salida Estructurada del LLM ---
 
+class SearchRequest(BaseModel):
+    """Un producto pedido en el mensaje, con sus filtros de precio si el usuario los dio."""
+    query: str = Field(description="Término de búsqueda del producto (ej: 'cafetera').")
+    max_price: Optional[float] = Field(default=None, description="Precio máximo si el usuario lo indicó (ej: 'de menos de 300' -> 300).")
+    min_price: Optional[float] = Field(default=None, description="Precio mínimo si el usuario lo indicó.")
+
+    def tool_input(self) -> Dict[str, Any]:
+        """Entrada para `catalog_search_tool` (solo con los filtros presentes)."""
+        return self.model_dump(exclude_none=True)
+
 class IntentDetectionOutput(BaseModel):
     """
     Define la estructura esperada de la salida del LLM para la detección de intenciones.
@@ -17,9 +32,18 @@ class IntentDetectionOutput(BaseModel):
         default=None,
         description="Si la intención es 'buscar_producto', el término de búsqueda o producto que el usuario mencionó. Sino, null."
     )
+    search_requests: Optional[List[SearchRequest]] = Field(
+        default=None,
+        description="Si la intención es 'buscar_producto', una entrada por cada producto distinto pedido (con sus límites de precio). Sino, null."
+    )
     # Se podrían añadir más campos extraídos si fuera necesario para otras intenciones,
     # por ejemplo, un presupuesto si la intención fuera 'crear_plan_con_presupuesto'.
 
+class ToolCall(BaseModel):
+    """Una llamada a herramienta dentro de una decisión con varias búsquedas."""
+    tool_to_call: str = Field(description="Nombre de la herramienta. Ej: 'catalog_search_tool'.")
+    tool_input: Dict[str, Any] = Field(default_factory=dict, description="Entrada de la herramienta.")
+
 class MasterAgentDecision(BaseModel):
     """
     Representa la decisión tomada por el `run_conversational_master_agent`.
@@ -40,13 +64,147 @@ class MasterAgentDecision(BaseModel):
         default=None,
         description="El diccionario de entrada para la herramienta a llamar."
     )
+    tool_calls: Optional[List[ToolCall]] = Field(
+        default=None,
+        description="Varias llamadas a herramientas para ejecutar a la vez (ej: una búsqueda por cada producto pedido). Si se usa, reemplaza a `tool_to_call`/`tool_input`."
+    )
+
+# --- Búsqueda especulativa ---
+
+# Palabras de un mensaje que no forman parte de lo que se busca ("quiero ver unos auriculares").
+SPECULATION_FILLER_WORDS = frozenset({
+    "busca", "buscar", "buscame", "encuentra", "encuentrame", "muestra", "muestrame", "ver",
+    "quiero", "quisiera", "necesito", "comprar", "me", "gustaria", "tienes", "tienen", "hay",
+    "algo", "algun", "alguna", "algunos", "algunas", "unos", "unas", "hola", "gracias", "favor",
+    "porfa", "porfavor", "adios", "chao", "buenas", "buenos", "dias", "tardes", "noches",
+})
+
+# Pool compartido por todas las sesiones (ej: las del servidor de chat). Una especulación que
+# esperara en la cola terminaría después que la detección de intención y no ahorraría nada, así
+# que solo se lanza si hay un hilo libre (un cupo del semáforo por hilo).
+_SPECULATION_WORKERS = speculative_search_workers()
+_speculation_executor = ThreadPoolExecutor(max_workers=_SPECULATION_WORKERS, thread_name_prefix="speculative-search")
+_speculation_slots = threading.BoundedSemaphore(_SPECULATION_WORKERS)
+
+
+def _start_speculation(speculative_search: Callable[[Dict[str, Any]], Any], candidate_query: str) -> Optional[Future]:
+    """Lanza la búsqueda especulativa si hay un hilo libre; si no, la omite y retorna None."""
+    if not _speculation_slots.acquire(blocking=False):
+        print(f"--- MasterAgent: Búsqueda especulativa de '{candidate_query}' omitida (hilos ocupados) ---")
+        return None
+    try:
+        future = _speculation_executor.submit(speculative_search, {"query": candidate_query})
+    except BaseException:
+        _speculation_slots.release()
+        raise
+    future.add_done_callback(lambda _: _speculation_slots.release()) # También al cancelarla
+    return future
+
+
+def candidate_search_query(user_input: str) -> Optional[str]:
+    """
+    Frase candidata a búsqueda en un mensaje: el texto normalizado sin stopwords ni palabras de
+    relleno o de cortesía. Retorna None si no queda nada (ej: "hola, gracias").
+    """
+    words = [w for w in normalize_text(user_input).split()
+             if w not in SPANISH_STOPWORDS and w not in SPECULATION_FILLER_WORDS]
+    return " ".join(words) if words else None
+
+
+def _prefetched_page(speculation: Optional[Tuple[str, Future]], extracted_query: str) -> Optional[Dict[str, Any]]:
+    """
+    Página de la búsqueda especulativa si buscó lo mismo que `extracted_query` (mismos
+    términos normalizados) y terminó sin error; si no, se descarta y retorna None.
+    """
+    if speculation is None:
+        return None
+    candidate, future = speculation
+    if set(tokenize(candidate)) != set(tokenize(extracted_query)):
+        future.cancel()
+        print(f"--- MasterAgent: Búsqueda especulativa '{candidate}' descartada (la query es '{extracted_query}') ---")
+        return None
+    try:
+        page = future.result()
+    except Exception as e:
+        print(f"ADVERTENCIA: La búsqueda especulativa falló ({e}); se buscará de nuevo.")
+        return None
+    return page if isinstance(page, dict) else None
+
+
+def describe_search(tool_input: Dict[str, Any]) -> str:
+    """Etiqueta legible de una búsqueda (ej: "cafetera (hasta 300)"); es la clave de sus resultados."""
+    label = tool_input.get("query") or "catálogo"
+    limits = []
+    if tool_input.get("min_price") is not None:
+        limits.append(f"desde {tool_input['min_price']:g}")
+    if tool_input.get("max_price") is not None:
+        limits.append(f"hasta {tool_input['max_price']:g}")
+    return f"{label} ({', '.join(limits)})" if limits else label
+
+
+def _search_results_response(catalog_search_results: Union[Dict[str, Any], List[Dict[str, Any]]]) -> str:
+    """
+    Formatea para el usuario una página (o lista) de resultados de `catalog_search_tool`, o
+    varias páginas agrupadas por búsqueda (`{"by_query": {etiqueta: página}}`) en una sola respuesta.
+    """
+    if isinstance(catalog_search_results, dict) and "by_query" in catalog_search_results:
+        sections = [f"Para '{label}': {_search_results_response(page)}"
+                    for label, page in catalog_search_results["by_query"].items()]
+        return "\n\n".join(sections) if sections else "No encontré productos que coincidan con tu búsqueda en el catálogo."
+    # La búsqueda puede entregar una página ({"results", "total_count", ...}) o una lista simple.
+    total_count = None
+    bought_together = []
+    corrections = []
+    if isinstance(catalog_search_results, dict):
+        total_count = catalog_search_results.get("total_count")
+        bought_together = catalog_search_results.get("frequently_bought_together") or []
+        corrections = catalog_search_results.get("corrections") or []
+        catalog_search_results = catalog_search_results.get("results", [])
+    if total_count is None:
+        total_count = len(catalog_search_results)
+
+    if not catalog_search_results:  # Lista vacía indica que no se encontraron productos
+        response_text = "No encontré productos que coincidan con tu búsqueda en el catálogo."
+    # Comprobar si el primer item de resultados es un diccionario de error
+    elif isinstance(catalog_search_results, list) and \
+         len(catalog_search_results) > 0 and \
+         isinstance(catalog_search_results[0], dict) and \
+         "error" in catalog_search_results[0]: # Asumiendo que la herramienta devuelve [{"error": "mensaje"}]
+        response_text = f"Hubo un error al buscar en el catálogo: {catalog_search_results[0]['error']}"
+    else:
+        # Formatear una respuesta con los productos encontrados
+        response_text = f"Encontré {total_count} producto(s) para ti:\n"
+        for i, prod in enumerate(catalog_search_results[:3]):  # Mostrar hasta 3 productos (los más relevantes)
+            response_text += f"{i+1}. {prod.get('name', 'Nombre no disponible')} " \
+                             f"(Precio: {prod.get('price', 'N/A')} {prod.get('currency', '')})\n"
+        if total_count > 3:
+            response_text += f"...y {total_count - 3} más."
+        if bought_together:
+            names = ", ".join(p.get('name', '') for p in bought_together)
+            response_text += f"\nSuele comprarse junto con: {names}."
+    if corrections:
+        replaced = ", ".join(f"'{c['corrected']}' en lugar de '{c['original']}'" for c in corrections)
+        response_text = f"(Busqué {replaced}.)\n{response_text}"
+    return response_text
 
 # --- Lógica Principal del Master Agent ---
 
+def _rule_based_decision(user_input: str) -> MasterAgentDecision:
+    """Lógica de fallback simple para cuando el LLM no está configurado o no está disponible."""
+    if user_input.lower().strip() in ["adiós", "salir", "exit", "quit", "bye", "chao"]:
+        return MasterAgentDecision(next_action="end_conversation", response_text="¡Hasta luego! Que tengas un buen día.")
+    # Respuesta genérica si el LLM no funciona
+    return MasterAgentDecision(
+        next_action="respond_to_user",
+        response_text=f"Mis circuitos de IA están un poco revueltos ahora mismo (o no están configurados). Entendí que dijiste: '{user_input}'. Prueba con algo simple como 'busca [producto]'."
+    )
+
 def run_conversational_master_agent(
     user_input: str,
     conversation_history: List[Tuple[str, str]],
-    catalog_search_results: Optional[List[Dict[str, Any]]] = None
+    catalog_search_results: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+    conversation_summary: Optional[str] = None,
+    speculative_search: Optional[Callable[[Dict[str, Any]], Any]] = None
 ) -> MasterAgentDecision:
     """
     Procesa la entrada del usuario, el historial de conversación y los resultados de herramientas
@@ -67,7 +225,15 @@ def run_conversational_master_agent(
                               de la conversación. El hablante puede ser "user" o "ai".
         catalog_search_results: Resultados opcionales de la herramienta de búsqueda en catálogo,
                                  provenientes de una ejecución anterior en el grafo. Puede ser
-                                 una lista de productos o un diccionario de error.
+                                 una página (`{"results", "total_count", ...}`), una lista de
+                                 productos o una lista con un diccionario de error.
+        conversation_summary: Resumen opcional de los turnos que ya no están en el historial
+                              acotado. Se antepone al historial en el prompt de intención.
+        speculative_search: Ejecutor opcional de `catalog_search_tool` (recibe el `tool_input`).
+                            Si se pasa, mientras el LLM detecta la intención se lanza en paralelo
+                            una búsqueda con la frase candidata del mensaje; si la intención es
+                            `buscar_producto` con la misma query, se responde directamente con esa
+                            página (sin el paso extra por la herramienta). Si no, se descarta.
 
     Returns:
         Un objeto `MasterAgentDecision` que contiene la acción a seguir, el texto de respuesta
@@ -83,22 +249,7 @@ def run_conversational_master_agent(
     # --- Fase 1: Procesar resultados de herramientas pendientes (si los hay) ---
     if catalog_search_results is not None:
         print("--- MasterAgent: Procesando resultados de catalog_search_tool ---")
-        if not catalog_search_results:  # Lista vacía indica que no se encontraron productos
-            response_text = "No encontré productos que coincidan con tu búsqueda en el catálogo."
-        # Comprobar si el primer item de resultados es un diccionario de error
-        elif isinstance(catalog_search_results, list) and \
-             len(catalog_search_results) > 0 and \
-             isinstance(catalog_search_results[0], dict) and \
-             "error" in catalog_search_results[0]: # Asumiendo que la herramienta devuelve [{"error": "mensaje"}]
-            response_text = f"Hubo un error al buscar en el catálogo: {catalog_search_results[0]['error']}"
-        else:
-            # Formatear una respuesta con los productos encontrados
-            response_text = f"Encontré {len(catalog_search_results)} producto(s) para ti:\n"
-            for i, prod in enumerate(catalog_search_results[:3]):  # Mostrar hasta 3 productos para brevedad
-                response_text += f"{i+1}. {prod.get('name', 'Nombre no disponible')} " \
-                                 f"(Precio: {prod.get('price', 'N/A')} {prod.get('currency', '')})\n"
-            if len(catalog_search_results) > 3:
-                response_text += f"...y {len(catalog_search_results) - 3} más."
+        response_text = _search_results_response(catalog_search_results)
 
         # Después de procesar el resultado de la herramienta, la acción es responder al usuario.
         # El grafo luego esperará una nueva entrada del usuario.
@@ -131,11 +282,16 @@ def run_conversational_master_agent(
             return MasterAgentDecision(
                 next_action="call_tool",
                 tool_to_call="catalog_search_tool",
-                tool_input={"query": query}, # marketplace_products se inyectará desde el estado del grafo
+                tool_input={"query": query}, # La búsqueda usa el catálogo compartido (CatalogStore)
                 response_text=f"Ok, voy a buscar '{query}' en el catálogo..."
             )
     # FIN DEBUG
 
+    # Si el proveedor LLM está fallando (circuito abierto), ni siquiera se intenta la llamada.
+    if get_llm_scheduler().circuit_open:
+        print("ADVERTENCIA: Circuito LLM abierto. Usando lógica de fallback simple.")
+        return _rule_based_decision(user_input)
+
     # Intentar inicializar el LLM para la detección de intención.
     # Se usa una temperatura baja para que la clasificación de intención sea más determinista.
     try:
@@ -143,13 +299,7 @@ def run_conversational_master_agent(
     except ValueError as e:
         # Fallback a lógica simple si el LLM no está disponible (ej: API key no configurada)
         print(f"ADVERTENCIA: Error al inicializar LLM en MasterAgent: {e}. Usando lógica de fallback simple.")
-        if user_input.lower().strip() in ["adiós", "salir", "exit", "quit", "bye", "chao"]:
-            return MasterAgentDecision(next_action="end_conversation", response_text="¡Hasta luego! Que tengas un buen día.")
-        # Respuesta genérica si el LLM no funciona
-        return MasterAgentDecision(
-            next_action="respond_to_user",
-            response_text=f"Mis circuitos de IA están un poco revueltos ahora mismo (o no están configurados). Entendí que dijiste: '{user_input}'. Prueba con algo simple como 'busca [producto]'."
-        )
+        return _rule_based_decision(user_input)
 
     # Formatear el historial de conversación para el prompt del LLM
     # Considerar los últimos N turnos para dar contexto al LLM.
@@ -158,6 +308,8 @@ def run_conversational_master_agent(
     # Tomamos los últimos N*2 items porque cada turno tiene entrada de usuario y respuesta de IA.
     recent_history_tuples = conversation_history[-(N_history_turns*2):]
     formatted_history_str = "\n".join([f"{speaker.capitalize()}: {text}" for speaker, text in recent_history_tuples])
+    if conversation_summary:
+        formatted_history_str = f"(Antes, el usuario dijo: {conversation_summary})\n{formatted_history_str}"
 
     # Crear la cadena (chain) de Langchain para la detección de intención.
     # Se usa `with_structured_output` para obtener un objeto Pydantic `IntentDetectionOutput` directamente.
@@ -169,15 +321,25 @@ def run_conversational_master_agent(
     next_action_str = "respond_to_user"  # Acción por defecto si nada más se decide
     tool_to_call_str = None
     tool_input_dict = None
+    tool_calls_list = None
+
+    # Búsqueda especulativa: corre en paralelo con la detección de intención.
+    speculation = None
+    candidate_query = candidate_search_query(user_input) if speculative_search is not None else None
+    future = _start_speculation(speculative_search, candidate_query) if candidate_query else None
+    if future is not None:
+        print(f"--- MasterAgent: Búsqueda especulativa de '{candidate_query}' ---")
+        speculation = (candidate_query, future)
 
     try:
         print("--- MasterAgent: Detectando intención con LLM ---")
-        # Invocar la cadena de detección de intención
-        intent_result: IntentDetectionOutput = intent_chain.invoke({
+        # Invocar la cadena de detección de intención (carril interactivo del planificador:
+        # se adelanta a las llamadas en lote como el análisis de wishlist).
+        intent_result: IntentDetectionOutput = invoke_llm_chain(intent_chain, {
             "user_input": user_input,
             "formatted_history": formatted_history_str,
             "N_history_turns": N_history_turns
-        })
+        }, priority=PRIORITY_INTERACTIVE, stage="intent_detection")
         print(f"Intención detectada por LLM: '{intent_result.intent}', Query extraída: '{intent_result.extracted_query}'")
 
         detected_intent = intent_result.intent
@@ -191,13 +353,32 @@ def run_conversational_master_agent(
             if not conversation_history: # Si es el primer saludo real
                  response_text = "¡Hola! Soy tu asistente de compras. ¿Buscas algo en especial?"
         elif detected_intent == "buscar_producto":
-            if intent_result.extracted_query:
-                response_text = f"Entendido. Voy a buscar '{intent_result.extracted_query}' en nuestro catálogo..."
+            search_inputs = [r.tool_input() for r in intent_result.search_requests or [] if r.query.strip()]
+            if not search_inputs and intent_result.extracted_query:
+                search_inputs = [{"query": intent_result.extracted_query}]
+            # La especulación solo buscó texto: sirve para una única búsqueda sin filtros.
+            prefetched = None
+            if len(search_inputs) == 1 and set(search_inputs[0]) == {"query"}:
+                prefetched = _prefetched_page(speculation, search_inputs[0]["query"])
+            elif speculation is not None:
+                speculation[1].cancel()
+            speculation = None # Ya usada o descartada
+            if prefetched is not None:
+                print("--- MasterAgent: Respondiendo con la búsqueda especulativa ---")
+                response_text = _search_results_response(prefetched)
+            elif len(search_inputs) > 1:
+                # Varios productos en un mensaje: todas las búsquedas en una sola ida a la herramienta.
+                labels = ", ".join(f"'{describe_search(i)}'" for i in search_inputs)
+                response_text = f"Entendido. Voy a buscar {labels} en nuestro catálogo..."
+                next_action_str = "call_tool"
+                tool_calls_list = [ToolCall(tool_to_call="catalog_search_tool", tool_input=i) for i in search_inputs]
+            elif search_inputs:
+                response_text = f"Entendido. Voy a buscar '{describe_search(search_inputs[0])}' en nuestro catálogo..."
                 next_action_str = "call_tool" # Indica al grafo que debe llamar una herramienta
                 tool_to_call_str = "catalog_search_tool" # Nombre de la herramienta a invocar
-                # El input para la herramienta. 'marketplace_products' se inyectará
-                # desde el estado del grafo por el nodo que ejecuta la herramienta.
-                tool_input_dict = {"query": intent_result.extracted_query}
+                # El input para la herramienta. El catálogo no se pasa: el nodo que
+                # ejecuta la herramienta busca en el CatalogStore compartido.
+                tool_input_dict = search_inputs[0]
             else:
                 # El LLM indicó buscar producto pero no pudo extraer la query
                 response_text = "Parece que quieres buscar un producto, pero no entendí bien qué producto. ¿Podrías ser más específico, por favor?"
@@ -209,16 +390,23 @@ def run_conversational_master_agent(
         else:  # Caso "desconocido" o intenciones no manejadas explícitamente
             response_text = f"No estoy completamente seguro de cómo ayudarte con eso ('{user_input}'). ¿Podrías intentar reformular tu solicitud? Por ejemplo, puedes pedirme que 'busque [nombre del producto]'."
 
+    except CircuitOpenError as e_circuit:
+        print(f"ADVERTENCIA: {e_circuit} Usando lógica de fallback simple.")
+        return _rule_based_decision(user_input)
     except Exception as e_intent:
         print(f"Error durante la detección de intención con LLM o en la lógica posterior: {e_intent}")
         # Fallback si el LLM falla después de ser inicializado o hay otro error en esta fase.
         response_text = f"Tuve algunos problemas para procesar tu solicitud ('{user_input}') con mi inteligencia artificial. ¿Podrías intentarlo de otra manera o ser un poco más específico?"
+    finally:
+        if speculation is not None: # La intención no era una búsqueda: se descarta
+            speculation[1].cancel()
 
     return MasterAgentDecision(
         next_action=next_action_str,
         response_text=response_text,
         tool_to_call=tool_to_call_str,
-        tool_input=tool_input_dict
+        tool_input=tool_input_dict,
+        tool_calls=tool_calls_list
     )
 
 # --- Plantilla de Prompt para Detección de Intención ---
@@ -257,11 +445,13 @@ Responde ÚNICAMENTE con un objeto JSON que se ajuste al esquema de `IntentDetec
 El objeto JSON debe tener EXACTAMENTE las siguientes claves:
 -   `intent`: (str) Una de las intenciones listadas arriba (ej: "buscar_producto").
 -   `extracted_query`: (Optional[str]) Si la intención es "buscar_producto", este DEBE ser el término de búsqueda o producto que el usuario mencionó (ej: "laptop gamer", "camisetas rojas"). Si la intención NO es "buscar_producto", este campo DEBE ser `null`.
+-   `search_requests`: (Optional[List]) Si la intención es "buscar_producto", una entrada `{{"query", "max_price", "min_price"}}` por CADA producto distinto que el usuario pidió (los precios solo si los indicó; si no, `null`). Si el usuario pide varios productos en un mensaje, NO los juntes en una sola query. Si la intención NO es "buscar_producto", este campo DEBE ser `null`.
 
 Ejemplos de Salida JSON esperada:
 Usuario: "Hola" -> {{"intent": "saludo", "extracted_query": null}}
-Usuario: "Quiero unos audifonos rojos" -> {{"intent": "buscar_producto", "extracted_query": "audifonos rojos"}}
-Usuario: "busco una cafetera espresso" -> {{"intent": "buscar_producto", "extracted_query": "cafetera espresso"}}
+Usuario: "Quiero unos audifonos rojos" -> {{"intent": "buscar_producto", "extracted_query": "audifonos rojos", "search_requests": [{{"query": "audifonos rojos", "max_price": null, "min_price": null}}]}}
+Usuario: "busco una cafetera espresso" -> {{"intent": "buscar_producto", "extracted_query": "cafetera espresso", "search_requests": [{{"query": "cafetera espresso", "max_price": null, "min_price": null}}]}}
+Usuario: "Busca auriculares y una cafetera de menos de 300" -> {{"intent": "buscar_producto", "extracted_query": "auriculares", "search_requests": [{{"query": "auriculares", "max_price": null, "min_price": null}}, {{"query": "cafetera", "max_price": 300, "min_price": null}}]}}
 Usuario: "adiós" -> {{"intent": "despedida", "extracted_query": null}}
 Usuario: "Qué puedes hacer?" -> {{"intent": "pregunta_general", "extracted_query": null}}
 Usuario: "Gracias, eso es todo" -> {{"intent": "despedida", "extracted_query": null}}
@@ -1,3 +1,6 @@
+import json
+from typing import Any, Dict
+
 from pydantic import BaseModel, Field # <--- CAMBIO AQUÍ
 
 class PurchaseAdvice(BaseModel):
@@ -32,3 +35,17 @@ Ejemplo de JSON de respuesta:
 }}
 ```
 """
+
+# --- Modo compacto (ver `compact_prompts_enabled`) ---
+# El LLM devuelve solo el consejo; el nombre del item ya se conoce y no se le pide repetirlo.
+
+class AdviceText(BaseModel):
+    advice: str = Field(description="Consejo breve (1-2 frases) de por qué comprar el producto.")
+
+COMPACT_SHOPPING_ADVICE_PROMPT_TEMPLATE = """Eres un asistente de compras amigable y persuasivo. En 1-2 frases, di al usuario por qué este producto es una buena compra para él/ella. Si viene de un carrito abandonado, recuerda sutilmente que ya lo eligió; si viene de instagram o pinterest, cómo encaja en su inspiración.
+Producto: {product}"""
+
+def compact_advice_payload(item_payload: Dict[str, Any]) -> Dict[str, str]:
+    """Payload del prompt compacto: los campos con valor, en JSON minificado."""
+    fields = {k: v for k, v in item_payload.items() if v not in (None, "", "N/A")}
+    return {"product": json.dumps(fields, ensure_ascii=False, separators=(",", ":"))}
@@ -1,6 +1,248 @@
-from typing import List, Dict, Any, Optional
+import heapq
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 from langchain_core.tools import tool
 
+from src.utils.bm25_index import Bm25Index
+from src.utils.catalog_store import get_catalog_store, index_for
+from src.utils.config import search_max_edit_distance
+from src.utils.result_projection import FacetAccumulator
+from src.utils.search_cache import SearchResultCache
+from src.utils.spelling_index import SymSpellIndex
+from src.utils.text_normalization import NormalizedColumnsIndex, normalize_text
+from src.utils.vector_index import TfidfVectorIndex, tokenize
+
+# Cuánto pesa el rating en la relevancia: un producto de 5 estrellas multiplica su
+# puntuación textual por (1 + RATING_BOOST).
+RATING_BOOST = 0.5
+
+# Tamaño de página por defecto cuando el grafo ejecuta la búsqueda para el MasterAgent.
+DEFAULT_PAGE_SIZE = 10
+
+
+def _rating(product: Dict[str, Any]) -> float:
+    return product.get('ratings', {}).get('average_rating') or 0.0
+
+
+def _substring_matches(products: List[Dict[str, Any]], query: str) -> Iterable[Tuple[Dict[str, Any], float]]:
+    """
+    Productos cuyo nombre, descripción o etiquetas contienen `query` como texto (sin distinguir
+    mayúsculas ni tildes), puntuados por rating. Es la búsqueda para las queries sin términos
+    indexables (solo stopwords, ej: "de"); una query vacía tras normalizar deja solo los filtros.
+    """
+    needle = normalize_text(query)
+    for product in products:
+        texts = [product.get('name'), product.get('description'), *(product.get('tags') or [])]
+        if any(needle in normalize_text(str(text or "")) for text in texts):
+            yield product, _rating(product)
+
+
+def _passes_filters(
+    product: Dict[str, Any],
+    category: Optional[str],
+    brand: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    min_rating: Optional[float],
+    in_stock: Optional[bool],
+    columns: Optional[Dict[str, str]] = None
+) -> bool:
+    """
+    Aplica los filtros estructurados (todo menos la query de texto) a un producto.
+    `category` y `brand` llegan ya normalizados (`normalize_text`) y se comparan con las
+    columnas normalizadas del producto (`columns`), de modo que "electronica" coincide con
+    "Electrónica" sin normalizar el catálogo en cada comparación.
+    """
+    # Filtro por categoría
+    if category and columns['category'] != category:
+        return False
+    # Filtro por marca
+    if brand and columns['brand'] != brand:
+        return False
+    # Filtro por precio mínimo. float('-inf') como default si el precio no existe.
+    if min_price is not None and product.get('price', float('-inf')) < min_price:
+        return False
+    # Filtro por precio máximo. float('inf') como default si el precio no existe.
+    if max_price is not None and product.get('price', float('inf')) > max_price:
+        return False
+    # Filtro por rating mínimo
+    if min_rating is not None and product.get('ratings', {}).get('average_rating', float('-inf')) < min_rating:
+        return False
+    # Filtro por disponibilidad: un producto está en stock si su cantidad es mayor a 0.
+    if in_stock is not None and (product.get('stock', 0) > 0) != in_stock:
+        return False
+    return True
+
+
+def correct_query_spelling(marketplace_products: List[Dict[str, Any]], query: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Corrige las palabras de `query` que no aparecen en el catálogo con el índice SymSpell
+    (hasta `search_max_edit_distance()` ediciones). Una palabra que el índice BM25 conoce
+    (ej: de la descripción), o que es el prefijo de una, nunca se corrige. Retorna `(consulta, correcciones)`.
+    """
+    max_distance = search_max_edit_distance()
+    if not query or max_distance <= 0 or not marketplace_products:
+        return query, []
+    spelling_index = index_for(marketplace_products, "spelling", lambda: SymSpellIndex(max_edit_distance=max_distance))
+    bm25_index = index_for(marketplace_products, "bm25", Bm25Index)
+    # Las palabras a medio escribir ("cafet") ya encuentran resultados por prefijo: no se corrigen.
+    corrected, corrections = spelling_index.correct_query(
+        query, is_known=lambda term: bm25_index.has_term(term) or bool(bm25_index.terms_with_prefix(term)))
+    if corrections:
+        print(f"Búsqueda corregida: '{query}' -> '{corrected}'")
+    return corrected, corrections
+
+
+def search_catalog(
+    marketplace_products: Optional[List[Dict[str, Any]]] = None,
+    query: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    ranked: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    correct_spelling: bool = True
+) -> Dict[str, Any]:
+    """
+    Busca en el catálogo y retorna una página de resultados ordenados por relevancia.
+
+    Con `correct_spelling`, las palabras de `query` que no existen en el catálogo se corrigen
+    antes de consultar los índices (ver `correct_query_spelling`).
+
+    - Con `query`, los candidatos salen del índice BM25 (todos los términos deben aparecer en
+      el nombre, etiquetas o descripción; uno que no existe vale como prefijo, ej: "smart")
+      y se ordenan por BM25 potenciado por el rating. Una query sin términos indexables (solo
+      stopwords, ej: "de") se busca como texto en nombre, descripción y etiquetas.
+      Con `ranked=True` se usa en cambio la similitud TF-IDF.
+    - Sin `query`, los productos que pasan los filtros se ordenan por rating.
+
+    Solo se conservan los `offset + limit` mejores resultados en un heap acotado, de modo que
+    la memoria no crece con el número de coincidencias. Si `marketplace_products` es None se
+    busca en el catálogo compartido (`CatalogStore`).
+
+    Returns:
+        Un diccionario con `results` (la página de productos), `total_count` (número total de
+        coincidencias), `offset`, `limit`, `corrections` (palabras corregidas de la query) y
+        `facets` (rango de precios y productos por marca de *todas* las coincidencias, no solo
+        de la página; se acumulan en la misma pasada que las filtra).
+    """
+    if marketplace_products is None:
+        marketplace_products = get_catalog_store().products
+    facets = FacetAccumulator()
+    page = {"results": [], "total_count": 0, "offset": offset, "limit": limit, "corrections": [],
+            "facets": facets.as_dict()}
+    if not marketplace_products:
+        return page
+    if query and correct_spelling:
+        query, page["corrections"] = correct_query_spelling(marketplace_products, query)
+
+    scored: Iterable[Tuple[Dict[str, Any], float]]
+    if query and not tokenize(query):
+        scored = _substring_matches(marketplace_products, query)
+    elif query and ranked:
+        vector_index = index_for(marketplace_products, "tfidf", TfidfVectorIndex)
+        scored = vector_index.iter_matches(query)
+    elif query:
+        bm25_index = index_for(marketplace_products, "bm25", Bm25Index)
+        scored = ((product, score * (1.0 + RATING_BOOST * _rating(product) / 5.0))
+                  for product, score in bm25_index.iter_matches(query))
+    else:
+        scored = ((product, _rating(product)) for product in marketplace_products)
+
+    category, brand = normalize_text(category), normalize_text(brand)
+    columns_index = index_for(marketplace_products, "normalized_columns", NormalizedColumnsIndex) if category or brand else None
+
+    total_count = 0
+    heap: List[Tuple[float, int, Dict[str, Any]]] = []
+    keep = None if limit is None else max(offset + limit, 0)
+    for position, (product, score) in enumerate(scored):
+        columns = columns_index.get(product) if columns_index is not None else None
+        if not _passes_filters(product, category, brand, min_price, max_price, min_rating, in_stock, columns):
+            continue
+        total_count += 1
+        facets.add(product)
+        # La posición desempata a favor del orden original (más estable entre llamadas).
+        entry = (score, -position, product)
+        if keep is None:
+            heap.append(entry)
+        elif keep > 0:
+            if len(heap) < keep:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    ranked_entries = sorted(heap, key=lambda e: e[:2], reverse=True)
+    end = None if limit is None else offset + limit
+    page["results"] = [product for _, _, product in ranked_entries[offset:end]]
+    page["total_count"] = total_count
+    page["facets"] = facets.as_dict()
+    return page
+
+
+# Caché de resultados compartido por el proceso (ver `search_catalog_cached`).
+search_result_cache = SearchResultCache(max_entries=256)
+
+
+def search_catalog_cached(
+    marketplace_products: Optional[List[Dict[str, Any]]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    **criteria: Any
+) -> Dict[str, Any]:
+    """
+    Igual que `search_catalog`, pero reutilizando resultados de búsquedas anteriores.
+
+    Solo se cachean búsquedas sobre el catálogo compartido (`CatalogStore`, el default si
+    `marketplace_products` es None), cuya versión
+    forma parte de la clave: una recarga o un delta invalida las entradas previas. Las
+    entradas guardan los IDs de la ventana `[0, offset + limit)` y se rehidratan desde el
+    mapa de IDs del catálogo, por lo que pedir una página anterior también es un acierto.
+
+    La corrección ortográfica se aplica antes de armar la clave, así que "auriculres" y
+    "auriculares" comparten entrada.
+
+    Returns:
+        La misma página que `search_catalog`, con la clave adicional `cached` (bool).
+    """
+    catalog = get_catalog_store()
+    if marketplace_products is None:
+        marketplace_products = catalog.products
+    if marketplace_products is not catalog.products:
+        page = search_catalog(marketplace_products, limit=limit, offset=offset, **criteria)
+        page["cached"] = False
+        return page
+
+    corrections: List[Dict[str, Any]] = []
+    if criteria.pop("correct_spelling", True) and criteria.get("query"):
+        criteria["query"], corrections = correct_query_spelling(marketplace_products, criteria["query"])
+
+    key = SearchResultCache.make_key(criteria, catalog.version)
+    window = None if limit is None else offset + limit
+    end = window
+    cached = search_result_cache.get(key, needed=window)
+    if cached is not None:
+        ids, total_count, facets = cached
+        results = [p for p in (catalog.get(pid) for pid in ids[offset:end]) if p is not None]
+        return {"results": results, "total_count": total_count, "offset": offset, "limit": limit,
+                "corrections": corrections, "facets": facets, "cached": True}
+
+    window_page = search_catalog(marketplace_products, limit=window, offset=0, correct_spelling=False, **criteria)
+    search_result_cache.put(key, [p['id'] for p in window_page["results"]], window_page["total_count"],
+                            window_page["facets"])
+    return {
+        "results": window_page["results"][offset:end],
+        "total_count": window_page["total_count"],
+        "offset": offset,
+        "limit": limit,
+        "corrections": corrections,
+        "facets": window_page["facets"],
+        "cached": False,
+    }
+
+
 # El decorador `@tool` de Langchain convierte esta función en una herramienta
 # que puede ser utilizada por agentes de Langchain.
 # La documentación (docstring) de la función es importante, ya que Langchain
@@ -8,94 +250,81 @@ from langchain_core.tools import tool
 
 @tool
 def catalog_search_tool(
-    marketplace_products: List[Dict[str, Any]],
+    marketplace_products: Optional[List[Dict[str, Any]]] = None,
     query: Optional[str] = None,
     category: Optional[str] = None,
     brand: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     min_rating: Optional[float] = None,
-    in_stock: Optional[bool] = None
+    in_stock: Optional[bool] = None,
+    ranked: bool = False,
+    limit: Optional[int] = DEFAULT_PAGE_SIZE,
+    offset: int = 0
 ) -> List[Dict[str, Any]]:
     """
     Busca productos en la lista de productos del marketplace (`marketplace_products`)
-    según varios criterios de filtrado.
+    según varios criterios de filtrado, ordenados por relevancia.
 
     Args:
         marketplace_products: Una lista de diccionarios, donde cada diccionario representa un producto.
-                              Se espera que este argumento sea proporcionado por el sistema del agente,
-                              generalmente cargado desde el estado del agente.
-        query: Texto a buscar en el nombre, descripción o etiquetas del producto (case-insensitive).
-        category: Categoría específica del producto a filtrar (case-insensitive).
-        brand: Marca específica del producto a filtrar (case-insensitive).
+                              Si se omite (None), se busca en el catálogo compartido del proceso
+                              (`CatalogStore`), que es lo habitual dentro del agente.
+        query: Texto a buscar en el nombre, descripción o etiquetas del producto (sin distinguir
+               mayúsculas, tildes ni singular/plural). Todos los términos de la query deben
+               aparecer en el producto; una palabra incompleta vale como prefijo ("smart" ->
+               "smartphone") y las que no existen en el catálogo se corrigen
+               ortográficamente (ej: "auriculres" -> "auriculares").
+        category: Categoría específica del producto a filtrar (sin distinguir mayúsculas ni tildes).
+        brand: Marca específica del producto a filtrar (sin distinguir mayúsculas ni tildes).
         min_price: Precio mínimo del producto.
         max_price: Precio máximo del producto.
         min_rating: Rating promedio mínimo del producto.
         in_stock: Filtrar por disponibilidad (True para en stock, False para fuera de stock).
+        ranked: Si es True y hay `query`, los productos se seleccionan y ordenan por similitud
+                TF-IDF (nombre, descripción, etiquetas y marca) en lugar de BM25.
+        limit: Número máximo de productos a retornar (por defecto `DEFAULT_PAGE_SIZE`; None
+               para todos, sin acotar la memoria).
+        offset: Número de productos a saltar desde el inicio del ranking (paginación).
 
     Returns:
-        Una lista de diccionarios de productos que coinciden con todos los criterios proporcionados.
+        Una lista de diccionarios de productos que coinciden con todos los criterios proporcionados,
+        ordenada por relevancia (BM25 potenciado por rating con `query`; rating sin ella).
         Retorna una lista vacía si no se encuentran productos o si `marketplace_products` está vacío.
-        En caso de error interno (poco probable con esta lógica), podría retornar una lista vacía.
+        Para obtener también el total de coincidencias, usar `catalog_search_page_tool`.
     """
-    if not marketplace_products:
-        # Si no hay productos en el catálogo, no hay nada que buscar.
-        return []
-
-    results = []
-    for product in marketplace_products:
-        # Asumimos que el producto coincide hasta que un criterio falle
-        match = True
-
-        # Filtro por query (búsqueda de texto en nombre, descripción o etiquetas)
-        if query:
-            query_lower = query.lower()
-            # El producto debe contener la query en alguno de sus campos de texto relevantes.
-            if not (query_lower in product.get('name', '').lower() or \
-                    query_lower in product.get('description', '').lower() or \
-                    any(query_lower in tag.lower() for tag in product.get('tags', []))):
-                match = False
-
-        # Filtro por categoría
-        if category and match:
-            if product.get('category', '').lower() != category.lower():
-                match = False
-
-        # Filtro por marca
-        if brand and match:
-            if product.get('brand', '').lower() != brand.lower():
-                match = False
-
-        # Filtro por precio mínimo
-        if min_price is not None and match:
-            # Usamos float('-inf') como default si el precio no existe para asegurar que la comparación funcione.
-            if product.get('price', float('-inf')) < min_price:
-                match = False
-
-        # Filtro por precio máximo
-        if max_price is not None and match:
-            # Usamos float('inf') como default si el precio no existe.
-            if product.get('price', float('inf')) > max_price:
-                match = False
-
-        # Filtro por rating mínimo
-        if min_rating is not None and match:
-            # Accedemos al rating promedio, usando float('-inf') como default.
-            if product.get('ratings', {}).get('average_rating', float('-inf')) < min_rating:
-                match = False
-
-        # Filtro por disponibilidad (stock)
-        if in_stock is not None and match:
-            # Consideramos que un producto está en stock si su cantidad es mayor a 0.
-            product_in_stock = product.get('stock', 0) > 0
-            if product_in_stock != in_stock:
-                match = False
-
-        # Si todos los criterios aplicados hasta ahora son verdaderos, el producto es un resultado.
-        if match:
-            results.append(product)
-
-    return results
+    return search_catalog(
+        marketplace_products, query=query, category=category, brand=brand,
+        min_price=min_price, max_price=max_price, min_rating=min_rating,
+        in_stock=in_stock, ranked=ranked, limit=limit, offset=offset
+    )["results"]
+
+
+@tool
+def catalog_search_page_tool(
+    marketplace_products: Optional[List[Dict[str, Any]]] = None,
+    query: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    in_stock: Optional[bool] = None,
+    ranked: bool = False,
+    limit: Optional[int] = DEFAULT_PAGE_SIZE,
+    offset: int = 0
+) -> Dict[str, Any]:
+    """
+    Igual que `catalog_search_tool` (mismos argumentos), pero retorna la página completa para
+    poder paginar: `results` (los productos de la página), `total_count` (número total de
+    coincidencias), `offset`, `limit`, `corrections` (palabras corregidas de la query) y
+    `facets` (rango de precios y marcas de todas las coincidencias).
+    """
+    return search_catalog(
+        marketplace_products, query=query, category=category, brand=brand,
+        min_price=min_price, max_price=max_price, min_rating=min_rating,
+        in_stock=in_stock, ranked=ranked, limit=limit, offset=offset
+    )
 
 # La función `search_products_node` que existía antes aquí ya no es necesaria
 # porque el `catalog_search_tool` está diseñado para ser llamado directamente
@@ -1,10 +1,16 @@
 import json
 import os # Importado para el bloque if __name__ == '__main__'
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, Iterable, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 
-from src.utils.config import get_llm
+from src.utils.catalog_store import get_catalog_store, index_for
+from src.utils.config import compact_prompts_enabled, get_llm
+from src.utils.llm_accounting import llm_attribution
+from src.utils.product_resolver import ProductResolverIndex
+from src.utils.wishlist_dedup import duplicate_member_keys, wishlist_item_key
+from src.utils.wishlist_watermarks import WishlistEntry, WishlistWatermarkStore, get_wishlist_watermark_store
+from src.utils.llm_scheduler import PRIORITY_BATCH, invoke_llm_chain
 from src.utils.data_loader import get_instagram_saves, get_pinterest_boards # Para carga de datos si es necesario
 
 # --- Pydantic Modelos para la Salida Estructurada del LLM ---
@@ -42,6 +48,31 @@ class WishlistAnalysisResult(BaseModel):
     categorized_items: List[CategorizedItem] = Field(description="Lista de items de wishlist analizados y categorizados por el LLM.")
 
 
+class ExtractedItemFields(BaseModel):
+    """
+    Salida del LLM en modo compacto: solo los campos que extrae. El texto, la fuente y el
+    item original ya se conocen y se reincorporan localmente para formar el `CategorizedItem`.
+    """
+    identified_product_name: Optional[str] = Field(description="Producto o servicio deseado; null si no hay uno claro.")
+    category: Optional[str] = Field(description="Una de: Electrónica, Ropa, Hogar, Viajes, Comida, Libros, Belleza, Deporte, Otro; o null.")
+    key_features: List[str] = Field(description="2 a 4 características, marcas o palabras clave del texto.")
+    user_sentiment_or_intent: Optional[str] = Field(description="Intención del usuario (ej: deseo fuerte, buscando oferta); o null.")
+
+
+# Campos del item original que aportan contexto al LLM. IDs, URLs y fechas solo gastan tokens.
+CONTEXT_FIELDS = ("detected_product_name", "desired_price", "board_name")
+
+COMPACT_WISHLIST_PROMPT_TEMPLATE = """Analiza este item de una lista de deseos de {source} y extrae el producto que el usuario desea.
+Texto: {text_input}
+Contexto: {context}"""
+
+
+def compact_item_context(original_item_data: Dict[str, Any]) -> str:
+    """Campos relevantes del item original (`CONTEXT_FIELDS`) con valor, en JSON minificado."""
+    context = {k: original_item_data[k] for k in CONTEXT_FIELDS if original_item_data.get(k) not in (None, "")}
+    return json.dumps(context, ensure_ascii=False, separators=(",", ":"))
+
+
 # --- Plantilla de Prompt para el Análisis de Items de Wishlist ---
 # Esta plantilla instruye al LLM sobre cómo analizar cada item de la wishlist.
 WISHLIST_ANALYSIS_PROMPT_TEMPLATE = """
@@ -94,23 +125,49 @@ def analyze_social_media_item(
     llm: Any, # Tipo genérico para el objeto LLM de Langchain
     item_text: str,
     source: str,
-    original_item_data: Dict
+    original_item_data: Dict,
+    compact: Optional[bool] = None
 ) -> Optional[CategorizedItem]:
     """
     Analiza un solo item de red social (Instagram post o Pinterest pin) utilizando un LLM
     para extraer información estructurada y categorizarla.
 
+    En modo compacto (el default, ver `compact_prompts_enabled`) el prompt lleva solo el texto
+    y los campos relevantes del item, y el LLM devuelve solo `ExtractedItemFields`; el texto,
+    la fuente y el item original se agregan aquí sin pasar por el modelo.
+
     Args:
         llm: La instancia del modelo de lenguaje de Langchain a utilizar.
         item_text: El texto principal del item a analizar (ej: caption de Instagram, descripción de Pinterest).
         source: La plataforma de origen del item (ej: "instagram", "pinterest").
         original_item_data: El diccionario completo con los datos originales del item,
                             tal como se cargaron desde la fuente.
+        compact: Fuerza el modo compacto (True) o el prompt completo (False).
 
     Returns:
         Un objeto `CategorizedItem` con la información analizada si el proceso es exitoso,
         o `None` si ocurre un error durante el análisis o la respuesta del LLM no es válida.
     """
+    if compact is None:
+        compact = compact_prompts_enabled()
+    if compact:
+        chain = ChatPromptTemplate.from_template(COMPACT_WISHLIST_PROMPT_TEMPLATE) | llm.with_structured_output(ExtractedItemFields)
+        try:
+            fields: ExtractedItemFields = invoke_llm_chain(chain, {
+                "source": source,
+                "text_input": item_text,
+                "context": compact_item_context(original_item_data),
+            }, priority=PRIORITY_BATCH, stage="wishlist_analysis")
+            return CategorizedItem(
+                original_text=item_text,
+                source=source,
+                original_item_details=original_item_data,
+                **fields.model_dump(),
+            )
+        except Exception as e:
+            print(f"Error analizando item '{item_text[:50]}...' de '{source}' con LLM: {e}")
+            return None
+
     prompt = ChatPromptTemplate.from_template(WISHLIST_ANALYSIS_PROMPT_TEMPLATE)
 
     # Crear una cadena LangChain. Se usa `.with_structured_output(CategorizedItem)`
@@ -119,13 +176,13 @@ def analyze_social_media_item(
     chain = prompt | llm.with_structured_output(CategorizedItem)
 
     try:
-        # Invocar la cadena con los datos del item.
+        # Invocar la cadena con los datos del item (carril de lote del planificador LLM).
         # El LLM debe generar todos los campos de CategorizedItem según el prompt.
-        response_item: CategorizedItem = chain.invoke({
+        response_item: CategorizedItem = invoke_llm_chain(chain, {
             "source": source,
             "text_input": item_text,
             "original_details_str": json.dumps(original_item_data, indent=2, ensure_ascii=False) # Para el contexto del LLM
-        })
+        }, priority=PRIORITY_BATCH, stage="wishlist_analysis")
 
         # Verificación adicional (aunque el prompt es explícito):
         # Asegurarse de que los campos que pasamos directamente (source, original_text, original_item_details)
@@ -142,109 +199,206 @@ def analyze_social_media_item(
         # Podríamos intentar parsear el error si es una OutputParsingError para ver la salida del LLM.
         return None
 
-def run_wishlist_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+def categorized_from_catalog(item_text: str, source: str, original_item_data: Dict[str, Any],
+                             product: Dict[str, Any], method: str) -> Dict[str, Any]:
+    """
+    Item categorizado a partir de un producto del catálogo resuelto sin LLM: nombre, categoría
+    y características salen del catálogo. `resolved_product_id` permite al matching usarlo
+    directamente.
+    """
+    features = ([product['brand']] if product.get('brand') else []) + list(product.get('tags') or [])
+    item = CategorizedItem(
+        original_text=item_text,
+        identified_product_name=product.get('name'),
+        category=product.get('category'),
+        key_features=features[:4],
+        user_sentiment_or_intent=None,
+        source=source,
+        original_item_details=original_item_data,
+    ).model_dump()
+    item['resolved_product_id'] = product['id']
+    item['resolution_method'] = method
+    return item
+
+class _LazyLlm:
+    """
+    LLM del WishlistAgent, creado la primera vez que un item lo necesita: si todos los items
+    nuevos se resuelven por catálogo no se crea, y si no se puede crear (ej: sin API key) los
+    items resueltos siguen entrando en la wishlist. El error queda en `error`.
+    """
+
+    def __init__(self):
+        self._llm = None
+        self.error: Optional[str] = None
+
+    def __call__(self) -> Optional[Any]:
+        if self._llm is None and self.error is None:
+            try:
+                # Temperatura baja para que las respuestas del LLM sean más consistentes y deterministas.
+                self._llm = get_llm(temperature=0.1)
+            except ValueError as e:
+                # Error crítico si el LLM no se puede inicializar (ej: API key no configurada).
+                print(f"ERROR CRÍTICO: No se pudo inicializar el LLM para WishlistAgent: {e}")
+                print("Los items que no se resuelvan por catálogo quedan pendientes. Revise la configuración de la API Key.")
+                self.error = f"Fallo al inicializar LLM: {e}"
+        return self._llm
+
+def _process_wishlist_source(
+    get_item_llm: Callable[[], Optional[Any]],
+    store: WishlistWatermarkStore,
+    source: str,
+    user_id: Optional[str],
+    entries: List[WishlistEntry],
+    resolver: Optional[ProductResolverIndex] = None,
+    skipped_duplicates: Iterable[str] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Analiza solo los items pendientes de una fuente (posteriores a la marca de agua), actualiza
+    el store y retorna todos los items categorizados vigentes de la fuente. Los items que el
+    `resolver` identifica por enlace o nombre exacto se toman del catálogo sin llamar al LLM;
+    `get_item_llm` solo se llama para los demás (si retorna None, quedan como fallidos y se
+    reintentan en la próxima ejecución). `skipped_duplicates` son las claves de la fuente que
+    no se analizan por ser duplicados (no están en `entries`); el store las recuerda para analizarlas si dejan de serlo.
+    """
+    pending = store.pending(source, user_id, entries)
+    analyzed: Dict[str, Dict[str, Any]] = {}
+    processed, failed = [], []
+    resolved_count = 0
+    for key, item, text_to_analyze, timestamp in pending:
+        product, method = resolver.resolve_item(item) if resolver is not None else (None, None)
+        if product is not None:
+            analyzed[key] = categorized_from_catalog(text_to_analyze, source, item, product, method)
+            processed.append(timestamp)
+            resolved_count += 1
+            continue
+        if not text_to_analyze.strip(): # Saltar si no hay texto que analizar
+            print(f"Skipping {source} item '{key}' due to empty text.")
+            processed.append(timestamp)
+            continue
+        llm = get_item_llm()
+        if llm is None:
+            failed.append(timestamp)
+            continue
+        # Analizar el item usando el LLM (los tokens se atribuyen al usuario de la fuente)
+        with llm_attribution(user_id=user_id):
+            categorized_item_obj = analyze_social_media_item(llm, text_to_analyze, source, item)
+        if categorized_item_obj:
+            analyzed[key] = categorized_item_obj.model_dump()
+            processed.append(timestamp)
+        else:
+            failed.append(timestamp)
+
+    keys = [entry[0] for entry in entries]
+    skipped_duplicates = list(skipped_duplicates)
+    deleted = store.update(source, user_id, keys, analyzed, processed, failed, skipped_duplicates)
+    current_items = store.items(source, user_id, keys)
+    print(f"{source}: {len(analyzed)} items nuevos ({resolved_count} resueltos por catálogo sin LLM), "
+          f"{len(current_items) - len(analyzed)} reutilizados, {len(skipped_duplicates)} duplicados omitidos, "
+          f"{deleted} eliminados, {len(failed)} fallidos (marca de agua: {store.watermark(source, user_id)}).")
+    return current_items
+
+def run_wishlist_agent(state: Dict[str, Any], watermark_store: Optional[WishlistWatermarkStore] = None) -> Dict[str, Any]:
     """
     Nodo del grafo LangGraph para el WishlistAgent.
     Este agente toma los datos cargados de Instagram y Pinterest (desde el `state`),
     los analiza utilizando un LLM para extraer información de productos y categorizarlos,
     y luego actualiza el `state` con la lista de items analizados en `ia_categorized_wishlist`.
 
+    El procesamiento es incremental: por usuario se guarda una marca de agua
+    (`saved_at`/`pinned_at`) y los items ya categorizados (`WishlistWatermarkStore`), de modo
+    que solo los items nuevos pasan por el LLM; los eliminados de la fuente se descartan.
+
     Args:
         state: El diccionario de estado actual del grafo del agente. Se espera que contenga
                `instagram_saves` y `pinterest_boards` con los datos cargados.
+        watermark_store: Store de marcas de agua a usar; por defecto el de `WISHLIST_STATE_PATH`.
 
     Returns:
-        El diccionario de estado actualizado. Si el análisis es exitoso, `ia_categorized_wishlist`
-        contendrá una lista de diccionarios (cada uno un `CategorizedItem`).
-        Si hay un error (ej: API key no configurada), `wishlist_agent_error` se poblará.
+        Un diccionario solo con las claves del estado que cambian (LangGraph las combina con el
+        estado actual). Si el análisis es exitoso, `ia_categorized_wishlist` contendrá una lista
+        de diccionarios (cada uno un `CategorizedItem`) y `wishlist_agent_error` será None.
+        Si hay un error (ej: API key no configurada), `wishlist_agent_error` se poblará; los
+        items resueltos por catálogo se retornan igualmente.
     """
     print("--- EJECUTANDO WISHLIST AGENT (Análisis y Categorización con IA) ---")
 
-    # Obtener la instancia del LLM.
-    # Se usa una temperatura baja para que las respuestas del LLM sean más consistentes y deterministas.
-    try:
-        llm = get_llm(temperature=0.1)
-    except ValueError as e:
-        # Error crítico si el LLM no se puede inicializar (ej: API key no configurada).
-        print(f"ERROR CRÍTICO: No se pudo inicializar el LLM para WishlistAgent: {e}")
-        print("El WishlistAgent no puede continuar sin un LLM configurado. Revise la configuración de la API Key.")
-        state['ia_categorized_wishlist'] = [] # Dejar la lista vacía
-        state['wishlist_agent_error'] = f"Fallo al inicializar LLM: {e}"
-        return state
+    # El LLM se crea solo si algún item no se resuelve por catálogo (ver `_LazyLlm`).
+    llm = _LazyLlm()
 
     # Obtener datos de las redes sociales del estado del agente.
     # Estos datos deberían haber sido cargados en un paso anterior (ej: en main.py o un nodo de carga).
     instagram_data = state.get('instagram_saves')
     pinterest_data = state.get('pinterest_boards')
+    updates: Dict[str, Any] = {}
 
     # Como fallback, si los datos no están en el estado, intentar cargarlos.
     # En un flujo de producción, la carga de datos sería manejada más estrictamente.
     if not instagram_data:
         print("WARN: Datos de Instagram no encontrados en el estado. Intentando cargar...")
         instagram_data = get_instagram_saves()
-        state['instagram_saves'] = instagram_data # Actualizar estado si se cargó aquí
+        updates['instagram_saves'] = instagram_data # Actualizar estado si se cargó aquí
 
     if not pinterest_data:
         print("WARN: Datos de Pinterest no encontrados en el estado. Intentando cargar...")
         pinterest_data = get_pinterest_boards()
-        state['pinterest_boards'] = pinterest_data # Actualizar estado si se cargó aquí
-
-    analyzed_items_list: List[CategorizedItem] = [] # Lista para guardar los objetos CategorizedItem
+        updates['pinterest_boards'] = pinterest_data # Actualizar estado si se cargó aquí
+
+    # Solo se analizan los items posteriores a la marca de agua de cada usuario; los demás se
+    # reutilizan del estado guardado en la ejecución anterior.
+    store = watermark_store if watermark_store is not None else get_wishlist_watermark_store()
+    analyzed_items_list: List[Dict[str, Any]] = [] # Items categorizados (como diccionarios)
+    # De cada grupo de duplicados entre fuentes (`wishlist_clusters`) solo se analiza el representante.
+    duplicates = duplicate_member_keys(state.get('wishlist_clusters'))
+    # Resolución determinista (enlace -> ID, nombre exacto) antes de pagar una llamada al LLM.
+    catalog = get_catalog_store()
+    resolver = index_for(catalog.products, "product_resolver", ProductResolverIndex) if len(catalog) else None
 
     # Analizar Items Guardados de Instagram
     if instagram_data and isinstance(instagram_data.get('saved_items'), list):
-        print(f"Analizando {len(instagram_data['saved_items'])} items de Instagram...")
-        for item in instagram_data['saved_items']:
-            text_to_analyze = item.get('caption', '')
-            if not text_to_analyze.strip(): # Saltar si no hay texto en el caption
-                print(f"Skipping Instagram item ID {item.get('post_id', 'N/A')} due to empty caption.")
-                continue
-
-            # Analizar el item usando el LLM
-            categorized_item_obj = analyze_social_media_item(llm, text_to_analyze, "instagram", item)
-            if categorized_item_obj:
-                analyzed_items_list.append(categorized_item_obj)
+        print(f"Revisando {len(instagram_data['saved_items'])} items de Instagram...")
+        entries = [(wishlist_item_key("instagram", item), item, item.get('caption', ''), item.get('saved_at'))
+                   for item in instagram_data['saved_items']]
+        skipped = [e[0] for e in entries if ("instagram", e[0]) in duplicates]
+        entries = [e for e in entries if ("instagram", e[0]) not in duplicates]
+        analyzed_items_list.extend(_process_wishlist_source(llm, store, "instagram", instagram_data.get('user_id'), entries, resolver, skipped))
     else:
         print("No hay datos válidos de Instagram ('saved_items' no es una lista o no existe) para analizar.")
 
     # Analizar Pines de Pinterest
     if pinterest_data and isinstance(pinterest_data.get('boards'), list):
-        print("Analizando items de Pinterest...")
+        print("Revisando items de Pinterest...")
+        entries = []
         for board in pinterest_data['boards']:
             if isinstance(board.get('pins'), list):
-                for pin in board['pins']:
-                    text_to_analyze = pin.get('description', '')
-                    if not text_to_analyze.strip(): # Saltar si no hay texto en la descripción
-                        print(f"Skipping Pinterest pin ID {pin.get('pin_id', 'N/A')} due to empty description.")
-                        continue
-
-                    # Analizar el pin usando el LLM
-                    categorized_item_obj = analyze_social_media_item(llm, text_to_analyze, "pinterest", pin)
-                    if categorized_item_obj:
-                        analyzed_items_list.append(categorized_item_obj)
+                entries.extend((wishlist_item_key("pinterest", pin), pin, pin.get('description', ''), pin.get('pinned_at'))
+                               for pin in board['pins'])
             else:
                 print(f"Skipping Pinterest board ID {board.get('board_id','N/A')} due to invalid 'pins' field.")
+        skipped = [e[0] for e in entries if ("pinterest", e[0]) in duplicates]
+        entries = [e for e in entries if ("pinterest", e[0]) not in duplicates]
+        analyzed_items_list.extend(_process_wishlist_source(llm, store, "pinterest", pinterest_data.get('user_id'), entries, resolver, skipped))
     else:
         print("No hay datos válidos de Pinterest ('boards' no es una lista o no existe) para analizar.")
 
+    store.save()
+
     # TODO Futuro: Considerar si se deben analizar también los 'abandoned_carts' con IA.
     # Actualmente, los carritos abandonados suelen tener IDs de producto directos, por lo que
     # el matching puede ser más directo sin necesidad de análisis semántico profundo por LLM,
     # a menos que queramos inferir intenciones o razones de abandono (si tuviéramos más contexto).
 
     # Guardar los items analizados (como diccionarios) en el estado del agente.
-    state['ia_categorized_wishlist'] = [item.model_dump() for item in analyzed_items_list]
+    updates['ia_categorized_wishlist'] = analyzed_items_list
     print(f"WishlistAgent: {len(analyzed_items_list)} items analizados y categorizados por IA en total.")
 
-    # Limpiar cualquier error previo si el proceso se completó (aunque sea con 0 items analizados)
-    if 'wishlist_agent_error' in state and not analyzed_items_list and not (instagram_data or pinterest_data):
-        # Mantener el error si no había datos y no se pudo hacer nada.
-        pass
-    elif 'wishlist_agent_error' in state:
-         del state['wishlist_agent_error']
-
+    if llm.error is not None:
+        updates['wishlist_agent_error'] = llm.error
+    # Limpiar cualquier error previo si el proceso se completó (aunque sea con 0 items analizados).
+    # Se mantiene el error si no había datos y no se pudo hacer nada.
+    elif state.get('wishlist_agent_error') and (analyzed_items_list or instagram_data or pinterest_data):
+        updates['wishlist_agent_error'] = None
 
-    return state
+    return updates
 
 # --- Bloque de Prueba (ejecutar con `python src/agent/wishlist_agent.py`) ---
 if __name__ == '__main__':
@@ -294,7 +448,8 @@ if __name__ == '__main__':
         print(f"Cambiado directorio a la raíz del proyecto: {os.getcwd()} para cargar .env correctamente.")
 
     # Ejecutar el agente con el estado simulado
-    final_state = run_wishlist_agent(mock_state_for_test)
+    # El nodo devuelve solo los cambios; se combinan con el estado como lo haría LangGraph.
+    final_state = {**mock_state_for_test, **run_wishlist_agent(mock_state_for_test, WishlistWatermarkStore(path=None))} # Sin persistir marcas de agua
 
     print("\n--- ESTADO FINAL DESPUÉS DE EJECUTAR WishlistAgent ---")
     if final_state.get('wishlist_agent_error'):
@@ -0,0 +1,228 @@
+import asyncio
+import contextlib
+import json
+import sys
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+# Modo servidor: muchas conversaciones concurrentes en un solo proceso. Todas las sesiones
+# comparten el grafo compilado, el catálogo con sus índices (CatalogStore) y los clientes LLM
+# (get_llm); cada sesión tiene su propio estado en el checkpointer (thread_id = sesión).
+#
+# Protocolo: una línea JSON por petición, `{"session": "<id>", "text": "<mensaje>"}`, y una
+# línea JSON por respuesta. Una línea que no es JSON se trata como texto de la sesión por
+# defecto de la conexión.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_LINE_BYTES = 64 * 1024
+
+
+class ChatServer:
+    """
+    Servidor asyncio de conversaciones sobre el grafo conversacional.
+
+    - `max_concurrent_turns` limita los turnos que se ejecutan a la vez (un semáforo).
+    - `max_pending_turns` limita los que pueden esperar turno; por encima de eso se responde
+      de inmediato con `"busy": true` (back-pressure en lugar de colas sin límite).
+    - Los turnos de una misma sesión se serializan con un lock por sesión, de modo que el
+      estado de cada conversación nunca recibe dos turnos en paralelo.
+    - Un turno que supera `turn_timeout` no se puede interrumpir (sus nodos síncronos corren en
+      hilos del executor): se responde con un error, pero el turno termina en segundo plano
+      conservando el lock de su sesión y su cupo. Mientras tanto, los mensajes de esa sesión
+      se rechazan con `"busy": true`.
+    """
+
+    def __init__(self, agent_app, max_concurrent_turns: int = 32, max_pending_turns: int = 256,
+                 turn_timeout: float = 120.0):
+        self.agent_app = agent_app
+        self.max_concurrent_turns = max_concurrent_turns
+        self.max_pending_turns = max_pending_turns
+        self.turn_timeout = turn_timeout
+        self._turn_slots = asyncio.Semaphore(max_concurrent_turns)
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._session_users: Dict[str, int] = {} # Turnos activos o en espera por sesión
+        self._admitted = 0 # Turnos en ejecución + en espera
+        self._late_sessions: set = set() # Sesiones cuyo turno venció el timeout y sigue en curso
+        self._background_tasks: set = set() # Referencias a las tareas de cierre de esos turnos
+        self.stats = {"turns": 0, "rejected": 0, "errors": 0, "connections": 0}
+
+    def _acquire_session(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        self._session_users[session_id] = self._session_users.get(session_id, 0) + 1
+        return lock
+
+    def _release_session(self, session_id: str) -> None:
+        # El lock se descarta cuando nadie lo usa, así el dict no crece con cada sesión vista.
+        self._session_users[session_id] -= 1
+        if not self._session_users[session_id]:
+            del self._session_users[session_id]
+            del self._session_locks[session_id]
+
+    async def _new_session_state(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Estado inicial mínimo si la sesión no existe todavía en el checkpointer."""
+        snapshot = await self.agent_app.aget_state(config)
+        if snapshot.values:
+            return {}
+        from src.utils.catalog_store import get_catalog_store
+
+        return {
+            "conversation_history": [],
+            "conversation_summary": None,
+            "catalog_version": get_catalog_store().version,
+        }
+
+    async def handle_turn(self, session_id: str, text: str) -> Dict[str, Any]:
+        """Procesa un mensaje de una sesión y devuelve la respuesta del agente."""
+        if session_id in self._late_sessions:
+            self.stats["rejected"] += 1
+            return {"session": session_id, "busy": True,
+                    "error": "Tu mensaje anterior todavía se está procesando, intenta de nuevo en unos segundos."}
+        if self._admitted >= self.max_concurrent_turns + self.max_pending_turns:
+            self.stats["rejected"] += 1
+            return {"session": session_id, "busy": True, "error": "Servidor ocupado, intenta de nuevo en unos segundos."}
+
+        self._admitted += 1
+        session_lock = self._acquire_session(session_id)
+        try:
+            async with contextlib.AsyncExitStack() as turn_resources:
+                turn_resources.callback(self._end_turn, session_id) # Se ejecuta al final (LIFO)
+                await turn_resources.enter_async_context(session_lock)
+                await turn_resources.enter_async_context(self._turn_slots)
+                config = {"configurable": {"thread_id": session_id}, "recursion_limit": 25}
+                turn_input = {**await self._new_session_state(config), "current_user_input": text}
+                start = time.perf_counter()
+                task = asyncio.ensure_future(self.agent_app.ainvoke(turn_input, config=config))
+                try:
+                    done, _ = await asyncio.wait({task}, timeout=self.turn_timeout)
+                except asyncio.CancelledError: # Se canceló este handler (ej: el servidor se cierra)
+                    self._detach_turn(session_id, task, turn_resources)
+                    raise
+                if not done:
+                    self._detach_turn(session_id, task, turn_resources)
+                    raise asyncio.TimeoutError(f"el turno superó {self.turn_timeout:g} s")
+                state = task.result()
+                self.stats["turns"] += 1
+                decision = state.get("master_agent_decision") or {}
+                return {
+                    "session": session_id,
+                    "response": decision.get("response_text") or "No he podido procesar tu solicitud.",
+                    "next_action": decision.get("next_action"),
+                    "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+                }
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"💥 Error en el turno de la sesión '{session_id}': {e}")
+            return {"session": session_id, "error": f"Error procesando el mensaje: {e}"}
+
+    def _end_turn(self, session_id: str) -> None:
+        self._release_session(session_id)
+        self._admitted -= 1
+
+    def _detach_turn(self, session_id: str, task: "asyncio.Future", turn_resources: contextlib.AsyncExitStack) -> None:
+        """
+        Deja que un turno vencido termine en segundo plano: el lock de la sesión, el cupo y la
+        admisión pasan a liberarse cuando la tarea termina de verdad (y no al responder).
+        """
+        self._late_sessions.add(session_id)
+        resources = turn_resources.pop_all()
+
+        async def finish() -> None:
+            try:
+                await resources.aclose()
+            finally:
+                self._late_sessions.discard(session_id)
+
+        def on_done(finished: "asyncio.Future") -> None:
+            if not finished.cancelled() and finished.exception() is not None:
+                print(f"💥 El turno vencido de la sesión '{session_id}' terminó con error: {finished.exception()}")
+            else:
+                print(f"Turno vencido de la sesión '{session_id}' terminado en segundo plano.")
+            closing = asyncio.ensure_future(finish())
+            self._background_tasks.add(closing)
+            closing.add_done_callback(self._background_tasks.discard)
+
+        task.add_done_callback(on_done)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Atiende una conexión: lee una petición por línea y responde antes de leer la siguiente."""
+        self.stats["connections"] += 1
+        default_session = uuid.uuid4().hex
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'{"error": "Linea demasiado larga."}\n')
+                    break
+                if not line:
+                    break
+                line = line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    request = {"text": line}
+                if not isinstance(request, dict) or not str(request.get("text") or "").strip():
+                    reply = {"error": "Petición inválida: se espera {\"session\": ..., \"text\": ...}."}
+                else:
+                    reply = await self.handle_turn(str(request.get("session") or default_session), str(request["text"]))
+                writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain() # Si el cliente no lee, no se siguen aceptando peticiones suyas
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_BYTES)
+
+
+def build_chat_server(db_path: Optional[str] = None, **server_options) -> ChatServer:
+    """
+    Prepara los recursos compartidos (catálogo, índices, grafo) y crea el servidor. Con
+    `db_path` las sesiones se guardan en SQLite; si no, viven en memoria del proceso.
+    """
+    from src.agent.graph import create_conversational_graph
+    from src.main import build_search_indexes
+    from src.utils.catalog_store import get_catalog_store
+
+    if db_path:
+        from src.utils.sqlite_checkpointer import SqliteCheckpointer
+        checkpointer = SqliteCheckpointer(db_path)
+    else:
+        from langgraph.checkpoint.memory import InMemorySaver
+        checkpointer = InMemorySaver()
+
+    catalog = get_catalog_store()
+    if not catalog.ensure_loaded():
+        print("ADVERTENCIA: No se pudo cargar el catálogo; las búsquedas no darán resultados.")
+    build_search_indexes()
+    return ChatServer(create_conversational_graph(checkpointer=checkpointer), **server_options)
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, db_path: Optional[str] = None) -> None:
+    server = build_chat_server(db_path)
+    tcp_server = await server.start(host, port)
+    print(f"🛒 Servidor de chat escuchando en {host}:{port} (máx. {server.max_concurrent_turns} turnos concurrentes)")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m src.chat_server [--host H] [--port P] [--db data/sessions.sqlite3]
+    args = sys.argv[1:]
+
+    def _option(name: str, default: Optional[str]) -> Optional[str]:
+        return args[args.index(name) + 1] if name in args[:-1] else default
+
+    try:
+        asyncio.run(serve(_option("--host", DEFAULT_HOST), int(_option("--port", str(DEFAULT_PORT))), _option("--db", None)))
+    except KeyboardInterrupt:
+        from src.utils.llm_accounting import llm_ledger
+        print("\nServidor detenido.")
+        print(llm_ledger.report())
@@ -1,12 +1,32 @@
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import scrolledtext, messagebox
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# Espera tras la última tecla antes de pedir sugerencias, y cada cuánto se revisa si llegaron.
+AUTOCOMPLETE_DEBOUNCE_MS = 150
+AUTOCOMPLETE_POLL_MS = 10
+AUTOCOMPLETE_KIND_LABELS = {"product": "Producto", "brand": "Marca", "category": "Categoría"}
 
 class ChatApplication:
-    def __init__(self, root: tk.Tk, agent_app: Callable, initial_agent_state: Dict[str, Any]):
+    def __init__(self, root: tk.Tk, agent_app: Optional[Callable] = None, initial_agent_state: Optional[Dict[str, Any]] = None,
+                 session_config: Optional[Dict[str, Any]] = None,
+                 autocomplete: Optional[Callable[[str], Tuple[int, List[Dict[str, Any]]]]] = None):
+        # agent_app puede ser None si el agente aún se está preparando en segundo plano
+        # (arranque rápido). La entrada queda deshabilitada hasta llamar a `attach_agent`.
+        # Con `session_config` ({"configurable": {"thread_id": ...}}) el grafo persiste la
+        # sesión en su checkpointer: solo el primer turno envía el estado inicial.
+        # `autocomplete(texto)` retorna `(palabras a reemplazar, sugerencias)` para lo escrito
+        # (ver `src.utils.prefix_index.catalog_suggestions`); se consulta fuera del hilo de la GUI.
         self.root = root
         self.agent_app = agent_app
         self.current_agent_state = initial_agent_state
+        self.session_config = session_config
+        self.autocomplete = autocomplete
+        self._autocomplete_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autocomplete") if autocomplete else None
+        self._autocomplete_job = None # Temporizador del debounce (id de `root.after`)
+        self._suggestions: List[Dict[str, Any]] = []
+        self._suggested_words = 0
 
         self.root.title("Agente de Compras Conversacional")
         self.root.geometry("600x700") # Aumentado tamaño para mejor visualización
@@ -28,6 +48,16 @@ class ChatApplication:
         self.send_button = tk.Button(input_frame, text="Enviar", command=self.send_message, padx=10, pady=8, font=("Arial", 10))
         self.send_button.pack(side=tk.RIGHT)
 
+        # Sugerencias de autocompletado (productos, marcas y categorías), visibles solo si hay alguna.
+        self.suggestions_list = tk.Listbox(root, height=6, font=("Arial", 10), activestyle=tk.DOTBOX)
+        self.suggestions_list.bind("<Return>", self._accept_suggestion)
+        self.suggestions_list.bind("<Double-Button-1>", self._accept_suggestion)
+        self.suggestions_list.bind("<Escape>", lambda event: self._hide_suggestions())
+        if self.autocomplete is not None:
+            self.user_input_entry.bind("<KeyRelease>", self._on_key_release)
+            self.user_input_entry.bind("<Down>", self._focus_suggestions)
+            self.user_input_entry.bind("<Escape>", lambda event: self._hide_suggestions())
+
         # Configurar cierre de ventana
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
@@ -38,6 +68,36 @@ class ChatApplication:
         # Opcionalmente, podríamos hacer una invocación inicial al agente sin input para obtener saludo.
         # self.process_agent_turn(initial=True)
 
+        if self.agent_app is None:
+            self.user_input_entry.config(state=tk.DISABLED)
+            self.send_button.config(state=tk.DISABLED)
+            self.add_message_to_chat("🤖 Agente:", "Estoy preparando el catálogo, dame un momento...")
+
+    def attach_agent(self, agent_app: Callable, initial_agent_state: Optional[Dict[str, Any]],
+                     session_config: Optional[Dict[str, Any]] = None):
+        """
+        Conecta el agente una vez terminado el warm-up en segundo plano y habilita la entrada.
+        Debe llamarse desde el hilo de Tkinter (ej: vía `root.after`).
+
+        Si `initial_agent_state` es None y hay `session_config`, se reanuda una sesión guardada:
+        el historial se recupera del checkpointer y se muestra en el chat.
+        """
+        self.agent_app = agent_app
+        self.current_agent_state = initial_agent_state
+        if session_config is not None:
+            self.session_config = session_config
+        self.user_input_entry.config(state=tk.NORMAL)
+        self.send_button.config(state=tk.NORMAL)
+        self.user_input_entry.focus()
+        if initial_agent_state is None and self.session_config:
+            saved_state = agent_app.get_state(self.session_config).values
+            history = saved_state.get("conversation_history") or []
+            for speaker, text in history:
+                self.add_message_to_chat("👤 Tú:" if speaker == "user" else "🤖 Agente:", text)
+            self.add_message_to_chat("🤖 Agente:", f"Sesión reanudada ({len(history)} mensajes). ¿Seguimos?")
+            return
+        self.add_message_to_chat("🤖 Agente:", "¡Listo! Ya puedes escribirme.")
+
 
     def add_message_to_chat(self, sender: str, message: str, is_error: bool = False):
         self.chat_area.config(state=tk.NORMAL)
@@ -67,11 +127,12 @@ class ChatApplication:
 
     def send_message(self):
         user_text = self.user_input_entry.get().strip()
-        if not user_text:
+        if not user_text or self.agent_app is None: # Agente aún no disponible
             return
 
         self.add_message_to_chat("👤 Tú:", user_text)
         self.user_input_entry.delete(0, tk.END)
+        self._hide_suggestions()
 
         # Deshabilitar entrada mientras el agente procesa
         self.user_input_entry.config(state=tk.DISABLED)
@@ -81,15 +142,22 @@ class ChatApplication:
 
     def process_agent_turn(self, user_input: str = None, initial: bool = False):
         try:
+            if self.session_config:
+                # El checkpointer guarda el estado de la sesión: solo se envía la entrada nueva
+                # (más el estado inicial en el primer turno de una sesión nueva).
+                turn_input = dict(self.current_agent_state or {}) if self._is_new_session() else {}
+            else:
+                turn_input = self.current_agent_state
             if initial: # Para una posible primera interacción del agente (saludo)
-                 self.current_agent_state["current_user_input"] = None # O un input especial de inicio
+                 turn_input["current_user_input"] = None # O un input especial de inicio
             else:
-                self.current_agent_state["current_user_input"] = user_input
+                turn_input["current_user_input"] = user_input
 
             # Invocar el grafo del agente
             # El recursion_limit puede necesitar ajuste.
-            print(f"DEBUG: GUI enviando al agente: {self.current_agent_state['current_user_input']}")
-            updated_state = self.agent_app.invoke(self.current_agent_state, config={"recursion_limit": 25}) #Aumentado límite
+            print(f"DEBUG: GUI enviando al agente: {turn_input['current_user_input']}")
+            config = {**(self.session_config or {}), "recursion_limit": 25} #Aumentado límite
+            updated_state = self.agent_app.invoke(turn_input, config=config)
             self.current_agent_state = updated_state
 
             master_decision = self.current_agent_state.get("master_agent_decision", {})
@@ -124,9 +192,83 @@ class ChatApplication:
             self.user_input_entry.focus()
 
 
+    def _on_key_release(self, event=None):
+        """Debounce: las sugerencias se piden recién cuando el usuario deja de teclear."""
+        if event is not None and event.keysym in ("Return", "Escape", "Down", "Up"):
+            return
+        if self._autocomplete_job is not None:
+            self.root.after_cancel(self._autocomplete_job)
+        self._autocomplete_job = self.root.after(AUTOCOMPLETE_DEBOUNCE_MS, self._request_suggestions)
+
+    def _request_suggestions(self):
+        self._autocomplete_job = None
+        text = self.user_input_entry.get()
+        if not text.strip():
+            self._hide_suggestions()
+            return
+        future = self._autocomplete_executor.submit(self.autocomplete, text)
+        self._poll_suggestions(text, future)
+
+    def _poll_suggestions(self, text: str, future):
+        # Tkinter no es thread-safe: el hilo de autocompletado solo calcula y aquí, en el
+        # hilo de la GUI, se muestran las sugerencias.
+        if not future.done():
+            self.root.after(AUTOCOMPLETE_POLL_MS, self._poll_suggestions, text, future)
+            return
+        if text != self.user_input_entry.get(): # El usuario siguió escribiendo: resultado obsoleto
+            return
+        try:
+            self._suggested_words, self._suggestions = future.result()
+        except Exception as e:
+            print(f"ADVERTENCIA: Error obteniendo sugerencias: {e}")
+            self._suggested_words, self._suggestions = 0, []
+        self._show_suggestions()
+
+    def _show_suggestions(self):
+        self.suggestions_list.delete(0, tk.END)
+        if not self._suggestions:
+            self.suggestions_list.pack_forget()
+            return
+        for suggestion in self._suggestions:
+            self.suggestions_list.insert(tk.END, f"{suggestion['text']}  ({AUTOCOMPLETE_KIND_LABELS.get(suggestion['kind'], suggestion['kind'])})")
+        self.suggestions_list.config(height=len(self._suggestions))
+        self.suggestions_list.pack(padx=10, pady=(0, 10), fill=tk.X)
+
+    def _hide_suggestions(self):
+        if self._autocomplete_job is not None:
+            self.root.after_cancel(self._autocomplete_job)
+            self._autocomplete_job = None
+        self._suggestions, self._suggested_words = [], 0
+        self.suggestions_list.pack_forget()
+        self.user_input_entry.focus()
+
+    def _focus_suggestions(self, event=None):
+        if self._suggestions:
+            self.suggestions_list.focus()
+            self.suggestions_list.selection_set(0)
+            self.suggestions_list.activate(0)
+
+    def _accept_suggestion(self, event=None):
+        """Reemplaza las últimas palabras escritas por la sugerencia elegida."""
+        selection = self.suggestions_list.curselection()
+        if not selection or not self._suggestions:
+            return
+        words = self.user_input_entry.get().split()
+        kept = words[:len(words) - self._suggested_words]
+        self.user_input_entry.delete(0, tk.END)
+        self.user_input_entry.insert(0, " ".join(kept + [self._suggestions[selection[0]]['text']]) + " ")
+        self._hide_suggestions()
+        self.user_input_entry.icursor(tk.END)
+
+    def _is_new_session(self) -> bool:
+        """True si el checkpointer aún no tiene estado guardado para la sesión actual."""
+        return not self.agent_app.get_state(self.session_config).values
+
     def on_closing(self):
         if messagebox.askokcancel("Salir", "¿Seguro que quieres salir?"):
             # Aquí podríamos añadir lógica de limpieza del agente si fuera necesario
+            if self._autocomplete_executor is not None:
+                self._autocomplete_executor.shutdown(wait=False)
             self.root.destroy()
 
 # Esto es solo para pruebas directas del GUI, main.py será el punto de entrada final
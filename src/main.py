@@ -1,29 +1,32 @@
+import os
+import sys
+import threading
+import time
 import tkinter as tk
-from src.agent.graph import create_graph, AgentState
-from src.utils import data_loader
+from typing import Any, Callable, Dict, Optional
+
+# Solo módulos livianos a nivel de módulo: langgraph, langchain y pydantic se importan
+# en el warm-up en segundo plano para que la ventana aparezca de inmediato.
 from src.gui.app import ChatApplication
+from src.utils.import_report import format_startup_report, loaded_heavy_modules, timed_import
 
-def run_gui_agent():
-    """
-    Inicializa y ejecuta el agente de compras conversacional con una interfaz gráfica Tkinter.
+# Sesiones persistentes: checkpoints conservados por sesión y antigüedad máxima de una sesión inactiva.
+SESSION_CHECKPOINTS_TO_KEEP = 20
+SESSION_MAX_AGE_SECONDS = 30 * 24 * 3600
 
-    Esta función se encarga de:
-    1. Crear el grafo lógico del agente.
-    2. Definir el estado inicial del agente, incluyendo datos de ejemplo y perfil de usuario.
-    3. Cargar datos simulados (catálogo de productos, wishlists de redes sociales, etc.).
-    4. Instanciar y lanzar la aplicación de interfaz gráfica (ChatApplication).
-    """
-    print("🚀 Iniciando Agente de Compras Conversacional con GUI 🚀")
 
-    # 1. Crear el grafo del agente (núcleo lógico LangGraph)
-    # Este grafo define los nodos y flujos de la lógica conversacional del agente.
-    agent_logic_app = create_graph()
+def build_initial_agent_state() -> Dict[str, Any]:
+    """
+    Define el estado inicial para la conversación del agente y carga los datos simulados
+    (catálogo de productos, wishlists de redes sociales, carritos abandonados).
+    """
+    from src.utils import data_loader
+    from src.utils.catalog_store import get_catalog_store
 
-    # 2. Definir el estado inicial para la conversación del agente.
     # Este diccionario representa el 'AgentState' y se pasará a la GUI.
     # La GUI y el grafo del agente interactuarán y modificarán este estado.
-    initial_agent_state: AgentState = {
-        "marketplace_products": None,       # Productos del catálogo del marketplace
+    initial_agent_state = {
+        "catalog_version": None,            # Versión del catálogo compartido (CatalogStore)
         "instagram_saves": None,            # Items guardados de Instagram
         "pinterest_boards": None,           # Pines y tableros de Pinterest
         "abandoned_carts": None,            # Carritos de compra abandonados
@@ -39,17 +42,21 @@ def run_gui_agent():
         "ia_categorized_wishlist": None,    # Wishlist categorizada por IA (salida del WishlistAgent)
         "wishlist_agent_error": None,       # Errores del WishlistAgent
         "raw_cart_items": None,             # Items crudos del carrito (antes de procesar)
-        "conversation_history": [],         # Historial de la conversación [(speaker, text), ...]
+        "conversation_history": [],         # Historial reciente de la conversación [(speaker, text), ...]
+        "conversation_summary": None,       # Resumen de los turnos que salieron del historial acotado
         "current_user_input": None,         # Última entrada del usuario
         "master_agent_decision": None,      # Decisión tomada por el MasterAgent (qué hacer a continuación)
         "catalog_search_output": None       # Salida de la herramienta de búsqueda en catálogo
     }
 
-    # 3. Cargar datos iniciales simulados.
     # Estos datos son utilizados por las herramientas del agente o para poblar el estado inicial.
     print("Cargando datos iniciales para el entorno del agente...")
     try:
-        initial_agent_state['marketplace_products'] = data_loader.get_marketplace_products()
+        # El catálogo vive en el store compartido (se carga una vez y recibe deltas de
+        # precio/stock); el estado solo guarda su versión, no los productos.
+        catalog = get_catalog_store()
+        if catalog.ensure_loaded():
+            initial_agent_state['catalog_version'] = catalog.version
         initial_agent_state['instagram_saves'] = data_loader.get_instagram_saves()
         initial_agent_state['pinterest_boards'] = data_loader.get_pinterest_boards()
         initial_agent_state['abandoned_carts'] = data_loader.get_abandoned_carts()
@@ -59,22 +66,182 @@ def run_gui_agent():
         print("El agente podría no funcionar como se espera sin los datos iniciales.")
         # La aplicación continuará, pero algunas funcionalidades pueden fallar
         # si dependen de estos datos y no se cargaron.
+    return initial_agent_state
+
+
+def build_search_indexes() -> None:
+    """
+    Construye por adelantado los índices del catálogo que usan la búsqueda y el matching, y
+    el de co-ocurrencias (cross-sell) a partir de los carritos y tableros.
+    """
+    from src.utils.bm25_index import Bm25Index
+    from src.utils.catalog_store import get_catalog_store
+    from src.utils.cooccurrence_index import ensure_cooccurrence_index
+    from src.utils.config import search_max_edit_distance
+    from src.utils.prefix_index import PrefixIndex
+    from src.utils.product_resolver import ProductResolverIndex
+    from src.utils.spelling_index import SymSpellIndex
+    from src.utils.text_normalization import NormalizedColumnsIndex
+    from src.utils.trigram_index import TrigramIndex
+    from src.utils.vector_index import TfidfVectorIndex
+
+    catalog = get_catalog_store()
+    catalog.ensure_index("normalized_columns", NormalizedColumnsIndex)
+    catalog.ensure_index("bm25", Bm25Index)
+    catalog.ensure_index("trigram_names", TrigramIndex)
+    catalog.ensure_index("product_resolver", ProductResolverIndex)
+    catalog.ensure_index("autocomplete", PrefixIndex)
+    catalog.ensure_index("spelling", lambda: SymSpellIndex(max_edit_distance=search_max_edit_distance()))
+    catalog.ensure_index("tfidf", TfidfVectorIndex).build()
+    ensure_cooccurrence_index()
+
+
+def suggest_completions(text: str):
+    """Sugerencias de autocompletado para la GUI (vacías hasta que el warm-up construye el índice)."""
+    from src.utils.prefix_index import catalog_suggestions
+
+    return catalog_suggestions(text)
+
+
+class AgentWarmup:
+    """
+    Prepara el agente en un hilo en segundo plano: importa los módulos pesados, compila el
+    grafo, carga los datos y construye los índices. `ready` se activa al terminar (con éxito
+    o con error en `error`), y `timings` guarda la duración de cada paso.
+
+    Con `session_id` el grafo usa un `SqliteCheckpointer` en `db_path`. Si la sesión ya
+    existe se reanuda (`resumed`): el estado sale de la base de datos y no se vuelven a
+    cargar las wishlists ni los carritos; `agent_state` queda en None.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, db_path: Optional[str] = None):
+        self.ready = threading.Event()
+        self.timings: Dict[str, float] = {}
+        self.agent_app: Optional[Callable] = None
+        self.agent_state: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self.session_id = session_id
+        self.db_path = db_path
+        self.session_config: Optional[Dict[str, Any]] = (
+            {"configurable": {"thread_id": session_id}} if session_id else None
+        )
+        self.resumed = False
+        self._thread = threading.Thread(target=self._run, name="agent-warmup", daemon=True)
+
+    def start(self) -> "AgentWarmup":
+        self._thread.start()
+        return self
+
+    def run_blocking(self) -> "AgentWarmup":
+        """Ejecuta el warm-up en el hilo actual (modo de arranque clásico)."""
+        self._run()
+        return self
+
+    def _timed(self, step: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = fn()
+        self.timings[step] = time.perf_counter() - start
+        return result
+
+    def _run(self) -> None:
+        try:
+            # 1. Crear el grafo del agente (núcleo lógico LangGraph).
+            graph_module = timed_import("src.agent.graph", self.timings)
+            checkpointer = self._timed("abrir sesiones", self._open_checkpointer) if self.session_id else None
+            self.agent_app = self._timed("compilar grafo", lambda: graph_module.create_graph(checkpointer=checkpointer))
+            # 2-3. Estado inicial con los datos simulados (o reanudación de la sesión guardada).
+            if checkpointer is not None and checkpointer.has_session(self.session_id):
+                self.resumed = True
+                print(f"Reanudando la sesión '{self.session_id}' desde {checkpointer.db_path}.")
+                from src.utils.catalog_store import get_catalog_store
+                self._timed("cargar catálogo", get_catalog_store().ensure_loaded)
+            else:
+                self.agent_state = self._timed("cargar datos", build_initial_agent_state)
+            # Índices de búsqueda/matching, para que la primera consulta no pague su construcción.
+            self._timed("construir índices", build_search_indexes)
+        except Exception as e:
+            print(f"💥 Error preparando el agente: {e}")
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def _open_checkpointer(self):
+        from src.utils.sqlite_checkpointer import DEFAULT_SESSION_DB, SqliteCheckpointer
+
+        checkpointer = SqliteCheckpointer(self.db_path or os.getenv("AGENT_SESSION_DB", DEFAULT_SESSION_DB))
+        removed = checkpointer.prune_inactive(SESSION_MAX_AGE_SECONDS)
+        if removed:
+            print(f"Eliminadas {len(removed)} sesiones inactivas.")
+        checkpointer.prune([self.session_id], keep_last=SESSION_CHECKPOINTS_TO_KEEP)
+        return checkpointer
+
+
+def run_gui_agent(fast_startup: bool = True, session_id: Optional[str] = "default"):
+    """
+    Inicializa y ejecuta el agente de compras conversacional con una interfaz gráfica Tkinter.
+
+    Esta función se encarga de:
+    1. Crear el grafo lógico del agente.
+    2. Definir el estado inicial del agente, incluyendo datos de ejemplo y perfil de usuario.
+    3. Cargar datos simulados (catálogo de productos, wishlists de redes sociales, etc.).
+    4. Instanciar y lanzar la aplicación de interfaz gráfica (ChatApplication).
+
+    Con `fast_startup` (por defecto) la ventana se muestra primero y los pasos 1-3 corren en
+    un hilo en segundo plano (`AgentWarmup`); el chat habilita la entrada cuando terminan.
+
+    La conversación se guarda bajo `session_id` y se reanuda al volver a abrir la aplicación
+    con el mismo ID. Con `session_id=None` no se persiste nada.
+    """
+    print("🚀 Iniciando Agente de Compras Conversacional con GUI 🚀")
+    process_start = time.perf_counter()
+
+    warmup = AgentWarmup(session_id=session_id)
+    # Se mira antes de lanzar el warm-up: después, sus propios imports darían falsos positivos.
+    heavy = loaded_heavy_modules() if fast_startup else []
+    if fast_startup:
+        warmup.start()
+    else:
+        warmup.run_blocking()
 
     # 4. Configurar y lanzar la aplicación GUI.
-    # Se crea la ventana principal de Tkinter y se instancia ChatApplication.
     root = tk.Tk()
-    # Se pasa el grafo del agente (agent_logic_app) y el estado inicial a la GUI.
-    gui_app = ChatApplication(root, agent_app=agent_logic_app, initial_agent_state=initial_agent_state)
+    gui_app = ChatApplication(root, autocomplete=suggest_completions)
+    root.update_idletasks()
+    warmup.timings["mostrar ventana"] = time.perf_counter() - process_start
+    print(f"Ventana visible en {warmup.timings['mostrar ventana'] * 1000:.0f} ms"
+          + (f" (ADVERTENCIA: módulos pesados ya cargados: {', '.join(heavy)})" if heavy else ""))
+
+    def poll_warmup():
+        # Tkinter no es thread-safe: el hilo de warm-up solo activa `ready` y aquí, en el
+        # hilo de la GUI, se conecta el agente.
+        if not warmup.ready.is_set():
+            root.after(50, poll_warmup)
+            return
+        print(format_startup_report(warmup.timings))
+        if warmup.error is not None or warmup.agent_app is None:
+            gui_app.add_message_to_chat("🤖 Agente (Error):", "No pude preparar el agente. Revisa la consola.", is_error=True)
+            return
+        gui_app.attach_agent(warmup.agent_app, warmup.agent_state, warmup.session_config)
+
+    poll_warmup()
 
     print("✨ Iniciando interfaz gráfica... Por favor, interactúa con la ventana de chat. ✨")
     # root.mainloop() inicia el bucle de eventos de Tkinter, mostrando la GUI
     # y esperando la interacción del usuario. Esta llamada es bloqueante.
     root.mainloop()
 
+    from src.utils.llm_accounting import llm_ledger
+    print(llm_ledger.report())
     print("\n✨ Sesión de Agente Conversacional con GUI Finalizada. ¡Hasta pronto! ✨")
 
 
 if __name__ == "__main__":
     # Este bloque se ejecuta cuando el script es llamado directamente (ej: python src/main.py).
-    # Llama a la función principal para iniciar la aplicación.
-    run_gui_agent()
+    # `--eager-startup` restaura el arranque clásico (todo se carga antes de mostrar la ventana).
+    # `--session <id>` elige la sesión a reanudar y `--no-session` desactiva la persistencia.
+    args = sys.argv[1:]
+    session = args[args.index("--session") + 1] if "--session" in args[:-1] else "default"
+    run_gui_agent(
+        fast_startup="--eager-startup" not in args,
+        session_id=None if "--no-session" in args else session,
+    )
@@ -0,0 +1,148 @@
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.vector_index import tokenize
+
+# Peso de cada campo al construir el "documento" BM25 de un producto.
+DEFAULT_BM25_FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "description": 1.0}
+
+# Largo mínimo de un término que no está en el vocabulario para buscarlo como prefijo ("smart", "cafet").
+MIN_PREFIX_LENGTH = 3
+
+
+class Bm25Index:
+    """
+    Índice invertido BM25 sobre nombre, etiquetas y descripción de los productos.
+
+    Guarda, por término, la frecuencia (ponderada por campo) en cada producto, y por producto
+    la longitud de su documento. Todas las estadísticas (número de documentos, longitud media)
+    se mantienen de forma incremental, por lo que los deltas del catálogo no requieren
+    reconstruir el índice.
+
+    Implementa el protocolo de índices de `CatalogStore` (`rebuild`, `upsert`, `remove`).
+    """
+
+    def __init__(self, field_weights: Optional[Dict[str, float]] = None, k1: float = 1.2, b: float = 0.75):
+        self.field_weights = field_weights or DEFAULT_BM25_FIELD_WEIGHTS
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0.0
+        self._sorted_terms: Optional[List[str]] = None # Vocabulario ordenado, para los prefijos
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._products = {}
+        self._total_length = 0.0
+        self._sorted_terms = None
+        for product in products:
+            self.upsert(product)
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        self.remove(product_id)
+        term_frequencies: Dict[str, float] = defaultdict(float)
+        for field, weight in self.field_weights.items():
+            value = product.get(field)
+            if not value:
+                continue
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for term in tokenize(text):
+                term_frequencies[term] += weight
+        length = sum(term_frequencies.values())
+        self._doc_terms[product_id] = dict(term_frequencies)
+        self._doc_lengths[product_id] = length
+        self._products[product_id] = product
+        self._total_length += length
+        for term, frequency in term_frequencies.items():
+            if term not in self._postings:
+                self._sorted_terms = None
+            self._postings[term][product_id] = frequency
+
+    def remove(self, product_id: str) -> None:
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(product_id, 0.0)
+        self._products.pop(product_id, None)
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(product_id, None)
+                if not posting:
+                    del self._postings[term]
+                    self._sorted_terms = None
+
+    def has_term(self, term: str) -> bool:
+        """Indica si el término normalizado aparece en algún producto."""
+        return term in self._postings
+
+    def terms_with_prefix(self, prefix: str) -> List[str]:
+        """Términos del vocabulario que empiezan por `prefix` (vacío si es más corto que `MIN_PREFIX_LENGTH`)."""
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return []
+        sorted_terms = self._sorted_terms
+        if sorted_terms is None:
+            sorted_terms = self._sorted_terms = sorted(self._postings)
+        matches = []
+        for position in range(bisect_left(sorted_terms, prefix), len(sorted_terms)):
+            if not sorted_terms[position].startswith(prefix):
+                break
+            matches.append(sorted_terms[position])
+        return matches
+
+    def _posting_for(self, term: str) -> Optional[Dict[str, float]]:
+        """
+        Postings del término; si no está en el vocabulario, la unión de los términos que
+        empiezan por él (las palabras a medio escribir, como "smart" o "cafet", siguen
+        encontrando "smartphone" o "cafetera").
+        """
+        posting = self._postings.get(term)
+        if posting:
+            return posting
+        merged: Dict[str, float] = defaultdict(float)
+        for expansion in self.terms_with_prefix(term):
+            for product_id, frequency in list(self._postings.get(expansion, {}).items()):
+                merged[product_id] += frequency
+        return merged or None
+
+    def iter_matches(self, query: str) -> Iterator[Tuple[Dict[str, Any], float]]:
+        """
+        Genera los productos que contienen *todos* los términos de la consulta junto con su
+        puntuación BM25. Un término que no está en el vocabulario se busca como prefijo
+        (ver `_posting_for`). Solo recorre la lista de postings más corta y verifica el resto por
+        búsqueda en diccionario, así que el coste depende del número de coincidencias y no
+        del tamaño del catálogo.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return
+        postings = [self._posting_for(term) for term in terms]
+        if any(not posting for posting in postings):
+            return
+
+        n_docs = len(self._doc_lengths)
+        avg_length = (self._total_length / n_docs) if n_docs else 1.0
+        idfs = [math.log(1.0 + (n_docs - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+        ordered = sorted(zip(postings, idfs), key=lambda pair: len(pair[0]))
+        shortest, rest = ordered[0], ordered[1:]
+
+        for product_id in list(shortest[0]): # Copia: el catálogo puede recibir deltas en paralelo
+            product = self._products.get(product_id)
+            if product is None or not all(product_id in posting for posting, _ in rest):
+                continue
+            length_norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths.get(product_id, 0.0) / (avg_length or 1.0))
+            score = 0.0
+            for posting, idf in ordered:
+                frequency = posting.get(product_id, 0.0)
+                score += idf * frequency * (self.k1 + 1.0) / (frequency + length_norm)
+            yield product, score
@@ -0,0 +1,180 @@
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.utils import data_loader
+
+
+class CatalogStore:
+    """
+    Catálogo del marketplace en memoria con soporte para actualizaciones incrementales (deltas).
+
+    Mantiene la lista de productos, un mapa `id -> posición` para accesos O(1) y un conjunto
+    de índices registrados (búsqueda, matching, etc.) que se actualizan en el mismo paso que
+    el catálogo. Cada cambio incrementa `version`, que los cachés dependientes comparan para
+    saber si sus entradas siguen siendo válidas.
+
+    Es el único dueño del catálogo: los nodos del grafo y las herramientas lo consultan a
+    través de `get_catalog_store()` y el estado del agente solo guarda `catalog_version`.
+    Para ellos es de solo lectura; los cambios entran únicamente por `load` y `apply_delta`.
+    La lista de productos se modifica *en el lugar*, así que cualquier referencia a `products`
+    ve el precio y stock actualizados sin recargar el JSON.
+
+    Un índice registrado es cualquier objeto que implemente:
+        - `rebuild(products)`: reconstrucción completa (tras `load`).
+        - `upsert(product)`: alta o modificación de un producto.
+        - `remove(product_id)`: baja de un producto.
+    """
+
+    def __init__(self, products: Optional[List[Dict[str, Any]]] = None):
+        self._products: List[Dict[str, Any]] = []
+        self._id_to_position: Dict[str, int] = {}
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.version = 0
+        if products:
+            self.load(products)
+
+    @property
+    def products(self) -> List[Dict[str, Any]]:
+        """Lista de productos del catálogo (la misma instancia entre deltas)."""
+        return self._products
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._id_to_position
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna el producto con el ID dado, o None si no existe."""
+        position = self._id_to_position.get(product_id)
+        return self._products[position] if position is not None else None
+
+    def load(self, products: Iterable[Dict[str, Any]]) -> None:
+        """
+        Carga completa del catálogo. Reemplaza el contenido (manteniendo la misma lista)
+        y reconstruye el mapa de IDs y todos los índices registrados.
+        """
+        with self._lock:
+            self._products[:] = [p for p in products if p.get('id') is not None]
+            self._id_to_position = {p['id']: i for i, p in enumerate(self._products)}
+            for index in self._indexes.values():
+                index.rebuild(self._products)
+            self.version += 1
+
+    def load_from_file(self, data_path: str = "data/marketplace_products.json") -> bool:
+        """Carga el catálogo desde el JSON del marketplace. Retorna False si no se pudo cargar."""
+        products = data_loader.get_marketplace_products(data_path)
+        if products is None:
+            return False
+        self.load(products)
+        return True
+
+    def ensure_loaded(self, data_path: str = "data/marketplace_products.json") -> bool:
+        """
+        Carga el catálogo desde el JSON solo si el store está vacío. Permite que varios
+        nodos o sesiones lo pidan sin recargarlo cada vez.
+        """
+        with self._lock:
+            if self._products:
+                return True
+            return self.load_from_file(data_path)
+
+    def apply_delta(
+        self,
+        upserts: Optional[Iterable[Dict[str, Any]]] = None,
+        deletes: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Aplica un lote de cambios al catálogo sin recargarlo completo.
+
+        Args:
+            upserts: Productos nuevos o cambios parciales. Cada elemento debe incluir `id`;
+                     si el producto ya existe, solo se sobrescriben los campos enviados
+                     (ej: `{"id": "MP001", "price": 749.99, "stock": 12}`).
+            deletes: IDs de productos a eliminar del catálogo.
+
+        Returns:
+            Un resumen con las claves `inserted`, `updated`, `deleted`, `skipped` y la nueva `version`.
+        """
+        summary = {"inserted": 0, "updated": 0, "deleted": 0, "skipped": 0}
+        with self._lock:
+            for change in upserts or []:
+                product_id = change.get('id')
+                if product_id is None:
+                    summary["skipped"] += 1
+                    continue
+                position = self._id_to_position.get(product_id)
+                if position is None:
+                    product = dict(change)
+                    self._id_to_position[product_id] = len(self._products)
+                    self._products.append(product)
+                    summary["inserted"] += 1
+                else:
+                    product = self._products[position]
+                    product.update(change)
+                    summary["updated"] += 1
+                for index in self._indexes.values():
+                    index.upsert(product)
+
+            for product_id in deletes or []:
+                position = self._id_to_position.pop(product_id, None)
+                if position is None:
+                    summary["skipped"] += 1
+                    continue
+                # Borrado O(1): el último producto ocupa la posición del eliminado.
+                last_product = self._products.pop()
+                if position < len(self._products):
+                    self._products[position] = last_product
+                    self._id_to_position[last_product['id']] = position
+                for index in self._indexes.values():
+                    index.remove(product_id)
+                summary["deleted"] += 1
+
+            if summary["inserted"] or summary["updated"] or summary["deleted"]:
+                self.version += 1
+            summary["version"] = self.version
+        return summary
+
+    def register_index(self, name: str, index: Any) -> Any:
+        """Registra un índice derivado del catálogo y lo construye con el contenido actual."""
+        with self._lock:
+            index.rebuild(self._products)
+            self._indexes[name] = index
+        return index
+
+    def get_index(self, name: str) -> Optional[Any]:
+        """Retorna el índice registrado con ese nombre, o None."""
+        return self._indexes.get(name)
+
+    def ensure_index(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Retorna el índice `name`, registrándolo con `factory()` la primera vez."""
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None:
+                index = self.register_index(name, factory())
+            return index
+
+
+_default_store = CatalogStore()
+
+
+def get_catalog_store() -> CatalogStore:
+    """Retorna el catálogo compartido por el proceso (grafo, herramientas y GUI)."""
+    return _default_store
+
+
+def index_for(products: List[Dict[str, Any]], name: str, factory: Callable[[], Any]) -> Any:
+    """
+    Retorna el índice `name` para la lista `products`.
+
+    Si `products` es la lista del catálogo compartido, se usa (o se registra una vez) el índice
+    mantenido por el store, que los deltas actualizan en el lugar. Para cualquier otra lista
+    (ej: datos de prueba) se construye un índice temporal con `factory`.
+    """
+    store = get_catalog_store()
+    if products is store.products:
+        return store.ensure_index(name, factory)
+    index = factory()
+    index.rebuild(products)
+    return index
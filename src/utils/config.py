@@ -1,6 +1,11 @@
 import os
+import threading
+from typing import TYPE_CHECKING, Dict, Tuple
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
+
+if TYPE_CHECKING:
+    # langchain_openai tarda casi un segundo en importarse: solo se carga al crear el LLM.
+    from langchain_openai import ChatOpenAI
 
 def load_api_key():
     """Carga la API key de OpenAI desde el archivo .env."""
@@ -13,9 +18,15 @@ def load_api_key():
         )
     return api_key
 
-def get_llm(temperature: float = 0.0, model_name: str = None) -> ChatOpenAI:
+# Un cliente por (modelo, temperatura): todas las sesiones y nodos comparten la instancia y,
+# con ella, el pool de conexiones HTTP del cliente de OpenAI.
+_llm_pool: Dict[Tuple[str, float], "ChatOpenAI"] = {}
+_llm_pool_lock = threading.Lock()
+
+def get_llm(temperature: float = 0.0, model_name: str = None) -> "ChatOpenAI":
     """
-    Inicializa y retorna una instancia del LLM de OpenAI.
+    Retorna la instancia compartida del LLM de OpenAI para ese modelo y temperatura,
+    creándola la primera vez.
 
     Args:
         temperature: La temperatura para la generación del LLM.
@@ -31,14 +42,55 @@ def get_llm(temperature: float = 0.0, model_name: str = None) -> ChatOpenAI:
     if model_name is None:
         model_name = os.getenv("OPENAI_MODEL_NAME", "gpt-4o-mini") # Default a gpt-4o-mini si no está en .env
 
-    llm = ChatOpenAI(
-        openai_api_key=api_key,
-        model_name=model_name,
-        temperature=temperature
-    )
-    print(f"LLM inicializado con el modelo: {llm.model_name}, Temperatura: {temperature}")
+    key = (model_name, float(temperature))
+    with _llm_pool_lock:
+        llm = _llm_pool.get(key)
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(
+                openai_api_key=api_key,
+                model_name=model_name,
+                temperature=temperature,
+                max_retries=0 # Los reintentos (con backoff y circuito) los gestiona el LlmScheduler
+            )
+            _llm_pool[key] = llm
+            print(f"LLM inicializado con el modelo: {llm.model_name}, Temperatura: {temperature}")
     return llm
 
+def compact_prompts_enabled() -> bool:
+    """
+    Modo de prompts compactos (por defecto activo): el LLM recibe solo los campos relevantes
+    en JSON minificado y devuelve solo lo que extrae; los datos originales se reincorporan
+    localmente. `LLM_COMPACT_PROMPTS=0` vuelve a los prompts completos.
+    """
+    return os.getenv("LLM_COMPACT_PROMPTS", "1").strip().lower() not in ("0", "false", "no")
+
+def speculative_search_enabled() -> bool:
+    """
+    Búsqueda especulativa (por defecto activa): mientras el LLM detecta la intención de un
+    mensaje, el catálogo ya se consulta con la frase candidata. `SPECULATIVE_SEARCH=0` la desactiva.
+    """
+    return os.getenv("SPECULATIVE_SEARCH", "1").strip().lower() not in ("0", "false", "no")
+
+def speculative_search_workers() -> int:
+    """
+    Hilos para las búsquedas especulativas de todas las sesiones (`SPECULATIVE_SEARCH_WORKERS`,
+    por defecto el número de CPUs: la búsqueda es CPU y más hilos no la aceleran). Cuando están
+    todos ocupados, la especulación de un mensaje se omite en lugar de encolarse.
+    """
+    value = os.getenv("SPECULATIVE_SEARCH_WORKERS", "").strip()
+    return int(value) if value.isdigit() and int(value) > 0 else (os.cpu_count() or 2)
+
+def search_max_edit_distance() -> int:
+    """
+    Máximo de ediciones (letras cambiadas, agregadas, borradas o transpuestas) que se corrigen
+    en cada palabra de una búsqueda (`SEARCH_MAX_EDIT_DISTANCE`, por defecto 2). 0 desactiva
+    la corrección ortográfica.
+    """
+    value = os.getenv("SEARCH_MAX_EDIT_DISTANCE", "2").strip()
+    return int(value) if value.isdigit() else 2
+
 if __name__ == "__main__":
     try:
         # Prueba de carga de API key y LLM
@@ -0,0 +1,54 @@
+from typing import List, Optional, Sequence, Tuple
+
+# Entradas (speaker, text) que se conservan literalmente. El prompt de intención usa los
+# últimos 3 turnos (6 entradas); se guarda algo más de margen para la GUI.
+HISTORY_MAX_ENTRIES = 12
+# Longitud máxima del resumen acumulado de los turnos que salen del historial.
+SUMMARY_MAX_CHARS = 400
+# Longitud máxima de cada mensaje del usuario al incorporarlo al resumen.
+SUMMARY_CLAUSE_MAX_CHARS = 80
+_CLAUSE_SEPARATOR = "; "
+
+Turn = Tuple[str, str]
+
+
+def bounded_append(current: Optional[Sequence[Turn]], update: Optional[Sequence[Turn]],
+                   max_entries: int = HISTORY_MAX_ENTRIES) -> List[Turn]:
+    """
+    Agrega `update` al historial y conserva solo las últimas `max_entries` entradas. Como el
+    historial nunca supera ese tamaño, el coste de copia por turno es constante.
+    """
+    merged = list(current or [])
+    if update:
+        merged.extend(update)
+    return merged[-max_entries:] if len(merged) > max_entries else merged
+
+
+def evicted_entries(current: Optional[Sequence[Turn]], update: Optional[Sequence[Turn]],
+                    max_entries: int = HISTORY_MAX_ENTRIES) -> List[Turn]:
+    """Entradas que `bounded_append(current, update)` descartará (las más antiguas)."""
+    current = current or []
+    overflow = len(current) + len(update or []) - max_entries
+    if overflow <= 0:
+        return []
+    return (list(current) + list(update or []))[:overflow]
+
+
+def fold_into_summary(summary: Optional[str], evicted: Sequence[Turn],
+                      max_chars: int = SUMMARY_MAX_CHARS) -> Optional[str]:
+    """
+    Incorpora al resumen los mensajes del usuario que salen del historial. Es un resumen
+    extractivo local (sin LLM): cada mensaje se recorta y, si el resumen excede
+    `max_chars`, se descartan primero las frases más antiguas.
+    """
+    clauses = summary.split(_CLAUSE_SEPARATOR) if summary else []
+    for speaker, text in evicted:
+        if speaker != "user" or not text or not text.strip():
+            continue
+        clause = " ".join(text.split())
+        if len(clause) > SUMMARY_CLAUSE_MAX_CHARS:
+            clause = clause[:SUMMARY_CLAUSE_MAX_CHARS - 1].rstrip() + "…"
+        clauses.append(clause.replace(_CLAUSE_SEPARATOR, ", "))
+    while clauses and len(_CLAUSE_SEPARATOR.join(clauses)) > max_chars:
+        clauses.pop(0)
+    return _CLAUSE_SEPARATOR.join(clauses) or None
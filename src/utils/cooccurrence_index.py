@@ -0,0 +1,126 @@
+import heapq
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.utils import data_loader
+
+# Peso de cada señal: un carrito es intención de compra; un tablero de Pinterest, afinidad.
+CART_WEIGHT = 1.0
+BOARD_WEIGHT = 0.5
+# Un carrito o tablero enorme aporta O(n²) pares y poca información; se recorta.
+MAX_BASKET_ITEMS = 50
+
+_PRODUCT_LINK = re.compile(r"/products/([^/?#]+)")
+
+
+def product_id_from_pin(pin: Dict[str, Any]) -> Optional[str]:
+    """ID de producto enlazado por un pin (`.../products/<id>`), o None."""
+    match = _PRODUCT_LINK.search(pin.get('link') or "")
+    return match.group(1) if match else None
+
+
+class CoOccurrenceIndex:
+    """
+    Matriz dispersa de co-ocurrencia de productos ("se compran juntos").
+
+    Cada carrito (o tablero) es una canasta: todos sus pares de productos suman `weight`.
+    La matriz se guarda por filas (`producto -> {vecino: peso}`) y cada fila se poda a los
+    mejores vecinos al superar `max_candidates`, así la memoria queda acotada por
+    O(productos × max_candidates) sin importar cuántas líneas de carrito se procesen. La
+    poda es aproximada (un vecino descartado vuelve a contar desde cero), suficiente para
+    recomendaciones.
+
+    `frequently_together` retorna los `top_n` vecinos ya ordenados; la lista se calcula una
+    vez por fila y se reutiliza hasta que la fila cambia.
+    """
+
+    def __init__(self, top_n: int = 10, max_candidates: Optional[int] = None):
+        self.top_n = top_n
+        self.max_candidates = max_candidates or top_n * 4
+        self._rows: Dict[str, Dict[str, float]] = {}
+        self._top: Dict[str, List[Tuple[str, float]]] = {}
+        self._lock = threading.Lock()
+        self.baskets = 0
+        self.built = False
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add_basket(self, product_ids: Iterable[str], weight: float = CART_WEIGHT) -> None:
+        """Suma una canasta (productos repetidos cuentan una sola vez)."""
+        ids = list(dict.fromkeys(pid for pid in product_ids if pid))[:MAX_BASKET_ITEMS]
+        if len(ids) < 2:
+            return
+        with self._lock:
+            self.baskets += 1
+            for product_id in ids:
+                row = self._rows.setdefault(product_id, {})
+                for other_id in ids:
+                    if other_id != product_id:
+                        row[other_id] = row.get(other_id, 0.0) + weight
+                if len(row) > self.max_candidates:
+                    self._prune(product_id, row)
+                self._top.pop(product_id, None)
+
+    def _prune(self, product_id: str, row: Dict[str, float]) -> None:
+        keep = heapq.nlargest(self.top_n * 2, row.items(), key=lambda item: item[1])
+        self._rows[product_id] = dict(keep)
+
+    def add_carts(self, carts: Iterable[Dict[str, Any]], weight: float = CART_WEIGHT) -> None:
+        """Agrega los carritos (formato de `abandoned_carts.json`), uno por canasta."""
+        for cart in carts or []:
+            self.add_basket((item.get('product_id') for item in cart.get('items', [])), weight)
+
+    def add_pinterest_boards(
+        self,
+        pinterest_data: Optional[Dict[str, Any]],
+        resolve: Callable[[Dict[str, Any]], Optional[str]] = product_id_from_pin,
+        weight: float = BOARD_WEIGHT
+    ) -> None:
+        """Agrega los tableros de Pinterest; `resolve` obtiene el ID de producto de cada pin."""
+        for board in (pinterest_data or {}).get('boards', []):
+            self.add_basket((resolve(pin) for pin in board.get('pins', [])), weight)
+
+    def frequently_together(self, product_id: str, k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Vecinos de `product_id` como `(id, peso)`, del más al menos frecuente."""
+        top = self._top.get(product_id)
+        if top is None:
+            with self._lock:
+                row = self._rows.get(product_id, {})
+                top = heapq.nlargest(self.top_n, row.items(), key=lambda item: (item[1], item[0]))
+                self._top[product_id] = top
+        return top[:k] if k is not None else top
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            self._top.clear()
+            self.baskets = 0
+            self.built = False
+
+
+_default_index = CoOccurrenceIndex()
+_build_lock = threading.Lock()
+
+
+def get_cooccurrence_index() -> CoOccurrenceIndex:
+    """Índice de co-ocurrencias compartido por el proceso (planificador y búsqueda)."""
+    return _default_index
+
+
+def ensure_cooccurrence_index(
+    carts: Optional[List[Dict[str, Any]]] = None,
+    pinterest_data: Optional[Dict[str, Any]] = None
+) -> CoOccurrenceIndex:
+    """
+    Construye el índice compartido si está vacío, con los datos dados o, si faltan, con los
+    JSON de `data/`. Como `CatalogStore.ensure_loaded`, varias llamadas no lo reconstruyen.
+    """
+    index = get_cooccurrence_index()
+    with _build_lock:
+        if not index.built:
+            index.add_carts(carts if carts is not None else data_loader.get_abandoned_carts() or [])
+            index.add_pinterest_boards(pinterest_data if pinterest_data is not None else data_loader.get_pinterest_boards())
+            index.built = True
+    return index
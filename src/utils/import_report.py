@@ -0,0 +1,33 @@
+import sys
+import time
+from importlib import import_module
+from types import ModuleType
+from typing import Dict, List
+
+# Dependencias cuya importación cuesta cientos de milisegundos. No deben cargarse antes
+# de que la ventana de chat esté visible.
+HEAVY_MODULES = ("langgraph", "langchain_core", "langchain_openai", "pydantic")
+
+
+def loaded_heavy_modules() -> List[str]:
+    """Retorna cuáles de los `HEAVY_MODULES` ya están importados en el proceso."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def timed_import(module_name: str, timings: Dict[str, float]) -> ModuleType:
+    """
+    Importa `module_name` y registra en `timings` los segundos que tomó (0 si ya estaba cargado).
+    El tiempo incluye las dependencias que se importen por primera vez.
+    """
+    start = time.perf_counter()
+    module = import_module(module_name)
+    timings[f"import {module_name}"] = time.perf_counter() - start
+    return module
+
+
+def format_startup_report(timings: Dict[str, float]) -> str:
+    """Formatea los tiempos de arranque (de mayor a menor) como una tabla de texto."""
+    lines = ["--- Reporte de arranque (ms) ---"]
+    for step, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        lines.append(f"{seconds * 1000:9.1f}  {step}")
+    return "\n".join(lines)
@@ -0,0 +1,211 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Precio en USD por millón de tokens (entrada, salida). Se elige el prefijo más largo que
+# coincida con el modelo; LLM_PRICE_INPUT_PER_MTOK / LLM_PRICE_OUTPUT_PER_MTOK lo sobrescriben.
+MODEL_PRICES_PER_MTOK: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+DEFAULT_MODEL = "gpt-4o-mini"
+# Fracciones del presupuesto a las que se emite una alerta.
+BUDGET_ALERT_LEVELS = (0.8, 1.0)
+PROMPT_PREVIEW_CHARS = 120
+
+_attribution: contextvars.ContextVar[Dict[str, Optional[str]]] = contextvars.ContextVar("llm_attribution", default={})
+
+
+@contextmanager
+def llm_attribution(user_id: Optional[str] = None, session_id: Optional[str] = None) -> Iterator[None]:
+    """Atribuye las llamadas LLM hechas dentro del bloque a ese usuario y/o sesión."""
+    current = _attribution.get()
+    token = _attribution.set({
+        "user_id": user_id or current.get("user_id"),
+        "session_id": session_id or current.get("session_id"),
+    })
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def current_attribution() -> Dict[str, Optional[str]]:
+    """
+    Usuario y sesión de la llamada en curso. Dentro de un grafo de LangGraph se toman de la
+    configuración de la ejecución (`configurable.thread_id` / `configurable.user_id`); fuera,
+    o si faltan, de `llm_attribution`.
+    """
+    attribution = dict(_attribution.get())
+    try:
+        from langgraph.config import get_config
+        configurable = get_config().get("configurable", {})
+    except (ImportError, RuntimeError): # Fuera de una ejecución del grafo
+        configurable = {}
+    attribution["session_id"] = attribution.get("session_id") or configurable.get("thread_id")
+    attribution["user_id"] = attribution.get("user_id") or configurable.get("user_id")
+    return attribution
+
+
+def model_prices(model_name: Optional[str]) -> Tuple[float, float]:
+    if os.getenv("LLM_PRICE_INPUT_PER_MTOK") and os.getenv("LLM_PRICE_OUTPUT_PER_MTOK"):
+        return float(os.environ["LLM_PRICE_INPUT_PER_MTOK"]), float(os.environ["LLM_PRICE_OUTPUT_PER_MTOK"])
+    model_name = model_name or os.getenv("OPENAI_MODEL_NAME", DEFAULT_MODEL)
+    matches = [prefix for prefix in MODEL_PRICES_PER_MTOK if model_name.startswith(prefix)]
+    return MODEL_PRICES_PER_MTOK[max(matches, key=len) if matches else DEFAULT_MODEL]
+
+
+class LlmUsageCollector(BaseCallbackHandler):
+    """Callback de LangChain que recoge los tokens que reporta el proveedor en una llamada."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.model_name: Optional[str] = None
+        self.reported = False
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        llm_output = response.llm_output or {}
+        self.model_name = llm_output.get("model_name") or self.model_name
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.prompt_tokens += usage.get("input_tokens", 0)
+                    self.completion_tokens += usage.get("output_tokens", 0)
+                    self.reported = True
+                    return
+        token_usage = llm_output.get("token_usage") or {}
+        if token_usage:
+            self.prompt_tokens += token_usage.get("prompt_tokens", 0)
+            self.completion_tokens += token_usage.get("completion_tokens", 0)
+            self.reported = True
+
+
+def _empty_totals() -> Dict[str, float]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "estimated_calls": 0}
+
+
+class TokenLedger:
+    """
+    Contabilidad de tokens y coste de las llamadas LLM.
+
+    Cada llamada se suma a los totales por etapa (`stage`: intent_detection,
+    wishlist_analysis, purchase_advice...), por usuario y por sesión. Si el proveedor no
+    reporta el uso, los tokens se estiman localmente y la llamada cuenta como estimada.
+
+    `budgets` fija un máximo de tokens por clave para cada dimensión (ej:
+    `{"session": 50_000}`); al cruzar el 80% y el 100% se imprime una alerta y se agrega a
+    `alerts`. Las alertas no bloquean llamadas. También se guardan las `top_k` llamadas más
+    caras con un extracto del prompt, para `report()`.
+    """
+
+    DIMENSIONS = ("stage", "user", "session")
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, top_k: int = 10):
+        self.budgets = {k: v for k, v in (budgets or {}).items() if v}
+        self.top_k = top_k
+        self.totals: Dict[str, Dict[str, Dict[str, float]]] = {dim: {} for dim in self.DIMENSIONS}
+        self.alerts: List[str] = []
+        self._alerted: set = set()
+        self._top: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, prompt_tokens: int, completion_tokens: int, model_name: Optional[str] = None,
+               user_id: Optional[str] = None, session_id: Optional[str] = None, estimated: bool = False,
+               prompt_preview: str = "") -> Dict[str, Any]:
+        """Registra una llamada y retorna su entrada (tokens, coste y atribución)."""
+        input_price, output_price = model_prices(model_name)
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        entry = {
+            "stage": stage, "user": user_id, "session": session_id, "model": model_name,
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "cost_usd": cost, "estimated": estimated, "prompt": prompt_preview[:PROMPT_PREVIEW_CHARS],
+        }
+        with self._lock:
+            for dim in self.DIMENSIONS:
+                key = entry[dim]
+                if key is None:
+                    continue
+                totals = self.totals[dim].setdefault(key, _empty_totals())
+                totals["calls"] += 1
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost_usd"] += cost
+                totals["estimated_calls"] += int(estimated)
+                self._check_budget(dim, key, totals["prompt_tokens"] + totals["completion_tokens"])
+            item = (cost, next(self._sequence), entry)
+            if len(self._top) < self.top_k:
+                heapq.heappush(self._top, item)
+            elif item[:2] > self._top[0][:2]:
+                heapq.heapreplace(self._top, item)
+        return entry
+
+    def _check_budget(self, dim: str, key: str, used: float) -> None:
+        budget = self.budgets.get(dim)
+        if not budget:
+            return
+        for level in BUDGET_ALERT_LEVELS:
+            if used >= budget * level and (dim, key, level) not in self._alerted:
+                self._alerted.add((dim, key, level))
+                message = f"Presupuesto LLM de {dim} '{key}': {used:.0f}/{budget} tokens ({level:.0%})."
+                self.alerts.append(message)
+                print(f"ADVERTENCIA: {message}")
+
+    def most_expensive(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            ranked = sorted(self._top, key=lambda item: item[:2], reverse=True)
+        return [entry for _, _, entry in ranked[:limit]]
+
+    def report(self, limit: int = 5) -> str:
+        """Reporte legible: totales por etapa, usuario y sesión, y las llamadas más caras."""
+        lines = ["--- Consumo de tokens LLM ---"]
+        with self._lock:
+            totals = {dim: {key: dict(values) for key, values in by_key.items()} for dim, by_key in self.totals.items()}
+        for dim in self.DIMENSIONS:
+            if not totals[dim]:
+                continue
+            lines.append(f"Por {dim}:")
+            for key, values in sorted(totals[dim].items(), key=lambda kv: kv[1]["cost_usd"], reverse=True):
+                estimated = f", {values['estimated_calls']} estimadas" if values["estimated_calls"] else ""
+                lines.append(f"  {key}: {values['calls']} llamadas, {values['prompt_tokens']} + {values['completion_tokens']} tokens, "
+                             f"${values['cost_usd']:.4f}{estimated}")
+        expensive = self.most_expensive(limit)
+        if expensive:
+            lines.append("Prompts más caros:")
+            for entry in expensive:
+                lines.append(f"  ${entry['cost_usd']:.5f} [{entry['stage']}] {entry['prompt_tokens']}+{entry['completion_tokens']} tokens: "
+                             f"{' '.join(entry['prompt'].split())}")
+        if len(lines) == 1:
+            lines.append("Sin llamadas registradas.")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.totals = {dim: {} for dim in self.DIMENSIONS}
+            self.alerts.clear()
+            self._alerted.clear()
+            self._top.clear()
+
+
+def _budget_from_env(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value.isdigit() else None
+
+
+# Contabilidad del proceso. Presupuestos por clave: LLM_SESSION_TOKEN_BUDGET,
+# LLM_USER_TOKEN_BUDGET y LLM_STAGE_TOKEN_BUDGET.
+llm_ledger = TokenLedger(budgets={
+    "session": _budget_from_env("LLM_SESSION_TOKEN_BUDGET"),
+    "user": _budget_from_env("LLM_USER_TOKEN_BUDGET"),
+    "stage": _budget_from_env("LLM_STAGE_TOKEN_BUDGET"),
+})
@@ -0,0 +1,366 @@
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ensure_config, merge_configs
+
+from src.utils.llm_accounting import LlmUsageCollector, current_attribution, llm_ledger
+
+# Carriles de prioridad: un número menor se atiende antes. La detección de intención (el
+# usuario está esperando) adelanta al análisis de wishlist y a los consejos de compra.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Tokens de salida que se suponen por llamada al estimar su coste antes de hacerla.
+DEFAULT_OUTPUT_TOKENS = 256
+
+_RETRYABLE_ERROR_NAMES = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "ServiceUnavailableError", "Timeout", "TimeoutError", "ConnectTimeout", "ReadTimeout",
+}
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del proveedor LLM está abierto: la llamada no se intenta."""
+
+
+def estimate_tokens(payload: Any, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """Estimación rápida (~4 caracteres por token) de los tokens de una llamada."""
+    return len(str(payload)) // 4 + output_tokens
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Errores transitorios del proveedor (429, timeouts, 5xx) que vale la pena reintentar."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in _RETRYABLE_ERROR_NAMES or getattr(error, "status_code", None) in _RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Cubo de tokens con recarga continua de `per_minute` unidades por minuto."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` unidades (0 si ya las hay)."""
+        self._refill()
+        amount = min(amount, self.capacity) # Una petición más grande que el cubo igual debe poder pasar
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def set_rate(self, per_minute: float) -> None:
+        self._refill()
+        self.rate = per_minute / 60.0
+
+
+class LlmScheduler:
+    """
+    Planificador compartido de llamadas al LLM.
+
+    - Limita peticiones y tokens por minuto con dos cubos de tokens. Las llamadas esperan en
+      una cola por prioridad (`PRIORITY_INTERACTIVE` antes que `PRIORITY_BATCH`).
+    - Reintenta los errores transitorios con backoff exponencial con jitter. Ante un 429 baja
+      a la mitad la tasa de peticiones y la recupera poco a poco con cada éxito (AIMD).
+    - Tras `failure_threshold` llamadas fallidas seguidas abre el circuito: durante
+      `cooldown_seconds` las llamadas fallan de inmediato con `CircuitOpenError`, para que los
+      llamadores usen su lógica de respaldo. Luego deja pasar una llamada de prueba.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 90_000,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._requests = TokenBucket(requests_per_minute, clock)
+        self._tokens = TokenBucket(tokens_per_minute, clock)
+        self._current_rpm = float(requests_per_minute)
+        self._cond = threading.Condition()
+        self._queue: list = [] # heap de (prioridad, orden de llegada)
+        self._arrivals = itertools.count()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.stats: Dict[str, int] = {"calls": 0, "retries": 0, "rate_limited": 0, "rejected": 0, "circuit_opened": 0}
+
+    # --- Cola y cubos ---
+
+    def _acquire(self, tokens: int, priority: int) -> None:
+        ticket = (priority, next(self._arrivals))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = None # Sin turno: esperar a que avance la cola
+                    if self._queue[0] == ticket:
+                        wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                        if wait <= 0:
+                            self._requests.take(1)
+                            self._tokens.take(tokens)
+                            return
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    # --- Circuito ---
+
+    @property
+    def circuit_open(self) -> bool:
+        with self._cond:
+            return self._opened_at is not None and self._clock() - self._opened_at < self.cooldown_seconds
+
+    def _check_circuit(self) -> None:
+        with self._cond:
+            if self._opened_at is None:
+                return
+            if self._clock() - self._opened_at >= self.cooldown_seconds and not self._trial_in_flight:
+                self._trial_in_flight = True # Semiabierto: una sola llamada de prueba
+                return
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("Proveedor LLM no disponible temporalmente (circuito abierto).")
+
+    def _record_success(self) -> None:
+        with self._cond:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+            if self._current_rpm < self.requests_per_minute: # Recuperación aditiva de la tasa
+                self._current_rpm = min(self.requests_per_minute, self._current_rpm + self.requests_per_minute * 0.1)
+                self._requests.set_rate(self._current_rpm)
+
+    def _record_failure(self) -> None:
+        with self._cond:
+            self._consecutive_failures += 1
+            if self._trial_in_flight or self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_flight:
+                    self.stats["circuit_opened"] += 1
+                    print(f"ADVERTENCIA: Circuito LLM abierto por {self.cooldown_seconds:.0f}s tras {self._consecutive_failures} fallos.")
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def _throttle(self) -> None:
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            self._current_rpm = max(1.0, self._current_rpm / 2)
+            self._requests.set_rate(self._current_rpm)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Backoff exponencial con jitter: entre la mitad y el total de base * 2^intento."""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    # --- Llamadas ---
+
+    def run(self, fn: Callable[[], Any], priority: int = PRIORITY_BATCH, estimated_tokens: int = DEFAULT_OUTPUT_TOKENS) -> Any:
+        """
+        Ejecuta `fn` (una llamada al LLM) respetando los límites, la prioridad y el circuito.
+        Propaga el último error si se agotan los reintentos y `CircuitOpenError` si el
+        circuito está abierto.
+        """
+        self._check_circuit()
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimated_tokens, priority)
+            self.stats["calls"] += 1
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable_error(e):
+                    self._record_success() # El proveedor respondió: el fallo es de la petición
+                    raise
+                if is_rate_limit_error(e):
+                    self._throttle()
+                if attempt == self.max_retries:
+                    self._record_failure()
+                    raise
+                self.stats["retries"] += 1
+                delay = self.backoff_delay(attempt)
+                print(f"Llamada LLM falló ({type(e).__name__}); reintento {attempt + 1}/{self.max_retries} en {delay:.2f}s.")
+                self._sleep(delay)
+                continue
+            self._record_success()
+            return result
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas en curso: mientras una llamada con cierta huella
+    está en vuelo, las demás con la misma huella esperan y reciben su mismo resultado (o
+    su misma excepción) en lugar de repetir la petición. No es un caché: al terminar la
+    llamada la huella se libera.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.stats: Dict[str, int] = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                flight.followers += 1
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+def prompt_fingerprint(scope: str, payload: Dict[str, Any]) -> str:
+    """Huella estable de una llamada: ámbito (prompt/cadena) más el payload canónico."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{scope}\x00{canonical}".encode("utf-8")).hexdigest()
+
+
+def _chain_scope(chain: Any) -> str:
+    """
+    Ámbito de single-flight de una cadena (prompt | llm). Como la cadena se arma en cada
+    llamada, se identifica por su prompt, el modelo y la temperatura de cada LLM que contiene
+    y el tipo de salida (el esquema de `with_structured_output`). Así, dos llamadas con el
+    mismo prompt y payload pero distinto modelo o esquema nunca comparten resultado.
+    """
+    parts = [repr(getattr(chain, "first", None) or type(chain).__name__)]
+    for step in getattr(chain, "steps", None) or [chain]:
+        while step is not None: # Los bindings (tools, response_format) envuelven al LLM en `bound`
+            model_name = getattr(step, "model_name", None)
+            if model_name is not None:
+                parts.append(f"{model_name}@{getattr(step, 'temperature', None)}")
+                break
+            step = getattr(step, "bound", None)
+    try:
+        output_type = chain.OutputType
+    except Exception: # Cadenas de prueba sin tipo de salida
+        output_type = None
+    parts.append(f"{output_type.__module__}.{output_type.__qualname__}" if isinstance(output_type, type) else repr(output_type))
+    return "\x00".join(parts)
+
+
+_default_scheduler: Optional[LlmScheduler] = None
+_default_scheduler_lock = threading.Lock()
+llm_single_flight = SingleFlight()
+
+
+def get_llm_scheduler() -> LlmScheduler:
+    """Planificador del proceso. Los límites salen de LLM_REQUESTS_PER_MINUTE y LLM_TOKENS_PER_MINUTE."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LlmScheduler(
+                requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+                tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "90000")),
+            )
+        return _default_scheduler
+
+
+def _render_prompt(chain: Any, payload: Dict[str, Any]) -> str:
+    try:
+        return chain.first.invoke(payload).to_string()
+    except Exception: # Cadenas sin plantilla de prompt (o de prueba)
+        return str(payload)
+
+
+def _accounted_invoke(chain: Any, payload: Dict[str, Any], stage: str) -> Any:
+    """`chain.invoke(payload)` registrando sus tokens (reportados o estimados) en `llm_ledger`."""
+    usage = LlmUsageCollector()
+    if isinstance(chain, Runnable):
+        # Se suma el callback a la configuración en curso (la del grafo, si la hay) sin reemplazarla.
+        result = chain.invoke(payload, config=merge_configs(ensure_config(), {"callbacks": [usage]}))
+    else:
+        result = chain.invoke(payload)
+    prompt_text = _render_prompt(chain, payload)
+    if usage.reported:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        output = result.model_dump_json() if hasattr(result, "model_dump_json") else str(result)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt_text, 0), estimate_tokens(output, 0)
+    attribution = current_attribution()
+    llm_ledger.record(stage, prompt_tokens, completion_tokens, model_name=usage.model_name,
+                      user_id=attribution.get("user_id"), session_id=attribution.get("session_id"),
+                      estimated=not usage.reported, prompt_preview=prompt_text)
+    return result
+
+
+def invoke_llm_chain(chain: Any, payload: Dict[str, Any], priority: int = PRIORITY_BATCH,
+                     scheduler: Optional[LlmScheduler] = None, scope: Optional[str] = None,
+                     stage: str = "llm") -> Any:
+    """
+    `chain.invoke(payload)` a través del planificador compartido. Las llamadas concurrentes
+    con la misma huella (`scope` o el prompt de la cadena, más el payload) comparten una sola
+    petición; el resultado compartido debe tratarse como de solo lectura.
+
+    Los tokens de cada petición se contabilizan en `llm_ledger` bajo `stage` y el usuario y
+    la sesión en curso (ver `current_attribution`); las llamadas coalescidas no se cobran.
+    """
+    scheduler = scheduler or get_llm_scheduler()
+    key = prompt_fingerprint(scope or _chain_scope(chain), payload)
+    return llm_single_flight.do(
+        key,
+        lambda: scheduler.run(lambda: _accounted_invoke(chain, payload, stage), priority=priority,
+                              estimated_tokens=estimate_tokens(payload)),
+    )
@@ -0,0 +1,155 @@
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.catalog_store import get_catalog_store
+from src.utils.text_normalization import normalize_text
+
+# Tipo de sugerencia -> campo del producto del que sale (a igual popularidad, en este orden).
+SUGGESTION_FIELDS = {"product": "name", "brand": "brand", "category": "category"}
+_KIND_ORDER = {kind: order for order, kind in enumerate(SUGGESTION_FIELDS)}
+
+# Con una sola letra casi todo el catálogo coincide: se sugiere a partir de dos.
+MIN_PREFIX_LENGTH = 2
+
+# Prefijos de hasta este largo guardan su top-k ya calculado (son los que más coincidencias recorren).
+CACHED_PREFIX_LENGTH = 2
+
+EntryId = Tuple[str, str] # (tipo, ID del producto o texto normalizado de la marca/categoría)
+
+
+def popularity(product: Dict[str, Any]) -> float:
+    """Rating promedio ponderado por el logaritmo del número de valoraciones."""
+    ratings = product.get('ratings') or {}
+    return (ratings.get('average_rating') or 0.0) * math.log1p(ratings.get('review_count') or 0)
+
+
+class PrefixIndex:
+    """
+    Índice de autocompletado de productos, marcas y categorías.
+
+    Guarda un arreglo ordenado de claves `(texto normalizado, entrada)` con una clave por cada
+    palabra de la etiqueta (ej: "Cafetera Espresso Automática" se encuentra por "caf", "espr" o
+    "auto"). Un prefijo se resuelve con `bisect` sobre el arreglo y un recorrido del rango de
+    claves que empiezan por él; el top-k por popularidad se elige con un heap. Los prefijos
+    cortos, que recorren más claves, guardan su resultado hasta el siguiente cambio del catálogo.
+
+    Las marcas y categorías son entradas compartidas por sus productos: su popularidad es la
+    del producto más popular. Implementa el protocolo de índices de `CatalogStore`.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, EntryId]] = []
+        self._entries: Dict[EntryId, Dict[str, Any]] = {}
+        self._product_entries: Dict[str, List[EntryId]] = {} # producto -> entradas a las que aporta
+        self._top_cache: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._keys, self._entries, self._product_entries, self._top_cache = [], {}, {}, {}
+            for product in products:
+                self._add_product(product)
+            self._keys.sort()
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        if product.get('id') is None:
+            return
+        with self._lock:
+            self._remove_product(product['id'])
+            self._add_product(product, keep_sorted=True)
+            self._top_cache = {}
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            self._remove_product(product_id)
+            self._top_cache = {}
+
+    def _add_product(self, product: Dict[str, Any], keep_sorted: bool = False) -> None:
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        score = popularity(product)
+        entry_ids = []
+        for kind, field in SUGGESTION_FIELDS.items():
+            label = product.get(field)
+            normalized = normalize_text(str(label or ""))
+            if not normalized:
+                continue
+            entry_id = (kind, product_id if kind == "product" else normalized)
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                entry = {"text": label, "kind": kind, "id": product_id if kind == "product" else None, "members": {}}
+                self._entries[entry_id] = entry
+                words = normalized.split()
+                for position in range(len(words)):
+                    key = (" ".join(words[position:]), entry_id)
+                    if keep_sorted:
+                        insort(self._keys, key)
+                    else:
+                        self._keys.append(key)
+            entry["members"][product_id] = score
+            entry["score"] = max(entry["members"].values())
+            entry_ids.append(entry_id)
+        self._product_entries[product_id] = entry_ids
+
+    def _remove_product(self, product_id: str) -> None:
+        for entry_id in self._product_entries.pop(product_id, []):
+            entry = self._entries[entry_id]
+            entry["members"].pop(product_id, None)
+            if entry["members"]:
+                entry["score"] = max(entry["members"].values())
+                continue
+            del self._entries[entry_id]
+            words = normalize_text(str(entry["text"])).split()
+            for position in range(len(words)):
+                key = (" ".join(words[position:]), entry_id)
+                index = bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    del self._keys[index]
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Retorna hasta `limit` sugerencias `{"text", "kind", "id"}` cuyo texto tiene una palabra
+        que empieza por `prefix` (sin distinguir mayúsculas ni tildes; al menos
+        `MIN_PREFIX_LENGTH` caracteres), de la más popular a la menos popular. `kind` es "product", "brand" o "category"; `id` solo lo tienen los productos.
+        """
+        normalized = normalize_text(prefix)
+        if len(normalized) < MIN_PREFIX_LENGTH or limit <= 0:
+            return []
+        with self._lock:
+            cache_key = (normalized, limit)
+            cached = self._top_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            matches = set()
+            position = bisect_left(self._keys, (normalized,))
+            while position < len(self._keys) and self._keys[position][0].startswith(normalized):
+                matches.add(self._keys[position][1])
+                position += 1
+            best = heapq.nsmallest(limit, matches, key=lambda e: (-self._entries[e]["score"], _KIND_ORDER[e[0]], e[1]))
+            suggestions = [{"text": self._entries[e]["text"], "kind": e[0], "id": self._entries[e]["id"]} for e in best]
+            if len(normalized) <= CACHED_PREFIX_LENGTH:
+                self._top_cache[cache_key] = suggestions
+            return suggestions
+
+
+def catalog_suggestions(text: str, limit: int = 8, max_words: int = 3) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Sugerencias para lo que el usuario lleva escrito en el chat, sobre el catálogo compartido.
+
+    Se prueba con las últimas `max_words` palabras de `text` y se va acortando hasta que alguna
+    tenga sugerencias (en "busca cafetera esp" sirve "cafetera esp"). Retorna `(palabras usadas,
+    sugerencias)`; `(0, [])` si no hay ninguna o si el índice aún no se construyó (warm-up).
+    """
+    index: Optional[PrefixIndex] = get_catalog_store().get_index("autocomplete")
+    words = text.split()
+    if index is None or not words or text[-1:].isspace(): # Palabra terminada: nada que completar
+        return 0, []
+    for used in range(min(max_words, len(words)), 0, -1):
+        suggestions = index.suggest(" ".join(words[-used:]), limit)
+        if suggestions:
+            return used, suggestions
+    return 0, []
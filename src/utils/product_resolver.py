@@ -0,0 +1,103 @@
+import re
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from src.utils.text_normalization import normalize_text
+
+_PRODUCT_PATH_RE = re.compile(r"/products/([^/]+)/?$")
+
+
+def normalize_product_name(name: Optional[str]) -> str:
+    """Nombre en forma canónica (ej: "Cafetera  Automática!" -> "cafetera automatica"). Ver `normalize_text`."""
+    return normalize_text(name)
+
+
+def normalize_url(url: Optional[str]) -> Optional[str]:
+    """URL canónica para comparar: sin esquema, `www.`, query, fragmento ni barra final."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip() if "//" in url else f"//{url.strip()}")
+    host = parts.netloc.lower().removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}" if host else None
+
+
+class ProductResolverIndex:
+    """
+    Resolución determinista de items de wishlist a productos del catálogo, sin LLM.
+
+    - Enlaces: `product_url` normalizada -> ID, y como respaldo la ruta `/products/<id>` si
+      ese ID existe en el catálogo.
+    - Nombres: nombre normalizado -> IDs. Solo se resuelve si el nombre es de un único
+      producto (un nombre ambiguo se deja al LLM y al matching difuso).
+
+    Implementa el protocolo de índices de `CatalogStore` (`rebuild`, `upsert`, `remove`).
+    """
+
+    def __init__(self):
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._url_to_id: Dict[str, str] = {}
+        self._name_to_ids: Dict[str, Set[str]] = {}
+        self._keys: Dict[str, Tuple[Optional[str], str]] = {} # id -> (url, nombre) indexados
+
+    def rebuild(self, products) -> None:
+        self._products, self._url_to_id, self._name_to_ids, self._keys = {}, {}, {}, {}
+        for product in products:
+            self.upsert(product)
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        self.remove(product_id)
+        url = normalize_url(product.get('product_url'))
+        name = normalize_product_name(product.get('name'))
+        self._products[product_id] = product
+        self._keys[product_id] = (url, name)
+        if url:
+            self._url_to_id[url] = product_id
+        if name:
+            self._name_to_ids.setdefault(name, set()).add(product_id)
+
+    def remove(self, product_id: str) -> None:
+        keys = self._keys.pop(product_id, None)
+        self._products.pop(product_id, None)
+        if keys is None:
+            return
+        url, name = keys
+        if url and self._url_to_id.get(url) == product_id:
+            del self._url_to_id[url]
+        ids = self._name_to_ids.get(name)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self._name_to_ids[name]
+
+    def resolve_link(self, url: Optional[str]) -> Optional[Dict[str, Any]]:
+        normalized = normalize_url(url)
+        if not normalized:
+            return None
+        product_id = self._url_to_id.get(normalized)
+        if product_id is None:
+            match = _PRODUCT_PATH_RE.search(normalized)
+            product_id = match.group(1) if match else None
+        return self._products.get(product_id) if product_id else None
+
+    def resolve_name(self, name: Optional[str]) -> Optional[Dict[str, Any]]:
+        ids = self._name_to_ids.get(normalize_product_name(name))
+        if not ids or len(ids) > 1:
+            return None
+        return self._products[next(iter(ids))]
+
+    def resolve_item(self, item: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Resuelve un post o pin por su enlace (`link`/`product_url`) o, si no, por
+        `detected_product_name`. Retorna `(producto, "link" | "exact_name")` o `(None, None)`.
+        """
+        for field in ('link', 'product_url'):
+            product = self.resolve_link(item.get(field))
+            if product is not None:
+                return product, "link"
+        product = self.resolve_name(item.get('detected_product_name'))
+        if product is not None:
+            return product, "exact_name"
+        return None, None
@@ -0,0 +1,100 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from src.utils.catalog_store import get_catalog_store
+
+# Productos de una página que se pasan completos (en forma compacta) al MasterAgent.
+PROJECTION_TOP_K = 5
+
+
+def project_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Registro compacto de un producto: lo justo para responder sobre él."""
+    return {
+        "id": product.get('id'),
+        "name": product.get('name'),
+        "price": product.get('price'),
+        "currency": product.get('currency'),
+        "rating": (product.get('ratings') or {}).get('average_rating'),
+        "in_stock": (product.get('stock') or 0) > 0,
+    }
+
+
+class FacetAccumulator:
+    """
+    Agregados de un conjunto de resultados que se van acumulando producto a producto, para
+    calcularlos en la misma pasada que filtra las coincidencias (ver `search_catalog`): número
+    de productos, rango de precios y productos por marca.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.min_price: Optional[float] = None
+        self.max_price: Optional[float] = None
+        self.brands: Counter = Counter()
+
+    def add(self, product: Dict[str, Any]) -> None:
+        self.count += 1
+        price = product.get('price')
+        if isinstance(price, (int, float)):
+            self.min_price = price if self.min_price is None else min(self.min_price, price)
+            self.max_price = price if self.max_price is None else max(self.max_price, price)
+        if product.get('brand'):
+            self.brands[product['brand']] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        """`{"count", "price_range": {"min", "max"} o None, "brands": {marca: productos}}` (de más a menos productos)."""
+        return {
+            "count": self.count,
+            "price_range": {"min": self.min_price, "max": self.max_price} if self.min_price is not None else None,
+            "brands": dict(self.brands.most_common()),
+        }
+
+
+def result_facets(products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agregados (`FacetAccumulator`) de una lista de productos."""
+    facets = FacetAccumulator()
+    for product in products:
+        facets.add(product)
+    return facets.as_dict()
+
+
+def project_search_page(page: Dict[str, Any], top_k: int = PROJECTION_TOP_K) -> Dict[str, Any]:
+    """
+    Reduce una página de `catalog_search_tool` a lo que necesita el MasterAgent: los `top_k`
+    primeros resultados como registros compactos (`project_product`), los facets de todas las
+    coincidencias (los que calcula `search_catalog`) y los IDs de todos los resultados de la
+    página. Los productos completos (descripción, historial de precios, URLs...) no viajan en
+    el estado: siguen en el `CatalogStore` y se recuperan por ID con `hydrate_results`. Se
+    conservan `total_count`, `offset`, `limit`, `corrections` y `cached`; el cross-sell también
+    se compacta. Si la página no trae facets, se calculan sobre sus propios resultados (y
+    entonces `facets["count"]` es el número de resultados de la página).
+    """
+    results = page.get('results') or []
+    projected = {key: value for key, value in page.items() if key not in ("results", "frequently_bought_together")}
+    projected["results"] = [project_product(p) for p in results[:top_k]]
+    projected["result_ids"] = [p.get('id') for p in results]
+    projected["facets"] = page.get('facets') or result_facets(results)
+    if page.get('frequently_bought_together'):
+        projected["frequently_bought_together"] = [_project_cross_sell(entry) for entry in page['frequently_bought_together']]
+    return projected
+
+
+def _project_cross_sell(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Registro compacto de un producto de cross-sell. Las entradas solo traen id, nombre y precio,
+    así que el stock y la valoración se toman del producto completo del catálogo; se conservan
+    `score` y `bought_with` de la entrada.
+    """
+    product = get_catalog_store().get(entry.get('id')) or entry
+    projected = project_product(product)
+    for key in ("score", "bought_with"):
+        if key in entry:
+            projected[key] = entry[key]
+    return projected
+
+
+def hydrate_results(projected_page: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Productos completos de una página proyectada, desde el catálogo compartido (omite los ya eliminados)."""
+    catalog = get_catalog_store()
+    products = (catalog.get(product_id) for product_id in projected_page.get('result_ids') or [])
+    return [p for p in products if p is not None]
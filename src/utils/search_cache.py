@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from src.utils.text_normalization import normalize_text
+
+# Criterios que identifican una búsqueda (la paginación no forma parte de la clave).
+CACHE_CRITERIA = ("query", "category", "brand", "min_price", "max_price", "min_rating", "in_stock", "ranked")
+
+
+def normalize_criteria(criteria: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Convierte los criterios de búsqueda en una clave canónica: textos normalizados con
+    `normalize_text` (minúsculas, sin tildes ni puntuación), números como float y sin los
+    criterios vacíos. Así "Cafetera Automática " y "cafetera automatica" comparten entrada.
+    """
+    normalized = []
+    for name in CACHE_CRITERIA:
+        value = criteria.get(name)
+        if value is None or value == "" or (name == "ranked" and not value):
+            continue
+        if isinstance(value, str):
+            value = normalize_text(value)
+        elif isinstance(value, bool):
+            pass
+        elif isinstance(value, (int, float)):
+            value = float(value)
+        normalized.append((name, value))
+    return tuple(normalized)
+
+
+class SearchResultCache:
+    """
+    Caché LRU acotado de resultados de búsqueda en el catálogo.
+
+    Cada entrada guarda solo la lista ordenada de IDs de producto (no los diccionarios
+    completos), el total de coincidencias y los facets de todas ellas (ver `search_catalog`). La clave incluye la versión del catálogo, por lo
+    que cualquier recarga o delta invalida implícitamente las entradas anteriores.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[List[str], int, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(criteria: Dict[str, Any], catalog_version: int) -> Hashable:
+        return (catalog_version, normalize_criteria(criteria))
+
+    def get(self, key: Hashable, needed: Optional[int] = None) -> Optional[Tuple[List[str], int, Optional[Dict[str, Any]]]]:
+        """
+        Retorna `(ids, total_count, facets)` si la entrada existe y cubre al menos `needed` resultados
+        (None = todos). Cuenta el acceso como acierto o fallo.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                ids, total_count, _ = entry
+                if len(ids) >= total_count or (needed is not None and len(ids) >= needed):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, ids: List[str], total_count: int, facets: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            self._entries[key] = (list(ids), total_count, facets)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso: aciertos, fallos, tasa de acierto y tamaño actual."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
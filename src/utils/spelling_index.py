@@ -0,0 +1,182 @@
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.utils.text_normalization import normalize_text, stem_token
+from src.utils.vector_index import SPANISH_STOPWORDS
+
+# Campos del producto cuyo vocabulario se usa para corregir las consultas.
+SPELLING_FIELDS = ("name", "tags", "brand", "category")
+
+DEFAULT_MAX_EDIT_DISTANCE = 2
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Distancia de Damerau-Levenshtein (variante OSA: una transposición de letras vecinas
+    cuenta como una edición). Deja de calcular en cuanto supera `max_distance` y en ese
+    caso retorna `max_distance + 1`.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(term: str, max_distance: int, prefix_length: int) -> Set[str]:
+    """Todas las variantes de `term` (truncado a `prefix_length`) con hasta `max_distance` letras borradas."""
+    term = term[:prefix_length]
+    variants = {term}
+    frontier = {term}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+class SymSpellIndex:
+    """
+    Corrector ortográfico por borrado simétrico (SymSpell) sobre el vocabulario del catálogo
+    (nombres, etiquetas, marcas y categorías), para tolerar errores como "auriculres" o
+    "cafeterra" en las consultas.
+
+    Cada término del vocabulario se guarda junto con todas sus variantes con hasta
+    `max_edit_distance` letras borradas. Para corregir una palabra basta generar sus propias
+    variantes por borrado y buscarlas en el diccionario: los candidatos salen de unas pocas
+    búsquedas O(1), sin recorrer el vocabulario, y solo a ellos se les calcula la distancia
+    real. Entre los candidatos gana el de menor distancia y, a igualdad, el más frecuente.
+
+    Los términos son los mismos que indexa la búsqueda (`normalize_text` + `stem_token`); para
+    cada uno se recuerda una palabra del catálogo que lo produce, que es la que se propone.
+
+    Implementa el protocolo de índices de `CatalogStore` (`rebuild`, `upsert`, `remove`).
+    """
+
+    def __init__(self, max_edit_distance: int = DEFAULT_MAX_EDIT_DISTANCE, prefix_length: int = 7):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self._counts: Counter = Counter() # término -> número de apariciones en el catálogo
+        self._surface: Dict[str, str] = {} # término -> palabra del catálogo que lo produce
+        self._deletes: Dict[str, Set[str]] = {} # variante por borrado -> términos
+        self._doc_terms: Dict[str, Counter] = {}
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._counts
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        self._counts, self._surface, self._deletes, self._doc_terms = Counter(), {}, {}, {}
+        for product in products:
+            self.upsert(product)
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        self.remove(product_id)
+        terms: Counter = Counter()
+        for field in SPELLING_FIELDS:
+            value = product.get(field)
+            if not value:
+                continue
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for word in normalize_text(text).split():
+                if word in SPANISH_STOPWORDS or word.isdigit():
+                    continue
+                term = stem_token(word)
+                terms[term] += 1
+                self._surface.setdefault(term, word)
+        self._doc_terms[product_id] = terms
+        for term, count in terms.items():
+            if term not in self._counts:
+                for variant in _deletes(term, self.max_edit_distance, self.prefix_length):
+                    self._deletes.setdefault(variant, set()).add(term)
+            self._counts[term] += count
+
+    def remove(self, product_id: str) -> None:
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term, count in terms.items():
+            self._counts[term] -= count
+            if self._counts[term] > 0:
+                continue
+            del self._counts[term]
+            self._surface.pop(term, None)
+            for variant in _deletes(term, self.max_edit_distance, self.prefix_length):
+                bucket = self._deletes.get(variant)
+                if bucket is not None:
+                    bucket.discard(term)
+                    if not bucket:
+                        del self._deletes[variant]
+
+    def _allowed_distance(self, word: str) -> int:
+        """Distancia máxima según el largo de la palabra: las muy cortas no se corrigen."""
+        if len(word) < 4:
+            return 0
+        return min(self.max_edit_distance, 1 if len(word) <= 5 else 2)
+
+    def lookup(self, term: str, max_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        Retorna `(término del vocabulario, distancia)` más cercano a `term`, o None si no hay
+        ninguno a `max_distance` ediciones o menos (por defecto, `max_edit_distance`).
+        """
+        max_distance = self.max_edit_distance if max_distance is None else min(max_distance, self.max_edit_distance)
+        if term in self._counts:
+            return term, 0
+        if max_distance <= 0:
+            return None
+        candidates: Set[str] = set()
+        for variant in _deletes(term, max_distance, self.prefix_length):
+            candidates |= self._deletes.get(variant, set())
+        best = None
+        for candidate in candidates:
+            distance = edit_distance(term, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            rank = (distance, -self._counts[candidate], candidate)
+            if best is None or rank < best:
+                best = rank
+        return (best[2], best[0]) if best else None
+
+    def correct_query(self, query: str, is_known: Optional[Callable[[str], bool]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Corrige las palabras de `query` que no están en el vocabulario.
+
+        Args:
+            query: Texto de la consulta tal como lo escribió el usuario.
+            is_known: Criterio adicional para dar una palabra por buena (ej: el término está en
+                      el índice de búsqueda aunque venga de la descripción). Recibe el término
+                      normalizado.
+
+        Returns:
+            `(consulta, correcciones)`. Si no hubo correcciones la consulta se retorna sin
+            cambios; si no, normalizada y con cada palabra corregida reemplazada por la del
+            catálogo. Cada corrección es `{"original", "corrected", "distance"}`.
+        """
+        words = normalize_text(query).split()
+        corrections = []
+        for position, word in enumerate(words):
+            if word in SPANISH_STOPWORDS or word.isdigit():
+                continue
+            term = stem_token(word)
+            if term in self._counts or (is_known is not None and is_known(term)):
+                continue
+            suggestion = self.lookup(term, self._allowed_distance(word))
+            if suggestion is None:
+                continue
+            corrected, distance = suggestion
+            words[position] = self._surface[corrected]
+            # Se informa la distancia entre lo escrito y la palabra del catálogo, no entre stems.
+            distance = min(distance, edit_distance(word, words[position], distance))
+            corrections.append({"original": word, "corrected": words[position], "distance": distance})
+        return (" ".join(words), corrections) if corrections else (query, [])
@@ -0,0 +1,104 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+_NON_ALNUM_RE = re.compile(r"[^\w]+")
+_VOWELS = frozenset("aeiou")
+_ES_PLURAL_CONSONANTS = frozenset("rlndjy")
+# Grafías que no son del español: marcan préstamos del inglés, cuyo plural es solo "-s".
+_FOREIGN_RE = re.compile(r"ph|th|sh|w|k")
+
+# Columnas de texto del producto que se guardan ya normalizadas (ver `NormalizedColumnsIndex`).
+NORMALIZED_FIELDS = ("name", "category", "brand")
+
+
+def fold_accents(text: str) -> str:
+    """Quita tildes y diéresis con descomposición Unicode NFKD ("Automática" -> "Automatica")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+@lru_cache(maxsize=4096)
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Forma canónica para comparar textos: minúsculas, sin tildes, sin puntuación y con
+    espacios simples (ej: "  Cafetera Espresso-Automática! " -> "cafetera espresso automatica").
+
+    Se memoriza porque las consultas y filtros se repiten mucho; el texto del catálogo se
+    normaliza una sola vez al construir sus índices.
+    """
+    if not text:
+        return ""
+    return _NON_ALNUM_RE.sub(" ", fold_accents(text).lower()).replace("_", " ").strip()
+
+
+def stem_token(token: str) -> str:
+    """
+    Stemming ligero del español: solo se quitan los plurales, para que "auriculares" y
+    "auricular" o "cables" y "cable" compartan término. No se tocan el género ni las
+    terminaciones verbales (un stemmer agresivo mezcla palabras distintas en catálogos cortos).
+    Espera un token ya normalizado con `normalize_text`.
+
+    El plural en "-es" solo se quita entero cuando lo que queda es un singular terminado en
+    vocal + consonante que forma así el plural ("motores", "papeles", "relojes", "botones",
+    "meses"); si no, el singular termina en "e" y se quita solo la "s" ("cables", "juguetes",
+    "muebles"). Los préstamos del inglés ("smartphones") también pierden solo la "s".
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ces") and token[-4] in _VOWELS: # "luces" -> "luz" (pero "dulces" -> "dulce")
+        return token[:-3] + "z"
+    if token.endswith("es") and len(token) > 4 and _takes_es_plural(token[:-2]):
+        return token[:-2]
+    if token.endswith("s") and token[-2] in _VOWELS:
+        return token[:-1]
+    return token
+
+
+def _takes_es_plural(stem: str) -> bool:
+    """Si `stem` es un singular que forma el plural con "-es" (vocal + r, l, n, d, j, y o s)."""
+    if _FOREIGN_RE.search(stem) or stem[-2] not in _VOWELS:
+        return False
+    if stem[-1] == "s": # "meses", "autobuses", "paises"; pero "clases" y "bases" vienen de "-ase"
+        return stem[-2] != "a"
+    return stem[-1] in _ES_PLURAL_CONSONANTS
+
+
+def normalize_terms(text: Optional[str], stopwords: Iterable[str] = ()) -> List[str]:
+    """Términos normalizados y con stemming de `text`, sin las `stopwords` indicadas."""
+    return [stem_token(t) for t in normalize_text(text).split() if t not in stopwords]
+
+
+class NormalizedColumnsIndex:
+    """
+    Columnas de texto normalizadas (`NORMALIZED_FIELDS`) de cada producto, calculadas una vez
+    al cargar el catálogo y actualizadas con los deltas. Los filtros de búsqueda por categoría
+    y marca y el matching de la wishlist las consultan en lugar de normalizar el texto del
+    catálogo en cada comparación.
+
+    Implementa el protocolo de índices de `CatalogStore` (`rebuild`, `upsert`, `remove`).
+    """
+
+    def __init__(self, fields: Iterable[str] = NORMALIZED_FIELDS):
+        self.fields = tuple(fields)
+        self._columns: Dict[str, Dict[str, str]] = {}
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        self._columns = {}
+        for product in products:
+            self.upsert(product)
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        if product.get('id') is not None:
+            self._columns[product['id']] = {field: normalize_text(str(product.get(field) or "")) for field in self.fields}
+
+    def remove(self, product_id: str) -> None:
+        self._columns.pop(product_id, None)
+
+    def get(self, product: Dict[str, Any]) -> Dict[str, str]:
+        """Columnas normalizadas del producto (se calculan al vuelo si no está indexado)."""
+        columns = self._columns.get(product.get('id'))
+        if columns is None:
+            columns = {field: normalize_text(str(product.get(field) or "")) for field in self.fields}
+        return columns
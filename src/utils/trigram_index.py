@@ -0,0 +1,105 @@
+import heapq
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from src.utils.text_normalization import normalize_text
+
+
+def text_trigrams(text: str) -> FrozenSet[str]:
+    """
+    Retorna el conjunto de trigramas de caracteres de `text`.
+    Cada palabra se rellena con espacios para que los inicios y finales de palabra
+    generen trigramas propios (ej: " au", "aur", ..., "es ").
+    """
+    trigrams: Set[str] = set()
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(trigrams)
+
+
+class TrigramIndex:
+    """
+    Índice invertido de trigramas sobre un campo de texto de los productos (por defecto `name`).
+
+    Permite búsquedas aproximadas (fuzzy) por similitud de Dice entre conjuntos de trigramas:
+    solo se evalúan los productos que comparten al menos un trigrama con la consulta
+    (vía las listas de postings), en lugar de comparar contra todo el catálogo.
+
+    Implementa el protocolo de índices de `CatalogStore` (`rebuild`, `upsert`, `remove`).
+    """
+
+    def __init__(self, field: str = "name", threshold: float = 0.35):
+        self.field = field
+        self.threshold = threshold
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._doc_trigrams: Dict[str, FrozenSet[str]] = {}
+        self._products: Dict[str, Dict[str, Any]] = {}
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        self._postings = defaultdict(set)
+        self._doc_trigrams = {}
+        self._products = {}
+        for product in products:
+            self.upsert(product)
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        product_id = product.get('id')
+        if product_id is None:
+            return
+        self.remove(product_id)
+        trigrams = text_trigrams(str(product.get(self.field) or ""))
+        self._doc_trigrams[product_id] = trigrams
+        self._products[product_id] = product
+        for trigram in trigrams:
+            self._postings[trigram].add(product_id)
+
+    def remove(self, product_id: str) -> None:
+        trigrams = self._doc_trigrams.pop(product_id, None)
+        self._products.pop(product_id, None)
+        if not trigrams:
+            return
+        for trigram in trigrams:
+            posting = self._postings.get(trigram)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[trigram]
+
+    def search(
+        self,
+        text: str,
+        top_k: int = 5,
+        threshold: Optional[float] = None
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Busca los productos cuyo campo indexado es más parecido a `text`.
+
+        Args:
+            text: Texto de la consulta (ej: el nombre de producto detectado por el LLM).
+            top_k: Número máximo de candidatos a retornar.
+            threshold: Similitud de Dice mínima (0-1). Si es None se usa la del índice.
+
+        Returns:
+            Lista de tuplas (producto, similitud) ordenada de mayor a menor similitud.
+        """
+        if threshold is None:
+            threshold = self.threshold
+        query_trigrams = text_trigrams(text)
+        if not query_trigrams:
+            return []
+
+        overlaps: Dict[str, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for product_id in self._postings.get(trigram, ()):
+                overlaps[product_id] += 1
+
+        query_size = len(query_trigrams)
+        scored = []
+        for product_id, overlap in overlaps.items():
+            score = 2.0 * overlap / (query_size + len(self._doc_trigrams[product_id]))
+            if score >= threshold:
+                scored.append((score, product_id))
+
+        best = heapq.nlargest(top_k, scored)
+        return [(self._products[product_id], round(score, 4)) for score, product_id in best]
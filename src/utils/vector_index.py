@@ -0,0 +1,181 @@
+import heapq
+import math
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.utils.text_normalization import normalize_terms
+
+# Palabras muy frecuentes en español que no aportan a la similitud.
+SPANISH_STOPWORDS = frozenset({
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "mi", "para", "por", "que", "se", "su", "sus", "un", "una", "y",
+})
+
+# Peso de cada campo del producto en su vector (un término del nombre cuenta más que uno de la descripción).
+DEFAULT_FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "brand": 2.0, "description": 1.0}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide el texto en términos normalizados (minúsculas, sin tildes ni puntuación y en
+    singular), sin stopwords. Consultas y catálogo pasan por el mismo proceso, así que
+    "cafeteras automaticas" encuentra "Cafetera Espresso Automática".
+    """
+    return normalize_terms(text, SPANISH_STOPWORDS)
+
+
+class _SparseMatrix(NamedTuple):
+    """Instantánea inmutable de la matriz documento-término."""
+    products: List[Dict[str, Any]] # Producto de cada fila
+    columns: Dict[str, List[Tuple[int, float]]] # término -> [(fila, peso normalizado)]
+    idf: Dict[str, float]
+
+
+class TfidfVectorIndex:
+    """
+    Motor de similitud vectorial local (sin red) sobre el catálogo.
+
+    Cada producto se representa como un vector TF-IDF disperso (normalizado L2) construido a
+    partir de su nombre, descripción, etiquetas y marca, con pesos por campo. Los vectores se
+    guardan por columnas (término -> [(fila, peso)]), es decir, como una matriz dispersa en
+    formato CSC.
+
+    `query_batch` resuelve un lote de consultas con un único producto matriz dispersa
+    Q · Dᵀ: cada lista de postings se recorre una sola vez para todas las consultas del lote,
+    y luego se seleccionan los top-k de cada fila con un heap.
+
+    Implementa el protocolo de índices de `CatalogStore`. Como el IDF depende de todo el
+    catálogo, los deltas marcan el índice como desactualizado y la matriz se recalcula en la
+    siguiente consulta.
+    """
+
+    def __init__(self, field_weights: Optional[Dict[str, float]] = None):
+        self.field_weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._matrix: Optional[_SparseMatrix] = None
+        self._lock = threading.Lock()
+
+    def rebuild(self, products: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._products = {p['id']: p for p in products if p.get('id') is not None}
+            self._matrix = None
+
+    def upsert(self, product: Dict[str, Any]) -> None:
+        if product.get('id') is not None:
+            with self._lock:
+                self._products[product['id']] = product
+                self._matrix = None
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            if self._products.pop(product_id, None) is not None:
+                self._matrix = None
+
+    def _weighted_term_frequencies(self, product: Dict[str, Any]) -> Dict[str, float]:
+        tf: Dict[str, float] = defaultdict(float)
+        for field, weight in self.field_weights.items():
+            value = product.get(field)
+            if not value:
+                continue
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for term in tokenize(text):
+                tf[term] += weight
+        return tf
+
+    def build(self) -> None:
+        """Construye la matriz ahora (ej: durante el warm-up) en lugar de en la primera consulta."""
+        self._current_matrix()
+
+    def _current_matrix(self) -> _SparseMatrix:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = self._build_matrix(list(self._products.values()))
+            return self._matrix
+
+    def _build_matrix(self, products: List[Dict[str, Any]]) -> _SparseMatrix:
+        doc_tfs = [self._weighted_term_frequencies(p) for p in products]
+
+        document_frequency: Dict[str, int] = defaultdict(int)
+        for tf in doc_tfs:
+            for term in tf:
+                document_frequency[term] += 1
+        n_docs = len(doc_tfs)
+        idf = {term: math.log((1 + n_docs) / (1 + df)) + 1.0 for term, df in document_frequency.items()}
+
+        columns: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for row, tf in enumerate(doc_tfs):
+            weights = {term: (1.0 + math.log(freq)) * idf[term] for term, freq in tf.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, w in weights.items():
+                columns[term].append((row, w / norm))
+        return _SparseMatrix(products=products, columns=dict(columns), idf=idf)
+
+    @staticmethod
+    def _query_vector(text: str, idf: Dict[str, float]) -> Dict[str, float]:
+        tf: Dict[str, float] = defaultdict(float)
+        for term in tokenize(text):
+            if term in idf: # Términos fuera del vocabulario no pueden puntuar
+                tf[term] += 1.0
+        weights = {term: (1.0 + math.log(freq)) * idf[term] for term, freq in tf.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {term: w / norm for term, w in weights.items()}
+
+    def _score_rows(self, texts: List[str], matrix: _SparseMatrix) -> List[Dict[int, float]]:
+        """Similitud de cada consulta con las filas del catálogo que comparten algún término."""
+        # Matriz de consultas agrupada por término: término -> [(fila_consulta, peso)]
+        query_columns: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for q_row, text in enumerate(texts):
+            for term, weight in self._query_vector(text, matrix.idf).items():
+                query_columns[term].append((q_row, weight))
+
+        # Producto Q · Dᵀ: una pasada por cada columna compartida entre consultas y documentos.
+        scores: List[Dict[int, float]] = [defaultdict(float) for _ in texts]
+        for term, query_entries in query_columns.items():
+            doc_entries = matrix.columns.get(term, ())
+            for q_row, q_weight in query_entries:
+                row_scores = scores[q_row]
+                for d_row, d_weight in doc_entries:
+                    row_scores[d_row] += q_weight * d_weight
+        return scores
+
+    def query_batch(
+        self,
+        texts: List[str],
+        top_k: int = 5,
+        min_score: float = 0.0
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Calcula la similitud coseno de un lote de consultas contra todo el catálogo.
+
+        Args:
+            texts: Textos de consulta (ej: nombres de productos de la wishlist).
+            top_k: Número máximo de productos a retornar por consulta.
+            min_score: Similitud mínima (exclusiva) para incluir un producto.
+
+        Returns:
+            Una lista por consulta (en el mismo orden que `texts`) con tuplas
+            (producto, similitud) ordenadas de mayor a menor similitud.
+        """
+        matrix = self._current_matrix()
+        scores = self._score_rows(texts, matrix)
+
+        results = []
+        for row_scores in scores:
+            best = heapq.nlargest(top_k, ((s, r) for r, s in row_scores.items() if s > min_score))
+            results.append([(matrix.products[r], round(s, 4)) for s, r in best])
+        return results
+
+    def query(self, text: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        """Atajo para una sola consulta. Ver `query_batch`."""
+        return self.query_batch([text], top_k=top_k, min_score=min_score)[0]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[Dict[str, Any], float]]:
+        """
+        Genera, sin ordenar, los productos con similitud positiva con `text` y su similitud.
+        Para quien aplica sus propios filtros y elige el top-k después (ver `search_catalog`).
+        """
+        matrix = self._current_matrix()
+        for row, score in self._score_rows([text], matrix)[0].items():
+            if score > 0:
+                yield matrix.products[row], round(score, 4)
@@ -0,0 +1,179 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.utils.cooccurrence_index import product_id_from_pin
+from src.utils.text_normalization import normalize_text
+
+# (fuente, clave del item): `post_id`, `pin_id` o `cart_id:product_id`.
+MemberKey = Tuple[str, str]
+
+
+def wishlist_item_key(source: str, details: Dict[str, Any]) -> str:
+    """Clave estable de un item de la wishlist dentro de su fuente."""
+    if source == "instagram":
+        return details.get('post_id') or details.get('caption', '')
+    if source == "pinterest":
+        return details.get('pin_id') or details.get('description', '')
+    return f"{details.get('cart_id')}:{details.get('product_id')}"
+
+
+class UnionFind:
+    """Conjuntos disjuntos con compresión de caminos y unión por tamaño."""
+
+    def __init__(self):
+        self._parent: Dict[Any, Any] = {}
+        self._size: Dict[Any, int] = {}
+
+    def find(self, x: Any) -> Any:
+        if x not in self._parent:
+            self._parent[x] = x
+            self._size[x] = 1
+            return x
+        root = x
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[x] != root:
+            self._parent[x], x = root, self._parent[x]
+        return root
+
+    def union(self, a: Any, b: Any) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self._size[root_a] < self._size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] += self._size[root_b]
+
+
+def _wishlist_members(
+    instagram_data: Optional[Dict[str, Any]],
+    pinterest_data: Optional[Dict[str, Any]],
+    carts: Optional[List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    members = []
+    for item in (instagram_data or {}).get('saved_items') or []:
+        members.append({"source": "instagram", "key": wishlist_item_key("instagram", item),
+                        "name": item.get('detected_product_name'), "product_id": None,
+                        "text": item.get('caption') or ""})
+    for board in (pinterest_data or {}).get('boards') or []:
+        for pin in board.get('pins') or []:
+            members.append({"source": "pinterest", "key": wishlist_item_key("pinterest", pin),
+                            "name": pin.get('detected_product_name'), "product_id": product_id_from_pin(pin),
+                            "text": pin.get('description') or ""})
+    for cart in carts or []:
+        for item in cart.get('items', []):
+            details = {**item, "cart_id": cart.get('cart_id')}
+            members.append({"source": "abandoned_cart", "key": wishlist_item_key("abandoned_cart", details),
+                            "name": None, "product_id": item.get('product_id'), "text": ""})
+    return members
+
+
+def cluster_wishlist_items(
+    instagram_data: Optional[Dict[str, Any]],
+    pinterest_data: Optional[Dict[str, Any]],
+    carts: Optional[List[Dict[str, Any]]],
+    name_to_product_id: Optional[Dict[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Agrupa los items de Instagram, Pinterest y carritos que se refieren al mismo producto.
+
+    Dos items quedan en el mismo grupo si comparten ID de producto (del carrito o del enlace
+    del pin) o nombre detectado normalizado; `name_to_product_id` (nombres del catálogo
+    normalizados -> ID) une además nombres con IDs. El representante de cada grupo es una
+    línea de carrito si la hay (su ID se resuelve sin LLM) o, si no, el item social con más
+    texto. Solo se retornan los grupos con más de un item.
+    """
+    members = _wishlist_members(instagram_data, pinterest_data, carts)
+    name_to_product_id = name_to_product_id or {}
+    union_find = UnionFind()
+    for position, member in enumerate(members):
+        union_find.find(("member", position))
+        name = normalize_text(member["name"])
+        product_id = member["product_id"] or name_to_product_id.get(name)
+        if product_id:
+            union_find.union(("member", position), ("id", product_id))
+        if name:
+            union_find.union(("member", position), ("name", name))
+
+    groups: Dict[Any, List[int]] = {}
+    for position in range(len(members)):
+        groups.setdefault(union_find.find(("member", position)), []).append(position)
+
+    clusters = []
+    for positions in groups.values():
+        if len(positions) < 2:
+            continue
+        group = [members[p] for p in positions]
+        carts_in_group = [m for m in group if m["source"] == "abandoned_cart"]
+        representative = carts_in_group[0] if carts_in_group else max(group, key=lambda m: len(m["text"]))
+        product_ids = [m["product_id"] or name_to_product_id.get(normalize_text(m["name"])) for m in group]
+        clusters.append({
+            "cluster_id": f"C{len(clusters) + 1}",
+            "product_id": next((pid for pid in product_ids if pid), None),
+            "representative": {"source": representative["source"], "key": representative["key"]},
+            "members": [{"source": m["source"], "key": m["key"]} for m in group],
+        })
+    return clusters
+
+
+def duplicate_member_keys(clusters: Iterable[Dict[str, Any]]) -> set:
+    """Items que no hace falta analizar con el LLM: todos los de un grupo salvo su representante."""
+    duplicates = set()
+    for cluster in clusters or []:
+        representative = (cluster["representative"]["source"], cluster["representative"]["key"])
+        duplicates.update((m["source"], m["key"]) for m in cluster["members"] if (m["source"], m["key"]) != representative)
+    return duplicates
+
+
+def merge_duplicate_items(items: List[Dict[str, Any]], clusters: Optional[Iterable[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Fusiona los items enriquecidos que son el mismo producto: los del mismo grupo de
+    `clusters` y los macheados con el mismo producto del catálogo. Se conserva el item de
+    carrito (o el primero macheado) y se le agregan las señales de las demás fuentes en
+    `sources` y `merged_from`, de modo que el plan lo cuenta una sola vez.
+    """
+    member_cluster: Dict[MemberKey, str] = {}
+    cluster_sources: Dict[str, List[str]] = {}
+    for cluster in clusters or []:
+        cluster_sources[cluster["cluster_id"]] = [m["source"] for m in cluster["members"]]
+        for member in cluster["members"]:
+            member_cluster[(member["source"], member["key"])] = cluster["cluster_id"]
+
+    union_find = UnionFind()
+    item_clusters: List[Optional[str]] = []
+    for position, item in enumerate(items):
+        union_find.find(("item", position))
+        source = item.get('source', '')
+        cluster_id = member_cluster.get((source, wishlist_item_key(source, item.get('original_item_details') or {})))
+        marketplace_id = (item.get('marketplace_details') or {}).get('id')
+        if cluster_id:
+            union_find.union(("item", position), ("cluster", cluster_id))
+        if marketplace_id:
+            union_find.union(("item", position), ("product", marketplace_id))
+        item_clusters.append(cluster_id)
+
+    groups: Dict[Any, List[int]] = {} # En el orden de aparición del primer item
+    for position in range(len(items)):
+        groups.setdefault(union_find.find(("item", position)), []).append(position)
+
+    merged_items = []
+    for positions in groups.values():
+        group = [items[p] for p in positions]
+        # Fuentes del grupo, incluidas las de los duplicados que no pasaron por el LLM.
+        sources = [i.get('source') for i in group]
+        for cluster_id in dict.fromkeys(item_clusters[p] for p in positions if item_clusters[p]):
+            sources.extend(cluster_sources[cluster_id])
+        sources = list(dict.fromkeys(sources))
+        if len(group) == 1 and len(sources) == 1:
+            merged_items.append(group[0])
+            continue
+        primary = next((i for i in group if i.get('source') == 'abandoned_cart'), None) \
+            or next((i for i in group if i.get('marketplace_details')), group[0])
+        merged = primary.copy()
+        merged['sources'] = sources
+        merged['merged_from'] = [{"source": i.get('source'), "text": i.get('original_text')} for i in group if i is not primary]
+        social = next((i for i in group if i.get('source') != 'abandoned_cart' and i.get('user_sentiment_or_intent')), None)
+        if social and social is not primary:
+            merged['user_sentiment_or_intent'] = f"{primary.get('user_sentiment_or_intent')}; {social['user_sentiment_or_intent']}"
+        merged_items.append(merged)
+    return merged_items
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_WISHLIST_STATE_PATH = "data/wishlist_state.json"
+
+# (clave del item, item original, texto a analizar, timestamp ISO o None)
+WishlistEntry = Tuple[str, Dict[str, Any], str, Optional[str]]
+
+
+class WishlistWatermarkStore:
+    """
+    Estado persistente del WishlistAgent entre ejecuciones, por fuente y usuario.
+
+    Para cada `(fuente, usuario)` guarda la marca de agua (el `saved_at`/`pinned_at` más
+    reciente ya procesado) y los items categorizados por clave (`post_id`/`pin_id`). Así cada
+    ejecución solo envía al LLM los items posteriores a la marca, reutiliza los demás y
+    descarta los que ya no están en la fuente (eliminados por el usuario).
+
+    Los timestamps se comparan como texto ISO 8601 (mismo formato en toda la fuente). Si un
+    item falla al analizarse, la marca no avanza más allá de él, así que se reintenta en la
+    siguiente ejecución. Con `path=None` el estado vive solo en memoria.
+
+    Los items que se saltaron por ser duplicados de otro (`skipped`) se recuerdan aparte: si
+    dejan de serlo (ej: el usuario borró el representante de su grupo) se analizan aunque sean
+    anteriores a la marca de agua, en lugar de perderse.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_WISHLIST_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._records = json.load(f).get("users", {})
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                print(f"ADVERTENCIA: No se pudo leer el estado de la wishlist en {path} ({e}); se reprocesará todo.")
+
+    @staticmethod
+    def _key(source: str, user_id: Optional[str]) -> str:
+        return f"{source}:{user_id or 'anon'}"
+
+    def _record(self, source: str, user_id: Optional[str]) -> Dict[str, Any]:
+        record = self._records.setdefault(self._key(source, user_id), {"watermark": None, "items": {}})
+        record.setdefault("skipped", []) # Estados guardados antes de recordar los duplicados
+        return record
+
+    def watermark(self, source: str, user_id: Optional[str]) -> Optional[str]:
+        return self._records.get(self._key(source, user_id), {}).get("watermark")
+
+    def pending(self, source: str, user_id: Optional[str], entries: Iterable[WishlistEntry]) -> List[WishlistEntry]:
+        """
+        Items que hay que analizar: no guardados y posteriores a la marca (o sin timestamp), o
+        saltados antes por duplicados.
+        """
+        with self._lock:
+            record = self._record(source, user_id)
+            watermark, stored, skipped = record["watermark"], record["items"], set(record["skipped"])
+            return [entry for entry in entries
+                    if entry[0] not in stored and (entry[0] in skipped or watermark is None
+                                                   or entry[3] is None or entry[3] > watermark)]
+
+    def update(
+        self,
+        source: str,
+        user_id: Optional[str],
+        current_keys: Iterable[str],
+        analyzed: Dict[str, Dict[str, Any]],
+        processed_timestamps: Iterable[Optional[str]],
+        failed_timestamps: Iterable[Optional[str]] = (),
+        skipped_keys: Iterable[str] = ()
+    ) -> int:
+        """
+        Incorpora los items recién analizados, elimina los que ya no están en la fuente y
+        avanza la marca de agua. `skipped_keys` son los items de la fuente que no se analizaron
+        por ser duplicados; quedan pendientes hasta que se guarden. Retorna cuántos items
+        guardados se eliminaron.
+        """
+        current_keys = set(current_keys)
+        skipped_keys = set(skipped_keys)
+        processed = [ts for ts in processed_timestamps if ts]
+        failed = [ts for ts in failed_timestamps if ts]
+        with self._lock:
+            record = self._record(source, user_id)
+            stored = record["items"]
+            deleted = [key for key in stored if key not in current_keys]
+            for key in deleted:
+                del stored[key]
+            stored.update(analyzed)
+            # Se siguen recordando los que aún no se guardaron (ej: su análisis falló).
+            record["skipped"] = sorted(key for key in skipped_keys | set(record["skipped"])
+                                       if (key in skipped_keys or key in current_keys) and key not in stored)
+            if failed: # No pasar de un item fallido: se reintenta en la próxima ejecución
+                limit = min(failed)
+                processed = [ts for ts in processed if ts < limit]
+            candidates = processed + ([record["watermark"]] if record["watermark"] else [])
+            record["watermark"] = max(candidates) if candidates else None
+        return len(deleted)
+
+    def items(self, source: str, user_id: Optional[str], keys: Iterable[str]) -> List[Dict[str, Any]]:
+        """Items categorizados guardados, en el orden de `keys` (el de la fuente)."""
+        stored = self._records.get(self._key(source, user_id), {}).get("items", {})
+        return [stored[key] for key in keys if key in stored]
+
+    def save(self) -> None:
+        """Escribe el estado en disco de forma atómica (archivo temporal + reemplazo)."""
+        if not self.path:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"users": self._records}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def get_wishlist_watermark_store() -> WishlistWatermarkStore:
+    """Store en `WISHLIST_STATE_PATH` (por defecto `data/wishlist_state.json`); vacío = solo memoria."""
+    return WishlistWatermarkStore(os.getenv("WISHLIST_STATE_PATH", DEFAULT_WISHLIST_STATE_PATH) or None)
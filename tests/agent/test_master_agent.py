@@ -0,0 +1,79 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from langchain_core.runnables import RunnableLambda
+
+from src.agent.master_agent import SearchRequest, candidate_search_query, run_conversational_master_agent
+
+PAGE = {"results": [{"id": "MP002", "name": "Auriculares ProSound", "price": 149.5, "currency": "USD"}],
+        "total_count": 1, "offset": 0, "limit": 10}
+
+
+class FakeIntentLlm:
+    """LLM falso que clasifica cualquier mensaje con la intención y query dadas."""
+
+    def __init__(self, intent, extracted_query=None):
+        self.intent = intent
+        self.extracted_query = extracted_query
+        self.search_requests = None
+
+    def with_structured_output(self, schema):
+        return RunnableLambda(lambda _: schema(intent=self.intent, extracted_query=self.extracted_query,
+                                               search_requests=self.search_requests))
+
+
+class TestSearchDecisions(unittest.TestCase):
+
+    def _run(self, user_input, llm):
+        searches = []
+
+        def search(tool_input):
+            searches.append(tool_input)
+            return PAGE
+        with patch("src.agent.master_agent.get_llm", return_value=llm):
+            decision = run_conversational_master_agent(user_input, [], speculative_search=search)
+        return decision, searches
+
+    def test_candidate_query_drops_filler_words(self):
+        self.assertEqual(candidate_search_query("Hola, quiero ver unos Auriculares inalámbricos"), "auriculares inalambricos")
+        self.assertIsNone(candidate_search_query("¡Hola! gracias"))
+
+    def test_confirmed_search_answers_in_one_pass(self):
+        decision, searches = self._run("quiero unos auriculares", FakeIntentLlm("buscar_producto", "Auriculares"))
+        self.assertEqual(searches, [{"query": "auriculares"}])
+        self.assertEqual(decision.next_action, "respond_to_user") # Sin el paso extra por la herramienta
+        self.assertIn("Auriculares ProSound", decision.response_text)
+
+    def test_different_query_falls_back_to_the_tool(self):
+        decision, _ = self._run("quiero unos auriculares baratos", FakeIntentLlm("buscar_producto", "auriculares"))
+        self.assertEqual(decision.next_action, "call_tool")
+        self.assertEqual(decision.tool_input, {"query": "auriculares"})
+
+    def test_several_products_become_one_multi_call_decision(self):
+        llm = FakeIntentLlm("buscar_producto", "auriculares")
+        llm.search_requests = [SearchRequest(query="auriculares"), SearchRequest(query="cafetera", max_price=300)]
+        decision, _ = self._run("Quiero auriculares y una cafetera de menos de 300", llm)
+        self.assertEqual(decision.next_action, "call_tool")
+        self.assertIsNone(decision.tool_to_call)
+        self.assertEqual([c.tool_input for c in decision.tool_calls],
+                         [{"query": "auriculares"}, {"query": "cafetera", "max_price": 300.0}])
+
+    def test_saturated_pool_skips_the_speculation(self):
+        with patch("src.agent.master_agent._speculation_slots", threading.BoundedSemaphore(1)) as slots:
+            slots.acquire() # Otra sesión ocupa el único hilo
+            decision, searches = self._run("quiero unos auriculares", FakeIntentLlm("buscar_producto", "auriculares"))
+            self.assertEqual(searches, []) # No se encoló
+            self.assertEqual(decision.next_action, "call_tool") # Se busca por el camino normal
+            slots.release()
+            self._run("quiero unos auriculares", FakeIntentLlm("buscar_producto", "auriculares"))
+            self.assertTrue(slots.acquire(timeout=1)) # El cupo se devuelve al terminar
+
+    def test_other_intents_discard_the_speculation(self):
+        decision, _ = self._run("auriculares, crea mi plan", FakeIntentLlm("crear_plan"))
+        self.assertEqual(decision.next_action, "respond_to_user")
+        self.assertNotIn("Auriculares ProSound", decision.response_text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+
+from src.agent.graph import product_matching_and_enrichment
+from src.utils.catalog_store import get_catalog_store
+
+
+class TestProductMatching(unittest.TestCase):
+
+    def setUp(self):
+        self.products = [
+            {"id": "MP001", "name": "Smartphone Avanzado XZ100", "category": "Electrónica", "price": 799.99, "stock": 10},
+            {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "category": "Electrónica", "price": 149.50, "stock": 0},
+            {"id": "MP003", "name": "Cafetera Espresso Automática", "category": "Hogar", "price": 299.00, "stock": 5},
+        ]
+        # El nodo lee el catálogo del store compartido, no del estado.
+        get_catalog_store().load(self.products)
+
+    def tearDown(self):
+        get_catalog_store().load([])
+
+    def _enrich(self, ia_items, cart_items=None):
+        state = {
+            "ia_categorized_wishlist": ia_items,
+            "raw_cart_items": cart_items or [],
+        }
+        result = product_matching_and_enrichment(state)
+        self.assertNotIn("marketplace_products", result)
+        self.assertEqual(result['catalog_version'], get_catalog_store().version)
+        return result['enriched_wishlist']
+
+    def test_substring_match(self):
+        enriched = self._enrich([{"identified_product_name": "Cafetera Espresso", "category": "Hogar"}])
+        self.assertEqual(enriched[0]['marketplace_details']['id'], "MP003")
+        self.assertEqual(enriched[0]['match_method'], "substring")
+
+    def test_exact_match(self):
+        enriched = self._enrich([{"identified_product_name": "smartphone avanzado xz100", "category": "Electrónica"}])
+        self.assertEqual(enriched[0]['match_method'], "exact")
+        self.assertEqual(enriched[0]['match_score'], 1.0)
+
+    def test_trigram_fallback(self):
+        enriched = self._enrich([{"identified_product_name": "Auriculares ProSound de AudioMax", "category": "Electrónica"}])
+        self.assertEqual(enriched[0]['marketplace_details']['id'], "MP002")
+        self.assertEqual(enriched[0]['match_method'], "trigram")
+        self.assertGreater(enriched[0]['match_score'], 0.5)
+        self.assertFalse(enriched[0]['in_stock'])
+
+    def test_tfidf_fallback(self):
+        enriched = self._enrich([{"identified_product_name": "Máquina para preparar café", "category": "Hogar", "key_features": ["espresso"]}])
+        self.assertEqual(enriched[0]['marketplace_details']['id'], "MP003")
+        self.assertEqual(enriched[0]['match_method'], "tfidf")
+
+    def test_tfidf_batch_only_includes_unmatched_items(self):
+        items = [{"identified_product_name": "Cafetera Espresso", "category": "Hogar"},
+                 {"identified_product_name": "Máquina para preparar café", "category": "Hogar", "key_features": ["espresso"]}]
+        with patch("src.agent.graph.TfidfVectorIndex.query_batch", autospec=True,
+                   side_effect=lambda index, texts, **kwargs: [[] for _ in texts]) as query_batch:
+            enriched = self._enrich(items)
+        self.assertEqual(query_batch.call_args.args[1], ["Máquina para preparar café espresso"])
+        self.assertEqual(enriched[0]['match_method'], "substring")
+
+    def test_resolved_items_use_catalog_id(self):
+        enriched = self._enrich([{"identified_product_name": "Smartphone Avanzado XZ100", "category": "Electrónica",
+                                  "resolved_product_id": "MP001", "resolution_method": "link"}])
+        self.assertEqual(enriched[0]['marketplace_details']['id'], "MP001")
+        self.assertEqual((enriched[0]['match_method'], enriched[0]['match_score']), ("link", 1.0))
+
+    def test_no_match(self):
+        enriched = self._enrich([{"identified_product_name": "Viaje a la playa", "category": None}])
+        self.assertIsNone(enriched[0]['marketplace_details'])
+        self.assertIsNone(enriched[0]['match_method'])
+
+    def test_cart_items_matched_by_id(self):
+        enriched = self._enrich([], [{"product_id": "MP001", "quantity": 1, "source": "abandoned_cart"}])
+        self.assertEqual(enriched[0]['identified_product_name'], "Smartphone Avanzado XZ100")
+        self.assertTrue(enriched[0]['in_stock'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from src.agent.search_handler import catalog_search_tool # <--- CAMBIO AQUÍ
+from src.agent.search_handler import DEFAULT_PAGE_SIZE, catalog_search_page_tool, catalog_search_tool, search_catalog, search_catalog_cached, search_result_cache # <--- CAMBIO AQUÍ
+from src.utils.catalog_store import get_catalog_store
 
 class TestSearchHandler(unittest.TestCase):
 
@@ -122,6 +123,82 @@ class TestSearchHandler(unittest.TestCase):
         results = catalog_search_tool.invoke({"marketplace_products": [], "query": "smartphone"})
         self.assertEqual(len(results), 0)
 
+    def test_search_ranked_mode(self):
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "recetas de cocina", "ranked": True})
+        self.assertEqual([r['id'] for r in results], ["MP005", "MP003"]) # El libro de recetas es más relevante
+
+    def test_search_ranked_mode_with_filters(self):
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "cocina", "ranked": True, "category": "Hogar"})
+        self.assertEqual([r['id'] for r in results], ["MP003"])
+
+    def test_search_ranked_mode_keeps_only_the_page(self):
+        page = search_catalog(self.mock_products, query="recetas de cocina", ranked=True, limit=1)
+        self.assertEqual(([r['id'] for r in page['results']], page['total_count']), (["MP005"], 2))
+        page = search_catalog(self.mock_products, query="recetas de cocina", ranked=True, limit=1, offset=1)
+        self.assertEqual([r['id'] for r in page['results']], ["MP003"])
+
+    def test_search_results_ranked_by_relevance(self):
+        # "cocina" está en el nombre del libro (más peso) y solo en las etiquetas de la cafetera.
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "cocina"})
+        self.assertEqual([r['id'] for r in results], ["MP005", "MP003"])
+
+    def test_search_without_query_sorted_by_rating(self):
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "category": "Electrónica"})
+        self.assertEqual([r['id'] for r in results], ["MP001", "MP002", "MP004"])
+
+    def test_search_pagination(self):
+        page = search_catalog(self.mock_products, limit=2, offset=1)
+        self.assertEqual(page['total_count'], 5)
+        self.assertEqual([r['id'] for r in page['results']], ["MP001", "MP002"]) # Ratings 4.9, 4.8, 4.6...
+        self.assertEqual((page['limit'], page['offset']), (2, 1))
+
+        last_page = search_catalog(self.mock_products, limit=2, offset=4)
+        self.assertEqual([r['id'] for r in last_page['results']], ["MP005"])
+
+    def test_search_limit_via_tool(self):
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "limit": 1})
+        self.assertEqual([r['id'] for r in results], ["MP003"])
+
+    def test_search_page_total_count_with_query(self):
+        page = search_catalog(self.mock_products, query="cocina", limit=1)
+        self.assertEqual(page['total_count'], 2)
+        self.assertEqual(len(page['results']), 1)
+
+    def test_search_ignores_accents_and_plurals(self):
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "cafeteras automaticas"})
+        self.assertEqual([r['id'] for r in results], ["MP003"])
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "category": "electronica", "brand": "audiomax"})
+        self.assertEqual([r['id'] for r in results], ["MP002"])
+
+    def test_partial_words_match_as_prefixes(self):
+        page = search_catalog(self.mock_products, query="cafet")
+        self.assertEqual(([r['id'] for r in page['results']], page['corrections']), (["MP003"], []))
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "smartph avanz"})
+        self.assertEqual([r['id'] for r in results], ["MP001"])
+        # "smart" es una palabra del catálogo (Smart TV): se busca exacta, no como prefijo.
+        results = catalog_search_tool.invoke({"marketplace_products": self.mock_products, "query": "smart"})
+        self.assertEqual([r['id'] for r in results], ["MP004"])
+
+    def test_stopword_only_query_falls_back_to_substring(self):
+        page = search_catalog(self.mock_products, query="de")
+        self.assertEqual({r['id'] for r in page['results']}, {"MP005"}) # "Libro de Cocina Saludable"
+        page = search_catalog(self.mock_products, query="de", category="Electrónica")
+        self.assertEqual(page['total_count'], 0)
+        self.assertEqual(search_catalog(self.mock_products, query="¿?")['total_count'], len(self.mock_products))
+
+    def test_tool_pages_are_bounded_by_default(self):
+        many = [{"id": f"P{i}", "name": f"Cable USB {i}", "price": 5.0} for i in range(DEFAULT_PAGE_SIZE + 5)]
+        self.assertEqual(len(catalog_search_tool.invoke({"marketplace_products": many, "query": "cable"})), DEFAULT_PAGE_SIZE)
+        page = catalog_search_page_tool.invoke({"marketplace_products": many, "query": "cable", "offset": DEFAULT_PAGE_SIZE})
+        self.assertEqual((len(page['results']), page['total_count'], page['limit']), (5, DEFAULT_PAGE_SIZE + 5, DEFAULT_PAGE_SIZE))
+
+    def test_search_corrects_typos(self):
+        page = search_catalog(self.mock_products, query="auriculres")
+        self.assertEqual([r['id'] for r in page['results']], ["MP002"])
+        self.assertEqual(page['corrections'], [{"original": "auriculres", "corrected": "auriculares", "distance": 1}])
+        page = search_catalog(self.mock_products, query="auriculres", correct_spelling=False)
+        self.assertEqual((page['total_count'], page['corrections']), (0, []))
+
     def test_search_product_without_optional_fields(self):
         product_sin_campos = [{"id": "P_SIN", "name": "Producto Pelado"}] # Sin precio, categoria, etc.
         results_query = catalog_search_tool.invoke({"marketplace_products": product_sin_campos, "query": "Pelado"})
@@ -134,5 +211,47 @@ class TestSearchHandler(unittest.TestCase):
         self.assertEqual(len(results_stock), 0) # No debería fallar, pero no machea (stock 0 por defecto)
 
 
+class TestCachedSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = get_catalog_store()
+        self.catalog.load([
+            {"id": "MP002", "name": "Auriculares ProSound", "price": 149.50, "stock": 3, "tags": ["audio"]},
+            {"id": "MP006", "name": "Auriculares Sport", "price": 59.90, "stock": 0, "tags": ["audio"]},
+        ])
+        search_result_cache.clear()
+
+    def tearDown(self):
+        self.catalog.load([])
+        search_result_cache.clear()
+
+    def test_repeated_search_hits_cache(self):
+        first = search_catalog_cached(self.catalog.products, query="Auriculares", limit=5)
+        second = search_catalog_cached(self.catalog.products, query="  auriculares ", limit=5)
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual([p['id'] for p in first["results"]], [p['id'] for p in second["results"]])
+        self.assertEqual(search_result_cache.stats()["hits"], 1)
+
+    def test_corrected_query_shares_cache_entry(self):
+        search_catalog_cached(self.catalog.products, query="auriculares", limit=5)
+        page = search_catalog_cached(self.catalog.products, query="auriculres", limit=5)
+        self.assertTrue(page["cached"])
+        self.assertEqual(page["corrections"][0]["corrected"], "auriculares")
+        self.assertEqual(page["total_count"], 2)
+
+    def test_delta_invalidates_cache(self):
+        search_catalog_cached(self.catalog.products, query="auriculares", in_stock=True)
+        self.catalog.apply_delta(upserts=[{"id": "MP006", "stock": 8}])
+        page = search_catalog_cached(self.catalog.products, query="auriculares", in_stock=True)
+        self.assertFalse(page["cached"])
+        self.assertEqual(page["total_count"], 2) # El nuevo stock ya se ve en el filtro
+
+    def test_foreign_product_list_is_not_cached(self):
+        products = [{"id": "X", "name": "Auriculares"}]
+        self.assertFalse(search_catalog_cached(products, query="auriculares")["cached"])
+        self.assertFalse(search_catalog_cached(products, query="auriculares")["cached"])
+
+
 if __name__ == '__main__':
     unittest.main()
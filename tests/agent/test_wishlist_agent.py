@@ -0,0 +1,162 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from langchain_core.runnables import RunnableLambda
+
+from src.agent.planner_models import compact_advice_payload
+from src.agent.wishlist_agent import (
+    ExtractedItemFields, analyze_social_media_item, compact_item_context, run_wishlist_agent,
+)
+from src.utils.catalog_store import get_catalog_store
+from src.utils.wishlist_watermarks import WishlistWatermarkStore
+
+INSTAGRAM_ITEM = {
+    "post_id": "INSTA_POST_001",
+    "source_url": "https://instagram.com/p/INSTA_POST_001",
+    "image_url": "https://example.com/images/insta_save_01.jpg",
+    "caption": "¡Me encantan estos nuevos auriculares! #AudioMax #ProSound",
+    "detected_product_name": "Auriculares Inalámbricos ProSound",
+    "desired_price": None,
+    "saved_at": "2023-12-01T10:30:00Z",
+}
+
+
+class FakeStructuredLlm:
+    """LLM falso: registra los prompts y devuelve una instancia fija del esquema pedido."""
+
+    def __init__(self):
+        self.prompts = []
+        self.schemas = []
+
+    def with_structured_output(self, schema):
+        self.schemas.append(schema)
+
+        def respond(prompt_value):
+            self.prompts.append(prompt_value.to_string())
+            return schema(identified_product_name="Auriculares ProSound", category="Electrónica",
+                          key_features=["AudioMax"], user_sentiment_or_intent="deseo fuerte")
+        return RunnableLambda(respond)
+
+
+class TestCompactPrompts(unittest.TestCase):
+
+    def test_context_keeps_only_relevant_fields_minified(self):
+        self.assertEqual(compact_item_context(INSTAGRAM_ITEM), '{"detected_product_name":"Auriculares Inalámbricos ProSound"}')
+
+    def test_compact_mode_reattaches_original_item_locally(self):
+        llm = FakeStructuredLlm()
+        item = analyze_social_media_item(llm, INSTAGRAM_ITEM["caption"], "instagram", INSTAGRAM_ITEM, compact=True)
+
+        self.assertIs(llm.schemas[0], ExtractedItemFields)
+        self.assertEqual(item.original_text, INSTAGRAM_ITEM["caption"])
+        self.assertEqual(item.source, "instagram")
+        self.assertEqual(item.original_item_details, INSTAGRAM_ITEM)
+        self.assertEqual(item.identified_product_name, "Auriculares ProSound")
+        # El prompt no incluye IDs, URLs ni fechas del item original.
+        self.assertNotIn("INSTA_POST_001", llm.prompts[0])
+        self.assertNotIn("saved_at", llm.prompts[0])
+
+    def test_advice_payload_drops_empty_fields(self):
+        payload = compact_advice_payload({"product_name": "Cafetera", "product_price": "299.0",
+                                          "key_features": "", "product_category": "N/A"})
+        self.assertEqual(json.loads(payload["product"]), {"product_name": "Cafetera", "product_price": "299.0"})
+
+
+class TestIncrementalWishlist(unittest.TestCase):
+
+    def _state(self, *items):
+        return {"instagram_saves": {"user_id": "u1", "saved_items": list(items)},
+                "pinterest_boards": {"user_id": "u1", "boards": []}}
+
+    def test_only_new_items_reach_the_llm(self):
+        llm = FakeStructuredLlm()
+        store = WishlistWatermarkStore(path=None)
+        newer = {**INSTAGRAM_ITEM, "post_id": "INSTA_POST_002", "saved_at": "2023-12-09T08:00:00Z"}
+        with patch("src.agent.wishlist_agent.get_llm", return_value=llm):
+            first = run_wishlist_agent(self._state(INSTAGRAM_ITEM), store)
+            second = run_wishlist_agent(self._state(INSTAGRAM_ITEM), store)
+            third = run_wishlist_agent(self._state(newer, INSTAGRAM_ITEM), store)
+            fourth = run_wishlist_agent(self._state(newer), store) # El usuario borró el primer post
+
+        self.assertEqual(len(llm.prompts), 2) # Una llamada para cada post, nunca repetida
+        self.assertEqual(len(first["ia_categorized_wishlist"]), 1)
+        self.assertEqual(second["ia_categorized_wishlist"], first["ia_categorized_wishlist"])
+        self.assertEqual([i["original_item_details"]["post_id"] for i in third["ia_categorized_wishlist"]],
+                         ["INSTA_POST_002", "INSTA_POST_001"])
+        self.assertEqual([i["original_item_details"]["post_id"] for i in fourth["ia_categorized_wishlist"]],
+                         ["INSTA_POST_002"])
+
+    def test_cross_source_duplicates_are_not_analyzed(self):
+        llm = FakeStructuredLlm()
+        state = self._state(INSTAGRAM_ITEM)
+        state["wishlist_clusters"] = [{
+            "cluster_id": "C1", "product_id": "MP002",
+            "representative": {"source": "abandoned_cart", "key": "CART_001:MP002"},
+            "members": [{"source": "instagram", "key": "INSTA_POST_001"}, {"source": "abandoned_cart", "key": "CART_001:MP002"}],
+        }]
+        with patch("src.agent.wishlist_agent.get_llm", return_value=llm):
+            updates = run_wishlist_agent(state, WishlistWatermarkStore(path=None))
+        self.assertEqual(llm.prompts, []) # El carrito ya identifica el producto: no se llama al LLM
+        self.assertEqual(updates["ia_categorized_wishlist"], [])
+
+    def test_duplicate_is_analyzed_once_its_representative_is_removed(self):
+        llm = FakeStructuredLlm()
+        store = WishlistWatermarkStore(path=None)
+        post_a = {**INSTAGRAM_ITEM, "post_id": "A", "saved_at": "2023-12-05T10:00:00Z"}
+        post_b = {**INSTAGRAM_ITEM, "post_id": "B", "detected_product_name": "Cafetera", "saved_at": "2023-12-09T10:00:00Z"}
+        post_c = {**INSTAGRAM_ITEM, "post_id": "C", "saved_at": "2023-12-01T10:00:00Z"} # Mismo producto que A, anterior
+        state = self._state(post_a, post_b, post_c)
+        state["wishlist_clusters"] = [{
+            "cluster_id": "C1", "product_id": None,
+            "representative": {"source": "instagram", "key": "A"},
+            "members": [{"source": "instagram", "key": "A"}, {"source": "instagram", "key": "C"}],
+        }]
+        with patch("src.agent.wishlist_agent.get_llm", return_value=llm):
+            first = run_wishlist_agent(state, store)
+            second = run_wishlist_agent(self._state(post_b, post_c), store) # El usuario borró A
+
+        self.assertEqual([i["original_item_details"]["post_id"] for i in first["ia_categorized_wishlist"]], ["A", "B"])
+        self.assertEqual([i["original_item_details"]["post_id"] for i in second["ia_categorized_wishlist"]], ["B", "C"])
+        self.assertEqual(len(llm.prompts), 3) # A y B en la primera ejecución; C solo al dejar de ser duplicado
+
+    def test_items_resolved_from_catalog_skip_the_llm(self):
+        get_catalog_store().load([
+            {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "category": "Electrónica",
+             "brand": "AudioMax", "tags": ["auriculares", "bluetooth"], "price": 149.5, "stock": 10},
+        ])
+        self.addCleanup(get_catalog_store().load, [])
+        unresolved = {**INSTAGRAM_ITEM, "post_id": "INSTA_POST_003", "detected_product_name": None}
+        llm = FakeStructuredLlm()
+        with patch("src.agent.wishlist_agent.get_llm", return_value=llm):
+            updates = run_wishlist_agent(self._state(INSTAGRAM_ITEM, unresolved), WishlistWatermarkStore(path=None))
+
+        self.assertEqual(len(llm.prompts), 1) # Solo el item sin nombre detectado pasa por el LLM
+        resolved = updates["ia_categorized_wishlist"][0]
+        self.assertEqual(resolved["resolved_product_id"], "MP002")
+        self.assertEqual(resolved["resolution_method"], "exact_name")
+        self.assertEqual(resolved["category"], "Electrónica")
+        self.assertEqual(resolved["key_features"], ["AudioMax", "auriculares", "bluetooth"])
+
+    def test_catalog_items_survive_a_missing_llm(self):
+        get_catalog_store().load([
+            {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "category": "Electrónica",
+             "brand": "AudioMax", "tags": ["auriculares"], "price": 149.5, "stock": 10},
+        ])
+        self.addCleanup(get_catalog_store().load, [])
+        unresolved = {**INSTAGRAM_ITEM, "post_id": "INSTA_POST_003", "detected_product_name": None}
+        store = WishlistWatermarkStore(path=None)
+        with patch("src.agent.wishlist_agent.get_llm", side_effect=ValueError("sin API key")):
+            first = run_wishlist_agent(self._state(INSTAGRAM_ITEM, unresolved), store)
+        llm = FakeStructuredLlm()
+        with patch("src.agent.wishlist_agent.get_llm", return_value=llm):
+            second = run_wishlist_agent(self._state(INSTAGRAM_ITEM, unresolved), store)
+
+        self.assertEqual([i["resolved_product_id"] for i in first["ia_categorized_wishlist"]], ["MP002"])
+        self.assertEqual(first["wishlist_agent_error"], "Fallo al inicializar LLM: sin API key")
+        self.assertEqual(len(llm.prompts), 1) # El item sin resolver se reintenta con el LLM disponible
+        self.assertEqual(len(second["ia_categorized_wishlist"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
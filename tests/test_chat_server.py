@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+import unittest
+from types import SimpleNamespace
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agent.graph import create_conversational_graph
+from src.chat_server import ChatServer
+from src.utils.catalog_store import get_catalog_store
+
+
+class SlowApp:
+    """Grafo falso cuyos turnos "lento" bloquean un hilo del executor hasta `release`."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.finished = []
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"conversation_history": []})
+
+    async def ainvoke(self, turn_input, config):
+        return await asyncio.to_thread(self._run, turn_input["current_user_input"])
+
+    def _run(self, text):
+        if text == "lento":
+            self.release.wait(timeout=5)
+        self.finished.append(text)
+        return {"master_agent_decision": {"response_text": f"ok: {text}", "next_action": "respond_to_user"}}
+
+
+class TestChatServer(unittest.TestCase):
+
+    def setUp(self):
+        get_catalog_store().load([
+            {"id": "MP003", "name": "Cafetera Espresso Automática", "category": "Hogar", "price": 299.00, "currency": "USD", "stock": 5},
+            {"id": "MP004", "name": "Auriculares ProSound", "category": "Electrónica", "price": 149.50, "currency": "USD", "stock": 2},
+        ])
+        self.app = create_conversational_graph(checkpointer=InMemorySaver())
+
+    def tearDown(self):
+        get_catalog_store().load([])
+
+    def test_concurrent_sessions_are_isolated(self):
+        server = ChatServer(self.app, max_concurrent_turns=8)
+
+        async def scenario():
+            queries = {f"s{i}": ("busca cafetera" if i % 2 else "busca auriculares") for i in range(40)}
+            replies = await asyncio.gather(*(server.handle_turn(sid, text) for sid, text in queries.items()))
+            return queries, replies
+
+        queries, replies = asyncio.run(scenario())
+        for reply in replies:
+            expected = "Cafetera" if "cafetera" in queries[reply["session"]] else "Auriculares"
+            self.assertIn(expected, reply["response"])
+        for sid in ("s1", "s2"):
+            history = self.app.get_state({"configurable": {"thread_id": sid}}).values["conversation_history"]
+            self.assertEqual(tuple(history[0]), ("user", queries[sid]))
+            self.assertEqual(len(history), 2)
+        self.assertEqual(server.stats["turns"], 40)
+        self.assertEqual(server._session_locks, {}) # Los locks de sesión se liberan al terminar
+
+    def test_rejects_turns_beyond_pending_limit(self):
+        server = ChatServer(self.app, max_concurrent_turns=1, max_pending_turns=1)
+
+        async def scenario():
+            return await asyncio.gather(*(server.handle_turn(f"s{i}", "busca cafetera") for i in range(5)))
+
+        replies = asyncio.run(scenario())
+        self.assertEqual(sum(1 for r in replies if r.get("busy")), 3)
+        self.assertEqual(server.stats["rejected"], 3)
+
+    def test_timed_out_turn_keeps_its_session_busy_until_it_ends(self):
+        app = SlowApp()
+        server = ChatServer(app, turn_timeout=0.05)
+
+        async def scenario():
+            timed_out = await server.handle_turn("s1", "lento")
+            overlapping = await server.handle_turn("s1", "rápido") # El turno vencido sigue corriendo
+            other_session = await server.handle_turn("s2", "rápido")
+            app.release.set()
+            while "s1" in server._late_sessions:
+                await asyncio.sleep(0.01)
+            after = await server.handle_turn("s1", "después")
+            return timed_out, overlapping, other_session, after
+
+        timed_out, overlapping, other_session, after = asyncio.run(scenario())
+        self.assertIn("error", timed_out)
+        self.assertTrue(overlapping.get("busy"))
+        self.assertEqual(other_session["response"], "ok: rápido")
+        self.assertEqual(after["response"], "ok: después")
+        self.assertEqual(app.finished, ["rápido", "lento", "después"]) # "rápido" de s1 nunca corrió
+        self.assertEqual((server._session_locks, server._admitted), ({}, 0))
+
+    def test_line_protocol_roundtrip(self):
+        server = ChatServer(self.app)
+
+        async def scenario():
+            tcp_server = await server.start("127.0.0.1", 0)
+            port = tcp_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(json.dumps({"session": "tcp", "text": "busca cafetera"}).encode() + b"\n")
+            writer.write(b"busca auriculares\n") # Texto plano: sesión por defecto de la conexión
+            await writer.drain()
+            first = json.loads(await reader.readline())
+            second = json.loads(await reader.readline())
+            writer.close()
+            tcp_server.close()
+            await tcp_server.wait_closed()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first["session"], "tcp")
+        self.assertIn("Cafetera", first["response"])
+        self.assertNotEqual(second["session"], "tcp")
+        self.assertIn("Auriculares", second["response"])
+
+
+if __name__ == '__main__':
+    unittest.main()
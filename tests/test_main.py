@@ -0,0 +1,54 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from src.main import AgentWarmup
+from src.utils.catalog_store import get_catalog_store
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_main_import_does_not_load_heavy_modules(self):
+        # Se ejecuta en un proceso nuevo para no depender de lo que otros tests ya importaron.
+        code = "import src.main; from src.utils.import_report import loaded_heavy_modules; print(','.join(loaded_heavy_modules()))"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1] if output.strip() else "", "")
+
+    def test_warmup_prepares_agent_and_reports_timings(self):
+        warmup = AgentWarmup().start()
+        self.assertTrue(warmup.ready.wait(timeout=60))
+        self.addCleanup(get_catalog_store().load, [])
+        self.assertIsNone(warmup.error)
+        self.assertIsNotNone(warmup.agent_app)
+        # El estado solo referencia la versión del catálogo compartido, nunca los productos.
+        self.assertNotIn("marketplace_products", warmup.agent_state)
+        self.assertEqual(warmup.agent_state["catalog_version"], get_catalog_store().version)
+        self.assertGreater(len(get_catalog_store()), 0)
+        self.assertIsNotNone(get_catalog_store().get_index("bm25"))
+        self.assertIn("compilar grafo", warmup.timings)
+        self.assertIn("import src.agent.graph", warmup.timings)
+
+    def test_warmup_resumes_saved_session(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        self.addCleanup(get_catalog_store().load, [])
+        db_path = os.path.join(tmp_dir, "sessions.sqlite3")
+
+        first = AgentWarmup(session_id="s1", db_path=db_path).run_blocking()
+        self.assertIsNone(first.error)
+        self.assertFalse(first.resumed)
+        first.agent_app.invoke({**first.agent_state, "current_user_input": "busca cafetera"}, config=first.session_config)
+
+        second = AgentWarmup(session_id="s1", db_path=db_path).run_blocking()
+        self.assertIsNone(second.error)
+        self.assertTrue(second.resumed)
+        self.assertIsNone(second.agent_state) # No se recargan wishlists ni carritos
+        history = second.agent_app.get_state(second.session_config).values["conversation_history"]
+        self.assertEqual(tuple(history[0]), ("user", "busca cafetera")) # Serializado como lista
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from src.utils.bm25_index import Bm25Index
+
+
+class TestBm25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = Bm25Index()
+        self.index.rebuild([
+            {"id": "A", "name": "Cafetera Espresso", "tags": ["cocina"], "description": "Café perfecto"},
+            {"id": "B", "name": "Libro de Cocina", "tags": ["cocina", "recetas"], "description": "Recetas fáciles"},
+            {"id": "C", "name": "Smart TV", "tags": ["tv"], "description": "Imágenes vibrantes"},
+        ])
+
+    def _ids(self, query):
+        return {product['id']: score for product, score in self.index.iter_matches(query)}
+
+    def test_all_terms_required(self):
+        self.assertEqual(set(self._ids("cocina")), {"A", "B"})
+        self.assertEqual(set(self._ids("cocina recetas")), {"B"})
+        self.assertEqual(self._ids("cocina tv"), {})
+
+    def test_name_matches_score_higher(self):
+        scores = self._ids("cocina")
+        self.assertGreater(scores["B"], scores["A"])
+
+    def test_unknown_terms_match_as_prefixes(self):
+        self.assertEqual(set(self._ids("cafet")), {"A"})
+        self.assertEqual(set(self._ids("rece coc")), {"B"})
+        self.assertEqual(self._ids("ca"), {}) # Prefijo demasiado corto
+        self.index.upsert({"id": "D", "name": "Cafetal Orgánico"}) # El vocabulario ordenado sigue a los deltas
+        self.assertEqual(set(self._ids("cafet")), {"A", "D"})
+        self.index.remove("A")
+        self.assertEqual(self.index.terms_with_prefix("cafet"), ["cafetal"])
+
+    def test_incremental_updates(self):
+        self.index.upsert({"id": "C", "name": "Olla de cocina"})
+        self.assertIn("C", self._ids("cocina"))
+        self.index.remove("A")
+        self.assertEqual(set(self._ids("cocina")), {"B", "C"})
+        self.assertEqual(self._ids("espresso"), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from src.utils.catalog_store import CatalogStore, index_for
+
+
+class RecordingIndex:
+    """Índice de prueba que registra las llamadas recibidas del store."""
+
+    def __init__(self):
+        self.ids = set()
+        self.rebuilds = 0
+
+    def rebuild(self, products):
+        self.rebuilds += 1
+        self.ids = {p['id'] for p in products}
+
+    def upsert(self, product):
+        self.ids.add(product['id'])
+
+    def remove(self, product_id):
+        self.ids.discard(product_id)
+
+
+class TestCatalogStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CatalogStore([
+            {"id": "MP001", "name": "Smartphone", "price": 799.99, "stock": 10},
+            {"id": "MP002", "name": "Auriculares", "price": 149.50, "stock": 0},
+            {"id": "MP003", "name": "Cafetera", "price": 299.00, "stock": 5},
+        ])
+        self.index = self.store.register_index("recording", RecordingIndex())
+
+    def test_load_builds_id_map_and_version(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.get("MP002")["name"], "Auriculares")
+        self.assertIsNone(self.store.get("NOPE"))
+        self.assertEqual(self.store.version, 1)
+
+    def test_partial_update_in_place(self):
+        products = self.store.products
+        summary = self.store.apply_delta(upserts=[{"id": "MP002", "stock": 7, "price": 139.0}])
+        self.assertEqual(summary["updated"], 1)
+        self.assertIs(self.store.products, products) # Misma lista, actualizada en el lugar
+        self.assertEqual(self.store.get("MP002")["stock"], 7)
+        self.assertEqual(self.store.get("MP002")["name"], "Auriculares") # Campos no enviados se conservan
+        self.assertEqual(self.store.version, 2)
+
+    def test_insert_and_delete(self):
+        summary = self.store.apply_delta(
+            upserts=[{"id": "MP004", "name": "Smart TV", "price": 499.0, "stock": 3}],
+            deletes=["MP001", "NOPE"]
+        )
+        self.assertEqual((summary["inserted"], summary["deleted"], summary["skipped"]), (1, 1, 1))
+        self.assertNotIn("MP001", self.store)
+        self.assertEqual(len(self.store), 3)
+        for product in self.store.products: # El mapa de IDs sigue siendo consistente tras el borrado
+            self.assertIs(self.store.get(product["id"]), product)
+        self.assertEqual(self.index.ids, {"MP002", "MP003", "MP004"})
+
+    def test_empty_delta_keeps_version(self):
+        summary = self.store.apply_delta(upserts=[{"name": "sin id"}])
+        self.assertEqual(summary["skipped"], 1)
+        self.assertEqual(summary["version"], 1)
+
+    def test_full_reload_rebuilds_indexes(self):
+        self.store.load([{"id": "X1", "name": "Otro"}])
+        self.assertEqual(self.index.ids, {"X1"})
+        self.assertEqual(self.index.rebuilds, 2)
+
+    def test_index_for_foreign_list_builds_temporary_index(self):
+        products = [{"id": "T1"}]
+        index = index_for(products, "recording", RecordingIndex)
+        self.assertEqual(index.ids, {"T1"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from unittest.mock import patch
+
+from src.utils import config
+
+
+class TestGetLlm(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(config._llm_pool.clear)
+
+    @patch.dict("os.environ", {"OPENAI_API_KEY": "sk-test", "OPENAI_MODEL_NAME": "gpt-4o-mini"})
+    def test_instances_are_shared_per_model_and_temperature(self):
+        first = config.get_llm(temperature=0.0)
+        self.assertIs(config.get_llm(temperature=0), first)
+        self.assertIsNot(config.get_llm(temperature=0.7), first)
+
+    @patch("src.utils.config.load_dotenv")
+    @patch.dict("os.environ", {"OPENAI_API_KEY": ""})
+    def test_missing_api_key_raises(self, _):
+        with self.assertRaises(ValueError):
+            config.get_llm()
+
+
+if __name__ == '__main__':
+    unittest.main()
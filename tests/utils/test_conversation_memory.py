@@ -0,0 +1,39 @@
+import unittest
+
+from src.utils.conversation_memory import bounded_append, evicted_entries, fold_into_summary
+
+
+class TestConversationMemory(unittest.TestCase):
+
+    def test_bounded_append_keeps_latest_entries(self):
+        history = [("user", f"m{i}") for i in range(4)]
+        merged = bounded_append(history, [("ai", "r")], max_entries=3)
+        self.assertEqual(merged, [("user", "m2"), ("user", "m3"), ("ai", "r")])
+        self.assertEqual(len(history), 4) # No muta la entrada
+
+    def test_evicted_entries_match_bounded_append(self):
+        history = [("user", "a"), ("ai", "b"), ("user", "c")]
+        update = [("ai", "d"), ("user", "e")]
+        evicted = evicted_entries(history, update, max_entries=3)
+        self.assertEqual(evicted, [("user", "a"), ("ai", "b")])
+        self.assertEqual(evicted + bounded_append(history, update, max_entries=3), history + update)
+        self.assertEqual(evicted_entries(history, [], max_entries=3), [])
+
+    def test_summary_keeps_user_messages_and_is_bounded(self):
+        summary = fold_into_summary(None, [("user", "busca cafetera"), ("ai", "Ok, voy a buscar...")])
+        self.assertEqual(summary, "busca cafetera")
+        summary = fold_into_summary(summary, [("user", "  algo   para   regalar ")])
+        self.assertEqual(summary, "busca cafetera; algo para regalar")
+
+        long_summary = None
+        for i in range(100):
+            long_summary = fold_into_summary(long_summary, [("user", f"mensaje número {i} " + "x" * 200)], max_chars=200)
+        self.assertLessEqual(len(long_summary), 200)
+        self.assertIn("mensaje número 99", long_summary) # Se descartan primero las frases antiguas
+
+    def test_summary_ignores_empty_input(self):
+        self.assertIsNone(fold_into_summary(None, [("ai", "hola")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from src.utils.cooccurrence_index import CoOccurrenceIndex, product_id_from_pin
+
+
+class TestCoOccurrenceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = CoOccurrenceIndex(top_n=2)
+        self.index.add_carts([
+            {"cart_id": "C1", "items": [{"product_id": "MP001"}, {"product_id": "MP002"}]},
+            {"cart_id": "C2", "items": [{"product_id": "MP001"}, {"product_id": "MP002"}, {"product_id": "MP004"}]},
+            {"cart_id": "C3", "items": [{"product_id": "MP003"}]}, # Un solo producto: no aporta pares
+        ])
+
+    def test_counts_pairs_symmetrically(self):
+        self.assertEqual(self.index.frequently_together("MP001"), [("MP002", 2.0), ("MP004", 1.0)])
+        self.assertEqual(self.index.frequently_together("MP004"), [("MP002", 1.0), ("MP001", 1.0)])
+        self.assertEqual(self.index.frequently_together("MP003"), [])
+        self.assertEqual(self.index.baskets, 2)
+
+    def test_duplicates_in_basket_count_once(self):
+        self.index.add_basket(["MP005", "MP005", "MP006"])
+        self.assertEqual(self.index.frequently_together("MP005"), [("MP006", 1.0)])
+
+    def test_rows_are_pruned_to_bounded_size(self):
+        index = CoOccurrenceIndex(top_n=2, max_candidates=4)
+        for _ in range(5):
+            index.add_basket(["A", "B"])
+        for i in range(20): # Muchos vecinos esporádicos de "A"
+            index.add_basket(["A", f"X{i}"])
+        self.assertLessEqual(len(index._rows["A"]), 4)
+        self.assertEqual(index.frequently_together("A", k=1), [("B", 5.0)])
+
+    def test_pinterest_boards_use_product_links(self):
+        self.assertEqual(product_id_from_pin({"link": "https://example.com/products/MP003?ref=pin"}), "MP003")
+        self.assertIsNone(product_id_from_pin({"link": None}))
+        self.index.add_pinterest_boards({"boards": [{"pins": [
+            {"link": "https://example.com/products/MP003"},
+            {"link": "https://example.com/products/MP005"},
+        ]}]})
+        self.assertEqual(self.index.frequently_together("MP003"), [("MP005", 0.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from src.utils.llm_accounting import TokenLedger, llm_attribution, llm_ledger, model_prices
+from src.utils.llm_scheduler import LlmScheduler, invoke_llm_chain
+
+
+class TestTokenLedger(unittest.TestCase):
+
+    def test_totals_by_stage_user_and_session(self):
+        ledger = TokenLedger()
+        ledger.record("intent_detection", 1000, 100, model_name="gpt-4o-mini", session_id="s1")
+        ledger.record("intent_detection", 500, 50, model_name="gpt-4o-mini", session_id="s2")
+        ledger.record("wishlist_analysis", 2000, 200, model_name="gpt-4o", user_id="u1", estimated=True)
+
+        intent = ledger.totals["stage"]["intent_detection"]
+        self.assertEqual((intent["calls"], intent["prompt_tokens"], intent["completion_tokens"]), (2, 1500, 150))
+        self.assertAlmostEqual(intent["cost_usd"], (1500 * 0.15 + 150 * 0.60) / 1_000_000)
+        self.assertEqual(ledger.totals["session"]["s1"]["calls"], 1)
+        self.assertEqual(ledger.totals["user"]["u1"]["estimated_calls"], 1)
+        self.assertNotIn(None, ledger.totals["user"])
+
+    def test_budget_alerts_fire_once_per_level(self):
+        ledger = TokenLedger(budgets={"session": 1000})
+        ledger.record("intent_detection", 700, 100, session_id="s1")
+        self.assertEqual(len(ledger.alerts), 1) # 80%
+        ledger.record("intent_detection", 100, 0, session_id="s1")
+        self.assertEqual(len(ledger.alerts), 1)
+        ledger.record("intent_detection", 200, 0, session_id="s1")
+        self.assertEqual(len(ledger.alerts), 2) # 100%
+        self.assertIn("s1", ledger.alerts[-1])
+
+    def test_report_lists_most_expensive_prompts(self):
+        ledger = TokenLedger(top_k=2)
+        ledger.record("purchase_advice", 100, 10, prompt_preview="barato")
+        ledger.record("wishlist_analysis", 5000, 500, prompt_preview="caro")
+        ledger.record("intent_detection", 1000, 100, prompt_preview="medio")
+        self.assertEqual([e["prompt"] for e in ledger.most_expensive()], ["caro", "medio"])
+        report = ledger.report()
+        self.assertIn("wishlist_analysis", report)
+        self.assertIn("Prompts más caros", report)
+
+    def test_model_prices_use_longest_prefix(self):
+        self.assertEqual(model_prices("gpt-4o-mini-2024-07-18"), (0.15, 0.60))
+        self.assertEqual(model_prices("gpt-4o-2024-08-06"), (2.50, 10.00))
+
+
+class TestInvokeAccounting(unittest.TestCase):
+
+    def setUp(self):
+        llm_ledger.reset()
+        self.scheduler = LlmScheduler(requests_per_minute=6000)
+
+    def tearDown(self):
+        llm_ledger.reset()
+
+    def test_reported_usage_is_recorded(self):
+        llm = GenericFakeChatModel(messages=iter([AIMessage(
+            content="hola", usage_metadata={"input_tokens": 42, "output_tokens": 7, "total_tokens": 49})]))
+        chain = ChatPromptTemplate.from_template("Saluda a {nombre}") | llm
+        with llm_attribution(user_id="u1", session_id="s1"):
+            invoke_llm_chain(chain, {"nombre": "Ana"}, scheduler=self.scheduler, stage="intent_detection")
+
+        entry = llm_ledger.most_expensive()[0]
+        self.assertEqual((entry["prompt_tokens"], entry["completion_tokens"]), (42, 7))
+        self.assertFalse(entry["estimated"])
+        self.assertEqual((entry["user"], entry["session"]), ("u1", "s1"))
+        self.assertIn("Saluda a Ana", entry["prompt"])
+
+    def test_missing_usage_is_estimated_locally(self):
+        chain = ChatPromptTemplate.from_template("Describe {producto}") | RunnableLambda(lambda _: "x" * 400)
+        invoke_llm_chain(chain, {"producto": "cafetera"}, scheduler=self.scheduler, stage="purchase_advice")
+
+        totals = llm_ledger.totals["stage"]["purchase_advice"]
+        self.assertEqual(totals["estimated_calls"], 1)
+        self.assertEqual(totals["completion_tokens"], 100) # ~4 caracteres por token
+        self.assertGreater(totals["prompt_tokens"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.utils.llm_scheduler import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, CircuitOpenError, LlmScheduler, SingleFlight, TokenBucket,
+    _chain_scope, invoke_llm_chain, prompt_fingerprint,
+)
+
+
+class RateLimitError(Exception):
+    """Imita el error 429 del cliente de OpenAI (se detecta por nombre)."""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refills_continuously(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock) # 1 unidad por segundo
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(2), 2.0)
+        clock.now += 1.5
+        self.assertAlmostEqual(bucket.wait_time(1), 0.0)
+        self.assertAlmostEqual(bucket.wait_time(500), 58.5) # Limitado a la capacidad del cubo
+
+
+class TestLlmScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sleeps = []
+        self.scheduler = LlmScheduler(requests_per_minute=6000, max_retries=3, failure_threshold=2,
+                                      cooldown_seconds=30, clock=self.clock, sleep=self.sleeps.append)
+
+    def test_retries_transient_errors_with_backoff(self):
+        outcomes = [RateLimitError("429"), TimeoutError("timeout"), "ok"]
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.scheduler.run(call), "ok")
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertLessEqual(self.sleeps[0], self.scheduler.base_delay)
+        self.assertLessEqual(self.sleeps[1], self.scheduler.base_delay * 2)
+        self.assertEqual(self.scheduler.stats["rate_limited"], 1)
+        # El 429 bajó la tasa a la mitad (3000) y el éxito la recupera en un 10% de la configurada.
+        self.assertAlmostEqual(self.scheduler._current_rpm, 3600)
+
+    def test_non_retryable_errors_are_raised_immediately(self):
+        calls = []
+
+        def call():
+            calls.append(1)
+            raise ValueError("salida inválida")
+
+        with self.assertRaises(ValueError):
+            self.scheduler.run(call)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(self.scheduler.circuit_open)
+
+    def test_circuit_opens_and_recovers(self):
+        def failing():
+            raise TimeoutError("timeout")
+
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                self.scheduler.run(failing)
+        self.assertTrue(self.scheduler.circuit_open)
+        with self.assertRaises(CircuitOpenError):
+            self.scheduler.run(lambda: "no se llama")
+
+        self.clock.now += 31 # Pasado el enfriamiento se permite una llamada de prueba
+        self.assertEqual(self.scheduler.run(lambda: "ok"), "ok")
+        self.assertFalse(self.scheduler.circuit_open)
+
+    def test_failed_trial_reopens_circuit(self):
+        self.scheduler._record_failure()
+        self.scheduler._record_failure()
+        self.clock.now += 31
+        with self.assertRaises(TimeoutError):
+            self.scheduler.run(lambda: (_ for _ in ()).throw(TimeoutError("timeout")))
+        self.assertTrue(self.scheduler.circuit_open)
+
+    def test_interactive_calls_preempt_batch_calls(self):
+        scheduler = LlmScheduler(requests_per_minute=300) # Un turno cada 0.2 s con el cubo vacío
+        scheduler._requests.tokens = 0
+        order = []
+        batch = threading.Thread(target=scheduler.run, args=(lambda: order.append("batch"),), kwargs={"priority": PRIORITY_BATCH})
+        batch.start()
+        time.sleep(0.02) # El lote llega primero a la cola
+        interactive = threading.Thread(target=scheduler.run, args=(lambda: order.append("interactive"),), kwargs={"priority": PRIORITY_INTERACTIVE})
+        interactive.start()
+        batch.join(timeout=5)
+        interactive.join(timeout=5)
+        self.assertEqual(order, ["interactive", "batch"])
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def _run_concurrently(self, target, count):
+        results = [None] * count
+        def worker(i):
+            try:
+                results[i] = target()
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        return results
+
+    def test_identical_calls_share_one_request(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def slow_call():
+            calls.append(1)
+            release.wait(timeout=5)
+            return {"advice": "comprar ahora"}
+
+        timer = threading.Timer(0.1, release.set)
+        timer.start()
+        results = self._run_concurrently(lambda: flight.do("misma-huella", slow_call), 5)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == {"advice": "comprar ahora"} for r in results))
+        self.assertEqual(flight.stats, {"leaders": 1, "coalesced": 4})
+
+        # Terminada la llamada, la huella se libera (no es un caché).
+        self.assertEqual(flight.do("misma-huella", lambda: "nuevo"), "nuevo")
+
+    def test_errors_are_shared_with_followers(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing_call():
+            release.wait(timeout=5)
+            raise TimeoutError("timeout")
+
+        timer = threading.Timer(0.1, release.set)
+        timer.start()
+        results = self._run_concurrently(lambda: flight.do("k", failing_call), 3)
+        self.assertTrue(all(isinstance(r, TimeoutError) for r in results))
+
+    def test_fingerprint_is_canonical(self):
+        self.assertEqual(prompt_fingerprint("p", {"a": 1, "b": 2}), prompt_fingerprint("p", {"b": 2, "a": 1}))
+        self.assertNotEqual(prompt_fingerprint("p", {"a": 1}), prompt_fingerprint("q", {"a": 1}))
+
+    def test_invoke_llm_chain_coalesces_identical_payloads(self):
+        release = threading.Event()
+
+        class FakeChain:
+            calls = 0
+            def invoke(self, payload):
+                FakeChain.calls += 1
+                release.wait(timeout=5)
+                return payload["text_input"].upper()
+
+        scheduler = LlmScheduler(requests_per_minute=6000)
+        timer = threading.Timer(0.1, release.set)
+        timer.start()
+        results = self._run_concurrently(
+            lambda: invoke_llm_chain(FakeChain(), {"text_input": "post viral"}, scheduler=scheduler, scope="test"), 4)
+        self.assertEqual(results, ["POST VIRAL"] * 4)
+        self.assertEqual(FakeChain.calls, 1)
+        self.assertEqual(scheduler.stats["calls"], 1) # Los duplicados no consumen cuota
+
+    def test_chain_scope_separates_models_and_schemas(self):
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_openai import ChatOpenAI
+        from pydantic import BaseModel
+
+        class Intent(BaseModel):
+            intent: str
+
+        class Advice(BaseModel):
+            intent: str
+
+        prompt = ChatPromptTemplate.from_template("Analiza: {text_input}")
+        def chain(model_name="gpt-4o-mini", temperature=0.0, schema=Intent):
+            llm = ChatOpenAI(api_key="sk-test", model_name=model_name, temperature=temperature)
+            return prompt | (llm.with_structured_output(schema) if schema else llm)
+
+        self.assertEqual(_chain_scope(chain()), _chain_scope(chain())) # Misma cadena armada de nuevo
+        scopes = {_chain_scope(c) for c in (chain(), chain(model_name="gpt-4o"), chain(temperature=0.7),
+                                            chain(schema=Advice), chain(schema=None))}
+        self.assertEqual(len(scopes), 5)
+
+
+class TestMasterAgentFallback(unittest.TestCase):
+
+    def test_open_circuit_uses_rule_based_path(self):
+        from src.agent import master_agent
+
+        scheduler = LlmScheduler(failure_threshold=1)
+        scheduler._record_failure()
+        with patch.object(master_agent, "get_llm_scheduler", return_value=scheduler), \
+             patch.object(master_agent, "get_llm", side_effect=AssertionError("no debe crear el LLM")):
+            decision = master_agent.run_conversational_master_agent("adiós", [("user", "hola")])
+        self.assertEqual(decision.next_action, "end_conversation")
+
+
+if __name__ == '__main__':
+    unittest.main()
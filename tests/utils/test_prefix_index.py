@@ -0,0 +1,60 @@
+import unittest
+
+from src.utils.catalog_store import get_catalog_store
+from src.utils import data_loader
+from src.utils.prefix_index import PrefixIndex, catalog_suggestions, popularity
+
+PRODUCTS = [
+    {"id": "MP002", "name": "Auriculares ProSound", "brand": "AudioMax", "category": "Electrónica",
+     "ratings": {"average_rating": 4.6, "review_count": 210}},
+    {"id": "MP003", "name": "Cafetera Espresso Automática", "brand": "HomeBeans", "category": "Hogar",
+     "ratings": {"average_rating": 4.9, "review_count": 90}},
+    {"id": "MP007", "name": "Cafetera Italiana", "brand": "HomeBeans", "category": "Hogar",
+     "ratings": {"average_rating": 4.1, "review_count": 12}},
+]
+
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.rebuild(PRODUCTS)
+
+    def test_suggestions_ranked_by_popularity(self):
+        self.assertEqual([s["id"] for s in self.index.suggest("Caf")], ["MP003", "MP007"])
+        self.assertEqual(self.index.suggest("c"), []) # Prefijo demasiado corto
+        self.assertEqual(self.index.suggest("espr"), [{"text": "Cafetera Espresso Automática", "kind": "product", "id": "MP003"}])
+
+    def test_popularity_reads_the_catalog_schema(self):
+        products = data_loader.get_marketplace_products()
+        self.assertTrue(products)
+        for product in products: # Rating ponderado por `review_count`, como en el catálogo real
+            self.assertGreater(popularity(product), product["ratings"]["average_rating"])
+
+    def test_brands_and_categories_are_suggested_once(self):
+        suggestions = self.index.suggest("ho")
+        self.assertEqual([(s["text"], s["kind"]) for s in suggestions], [("HomeBeans", "brand"), ("Hogar", "category")])
+        self.assertEqual(self.index.suggest("electro")[0]["text"], "Electrónica") # Sin tildes en la consulta
+
+    def test_deltas_update_suggestions(self):
+        self.index.suggest("ca") # Queda en caché hasta el próximo cambio
+        self.index.remove("MP003")
+        self.assertEqual([s["id"] for s in self.index.suggest("ca")], ["MP007"])
+        self.index.upsert({"id": "MP007", "name": "Molinillo de Café", "brand": "HomeBeans", "category": "Hogar"})
+        self.assertEqual(self.index.suggest("cafetera"), [])
+        self.assertEqual([s["kind"] for s in self.index.suggest("hom")], ["brand"])
+        self.index.remove("MP007")
+        self.assertEqual(self.index.suggest("hom"), [])
+
+    def test_catalog_suggestions_use_the_longest_matching_suffix(self):
+        catalog = get_catalog_store()
+        catalog.load(PRODUCTS)
+        self.addCleanup(catalog.load, [])
+        catalog.ensure_index("autocomplete", PrefixIndex)
+        used, suggestions = catalog_suggestions("busca cafetera esp")
+        self.assertEqual((used, suggestions[0]["id"]), (2, "MP003"))
+        self.assertEqual(catalog_suggestions("busca cafetera "), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from src.utils.product_resolver import ProductResolverIndex, normalize_product_name, normalize_url
+
+PRODUCTS = [
+    {"id": "MP001", "name": "Smartphone Avanzado XZ100", "product_url": "https://example.com/products/MP001"},
+    {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "product_url": "https://www.example.com/p/prosound"},
+    {"id": "MP005", "name": "Lámpara LED", "product_url": None},
+    {"id": "MP006", "name": "Lámpara  LED!", "product_url": None},
+]
+
+
+class TestProductResolverIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ProductResolverIndex()
+        self.index.rebuild(PRODUCTS)
+
+    def test_normalization(self):
+        self.assertEqual(normalize_product_name("  Cafetera  Espresso-Automática! "), "cafetera espresso automatica")
+        self.assertEqual(normalize_url("HTTPS://WWW.Example.com/p/prosound/?ref=pin#top"), "example.com/p/prosound")
+        self.assertIsNone(normalize_url(""))
+
+    def test_resolves_links(self):
+        self.assertEqual(self.index.resolve_link("http://example.com/p/prosound?utm=x")["id"], "MP002")
+        self.assertEqual(self.index.resolve_link("https://example.com/products/MP001/")["id"], "MP001")
+        self.assertIsNone(self.index.resolve_link("https://example.com/products/MP999"))
+
+    def test_resolves_unique_exact_names_only(self):
+        self.assertEqual(self.index.resolve_name("smartphone avanzado  XZ100")["id"], "MP001")
+        self.assertIsNone(self.index.resolve_name("Lámpara LED")) # Ambiguo: dos productos
+        self.assertIsNone(self.index.resolve_name("Smartphone"))
+
+    def test_resolve_item_prefers_link(self):
+        pin = {"link": "https://example.com/products/MP001", "detected_product_name": "Auriculares Inalámbricos ProSound"}
+        product, method = self.index.resolve_item(pin)
+        self.assertEqual((product["id"], method), ("MP001", "link"))
+        product, method = self.index.resolve_item({"detected_product_name": "Auriculares Inalámbricos ProSound"})
+        self.assertEqual((product["id"], method), ("MP002", "exact_name"))
+        self.assertEqual(self.index.resolve_item({"detected_product_name": None}), (None, None))
+
+    def test_upsert_and_remove_keep_index_consistent(self):
+        self.index.remove("MP006")
+        self.assertEqual(self.index.resolve_name("Lámpara LED")["id"], "MP005")
+        self.index.upsert({"id": "MP001", "name": "Smartphone XZ200", "product_url": "https://example.com/products/MP001"})
+        self.assertIsNone(self.index.resolve_name("Smartphone Avanzado XZ100"))
+        self.assertEqual(self.index.resolve_name("smartphone xz200")["id"], "MP001")
+
+
+if __name__ == '__main__':
+    unittest.main()
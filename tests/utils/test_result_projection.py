@@ -0,0 +1,77 @@
+import unittest
+
+from src.agent.search_handler import search_catalog, search_catalog_cached, search_result_cache
+from src.utils.catalog_store import get_catalog_store
+from src.utils.result_projection import hydrate_results, project_search_page, result_facets
+
+PRODUCTS = [
+    {"id": "MP003", "name": "Cafetera Espresso Automática", "brand": "HomeBeans", "price": 299.0, "currency": "USD",
+     "stock": 5, "description": "Cafetera con molinillo integrado...", "ratings": {"average_rating": 4.9, "count": 90}},
+    {"id": "MP007", "name": "Cafetera Italiana", "brand": "HomeBeans", "price": 35.0, "currency": "USD", "stock": 0},
+    {"id": "MP008", "name": "Cafetera Industrial", "brand": "BrewPro", "price": 899.0, "currency": "USD", "stock": 2},
+]
+
+
+class TestResultProjection(unittest.TestCase):
+
+    def test_page_keeps_compact_top_k_and_all_ids(self):
+        page = {"results": PRODUCTS, "total_count": 12, "offset": 0, "limit": 10, "corrections": [], "cached": False,
+                "frequently_bought_together": [{**PRODUCTS[2], "bought_with": 3}]}
+        projected = project_search_page(page, top_k=2)
+
+        self.assertEqual(projected["results"][0], {"id": "MP003", "name": "Cafetera Espresso Automática", "price": 299.0,
+                                                   "currency": "USD", "rating": 4.9, "in_stock": True})
+        self.assertEqual(len(projected["results"]), 2)
+        self.assertFalse(projected["results"][1]["in_stock"])
+        self.assertEqual(projected["result_ids"], ["MP003", "MP007", "MP008"])
+        self.assertEqual((projected["total_count"], projected["offset"], projected["limit"]), (12, 0, 10))
+        self.assertEqual([p["id"] for p in projected["frequently_bought_together"]], ["MP008"])
+        self.assertNotIn("description", str(projected))
+
+    def test_cross_sell_keeps_stock_and_rating_from_the_catalog(self):
+        get_catalog_store().load(PRODUCTS)
+        self.addCleanup(get_catalog_store().load, [])
+        entry = {"id": "MP003", "name": "Cafetera Espresso Automática", "price": 299.0, "currency": "USD",
+                 "score": 0.8, "bought_with": ["MP007"]}
+        projected = project_search_page({"results": [], "frequently_bought_together": [entry]})
+
+        self.assertEqual(projected["frequently_bought_together"], [{
+            "id": "MP003", "name": "Cafetera Espresso Automática", "price": 299.0, "currency": "USD",
+            "rating": 4.9, "in_stock": True, "score": 0.8, "bought_with": ["MP007"],
+        }])
+
+    def test_facets_summarize_products(self):
+        facets = result_facets(PRODUCTS)
+        self.assertEqual(facets["count"], 3)
+        self.assertEqual(facets["price_range"], {"min": 35.0, "max": 899.0})
+        self.assertEqual(facets["brands"], {"HomeBeans": 2, "BrewPro": 1})
+        self.assertEqual(result_facets([]), {"count": 0, "price_range": None, "brands": {}})
+
+    def test_search_facets_cover_all_matches_not_just_the_page(self):
+        expected = {"count": 3, "price_range": {"min": 35.0, "max": 899.0}, "brands": {"HomeBeans": 2, "BrewPro": 1}}
+        page = search_catalog(PRODUCTS, query="cafetera", limit=1)
+        self.assertEqual((len(page["results"]), page["facets"]), (1, expected))
+        self.assertEqual(project_search_page(page)["facets"], expected)
+        self.assertEqual(search_catalog(PRODUCTS, query="cafetera", max_price=100)["facets"]["brands"], {"HomeBeans": 1})
+
+        get_catalog_store().load(PRODUCTS)
+        self.addCleanup(get_catalog_store().load, [])
+        search_result_cache.clear()
+        search_catalog_cached(query="cafetera", limit=1)
+        cached = search_catalog_cached(query="cafetera", limit=1)
+        self.assertTrue(cached["cached"])
+        self.assertEqual(cached["facets"], expected)
+
+    def test_full_products_are_hydrated_from_the_catalog(self):
+        get_catalog_store().load(PRODUCTS)
+        self.addCleanup(get_catalog_store().load, [])
+        projected = project_search_page({"results": PRODUCTS, "total_count": 3}, top_k=1)
+        get_catalog_store().apply_delta(deletes=["MP007"])
+
+        hydrated = hydrate_results(projected)
+        self.assertEqual([p["id"] for p in hydrated], ["MP003", "MP008"])
+        self.assertEqual(hydrated[0]["description"], PRODUCTS[0]["description"])
+
+
+if __name__ == '__main__':
+    unittest.main()
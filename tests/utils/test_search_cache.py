@@ -0,0 +1,47 @@
+import unittest
+from src.utils.search_cache import SearchResultCache, normalize_criteria
+
+
+class TestSearchResultCache(unittest.TestCase):
+
+    def test_normalize_criteria(self):
+        a = normalize_criteria({"query": "  Cafetera   Espresso ", "max_price": 300, "brand": None, "ranked": False})
+        b = normalize_criteria({"query": "cafetera espresso", "max_price": 300.0})
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, normalize_criteria({"query": "cafetera espresso", "max_price": 300.0, "in_stock": True}))
+
+    def test_key_includes_catalog_version(self):
+        criteria = {"query": "tv"}
+        self.assertNotEqual(SearchResultCache.make_key(criteria, 1), SearchResultCache.make_key(criteria, 2))
+
+    def test_hit_miss_and_stats(self):
+        cache = SearchResultCache()
+        key = SearchResultCache.make_key({"query": "tv"}, 1)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, ["MP004"], 1)
+        self.assertEqual(cache.get(key), (["MP004"], 1, None))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_partial_window_only_serves_smaller_pages(self):
+        cache = SearchResultCache()
+        key = SearchResultCache.make_key({"query": "cocina"}, 1)
+        cache.put(key, ["A", "B"], 10) # Solo se guardaron los 2 primeros de 10
+        self.assertIsNotNone(cache.get(key, needed=2))
+        self.assertIsNone(cache.get(key, needed=5))
+        self.assertIsNone(cache.get(key, needed=None))
+
+    def test_lru_eviction(self):
+        cache = SearchResultCache(max_entries=2)
+        keys = [SearchResultCache.make_key({"query": q}, 1) for q in ("a", "b", "c")]
+        cache.put(keys[0], [], 0)
+        cache.put(keys[1], [], 0)
+        cache.get(keys[0]) # "a" pasa a ser el más reciente
+        cache.put(keys[2], [], 0)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from src.utils.spelling_index import SymSpellIndex, edit_distance
+
+PRODUCTS = [
+    {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "brand": "AudioMax", "category": "Electrónica", "tags": ["audio"]},
+    {"id": "MP003", "name": "Cafetera Espresso Automática", "brand": "HomeBeans", "category": "Hogar", "tags": ["cocina", "café"]},
+]
+
+
+class TestSymSpellIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SymSpellIndex(max_edit_distance=2)
+        self.index.rebuild(PRODUCTS)
+
+    def test_edit_distance_counts_transpositions_once(self):
+        self.assertEqual(edit_distance("cafetera", "cafeetra", 2), 1)
+        self.assertEqual(edit_distance("audio", "radio", 2), 2)
+        self.assertEqual(edit_distance("audio", "hogar", 2), 3) # Corta al superar el máximo
+
+    def test_corrects_unknown_words_and_reports_them(self):
+        query, corrections = self.index.correct_query("Cafeterra automatica")
+        self.assertEqual(query, "cafetera automatica")
+        self.assertEqual(corrections, [{"original": "cafeterra", "corrected": "cafetera", "distance": 1}])
+        query, corrections = self.index.correct_query("auriculres audiomx")
+        self.assertEqual(query, "auriculares audiomax")
+        self.assertEqual([c["original"] for c in corrections], ["auriculres", "audiomx"])
+
+    def test_known_short_and_distant_words_are_kept(self):
+        self.assertEqual(self.index.correct_query("cafetera de café"), ("cafetera de café", []))
+        self.assertEqual(self.index.correct_query("cafe", is_known=lambda term: term == "cafe"), ("cafe", []))
+        self.assertEqual(self.index.correct_query("sol"), ("sol", [])) # Muy corta para corregir
+        self.assertEqual(self.index.correct_query("televisor"), ("televisor", []))
+
+    def test_max_edit_distance_is_configurable(self):
+        strict = SymSpellIndex(max_edit_distance=1)
+        strict.rebuild(PRODUCTS)
+        self.assertEqual(strict.lookup("cafteraa"), None)
+        self.assertEqual(self.index.lookup("cafteraa"), ("cafetera", 2))
+
+    def test_removed_products_leave_the_vocabulary(self):
+        self.index.remove("MP003")
+        self.assertNotIn("cafetera", self.index)
+        self.assertEqual(self.index.correct_query("cafeterra"), ("cafeterra", []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.agent.graph import create_conversational_graph
+from src.utils.catalog_store import get_catalog_store
+from src.utils.sqlite_checkpointer import SqliteCheckpointer
+
+
+class TestSqliteCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "sessions.sqlite3")
+        self.checkpointer = SqliteCheckpointer(self.db_path)
+        self.config = {"configurable": {"thread_id": "sesion-1"}}
+        get_catalog_store().load([
+            {"id": "MP003", "name": "Cafetera Espresso Automática", "category": "Hogar", "price": 299.00, "currency": "USD", "stock": 5},
+        ])
+
+    def tearDown(self):
+        self.checkpointer.close()
+        get_catalog_store().load([])
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _run_turns(self, app, *inputs):
+        state = None
+        for i, text in enumerate(inputs):
+            turn_input = {"conversation_history": [], "user_profile": {"budget": 500}} if i == 0 else {}
+            state = app.invoke({**turn_input, "current_user_input": text}, config=self.config)
+        return state
+
+    def test_session_resumes_after_restart(self):
+        app = create_conversational_graph(checkpointer=self.checkpointer)
+        self._run_turns(app, "busca cafetera", "busca espresso")
+        self.checkpointer.close()
+
+        # "Reinicio": nuevo checkpointer sobre el mismo archivo.
+        self.checkpointer = SqliteCheckpointer(self.db_path)
+        self.assertTrue(self.checkpointer.has_session("sesion-1"))
+        resumed = create_conversational_graph(checkpointer=self.checkpointer)
+        values = resumed.get_state(self.config).values
+        self.assertEqual([text for speaker, text in values["conversation_history"] if speaker == "user"],
+                         ["busca cafetera", "busca espresso"])
+        self.assertEqual(values["user_profile"], {"budget": 500})
+
+        # Un turno nuevo solo envía la entrada y el historial sigue creciendo.
+        state = resumed.invoke({"current_user_input": "busca cafetera"}, config=self.config)
+        self.assertEqual(len(state["conversation_history"]), 6)
+
+    def test_async_turns_do_not_block_the_event_loop(self):
+        app = create_conversational_graph(checkpointer=self.checkpointer)
+        sqlite_threads = set()
+        original_put = SqliteCheckpointer.put
+
+        def recording_put(checkpointer, *args, **kwargs):
+            sqlite_threads.add(threading.current_thread())
+            return original_put(checkpointer, *args, **kwargs)
+
+        async def turn():
+            loop_thread = threading.current_thread()
+            state = await app.ainvoke({"conversation_history": [], "current_user_input": "busca cafetera"}, config=self.config)
+            return loop_thread, state
+
+        with patch.object(SqliteCheckpointer, "put", recording_put):
+            loop_thread, state = asyncio.run(turn())
+        self.assertIn("Cafetera Espresso", state["master_agent_decision"]["response_text"])
+        self.assertTrue(sqlite_threads)
+        self.assertNotIn(loop_thread, sqlite_threads) # Las escrituras se hicieron en otro hilo
+        self.assertTrue(self.checkpointer.has_session("sesion-1"))
+
+    def test_only_changed_channels_are_stored(self):
+        app = create_conversational_graph(checkpointer=self.checkpointer)
+        self._run_turns(app, "busca cafetera")
+        conn = self.checkpointer._conn
+        profile_blobs = conn.execute("SELECT COUNT(*) FROM channel_blobs WHERE channel = 'user_profile'").fetchone()[0]
+        history_blobs = conn.execute("SELECT COUNT(*) FROM channel_blobs WHERE channel = 'conversation_history'").fetchone()[0]
+        self.assertEqual(profile_blobs, 1) # Escrito una vez, nunca cambió
+        self.assertGreater(history_blobs, 1)
+
+    def test_prune_keeps_latest_checkpoints(self):
+        app = create_conversational_graph(checkpointer=self.checkpointer)
+        self._run_turns(app, "busca cafetera", "busca espresso")
+        before = app.get_state(self.config).values
+        self.checkpointer.prune(["sesion-1"], keep_last=2)
+
+        self.assertEqual(len(list(self.checkpointer.list(self.config))), 2)
+        self.assertEqual(app.get_state(self.config).values, before)
+
+    def test_prune_inactive_and_delete(self):
+        app = create_conversational_graph(checkpointer=self.checkpointer)
+        self._run_turns(app, "busca cafetera")
+        self.assertEqual(self.checkpointer.prune_inactive(max_age_seconds=3600), [])
+        self.assertEqual(self.checkpointer.prune_inactive(max_age_seconds=-1), ["sesion-1"])
+        self.assertFalse(self.checkpointer.has_session("sesion-1"))
+        self.assertIsNone(self.checkpointer.get_tuple(self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
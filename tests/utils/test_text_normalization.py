@@ -0,0 +1,41 @@
+import unittest
+
+from src.utils.text_normalization import NormalizedColumnsIndex, normalize_terms, normalize_text, stem_token
+
+
+class TestTextNormalization(unittest.TestCase):
+
+    def test_normalize_text_folds_accents_and_punctuation(self):
+        self.assertEqual(normalize_text("  Cafetera Espresso-Automática! "), "cafetera espresso automatica")
+        self.assertEqual(normalize_text("Pingüino_de ÑANDÚ"), "pinguino de nandu")
+        self.assertEqual(normalize_text(None), "")
+
+    def test_light_stemming_only_removes_plurals(self):
+        self.assertEqual(stem_token("auriculares"), "auricular")
+        self.assertEqual(stem_token("cafeteras"), "cafetera")
+        self.assertEqual(stem_token("luces"), "luz")
+        self.assertEqual(stem_token("dulces"), "dulce")
+        self.assertEqual(stem_token("automatica"), "automatica") # El género no se toca
+        self.assertEqual(stem_token("tus"), "tus") # Palabras cortas intactas
+        self.assertEqual(normalize_terms("Las Cafeteras Automáticas", {"las"}), ["cafetera", "automatica"])
+
+    def test_singular_and_plural_share_the_stem(self):
+        for singular, plural in [("cable", "cables"), ("juguete", "juguetes"), ("mueble", "muebles"),
+                                 ("deporte", "deportes"), ("smartphone", "smartphones"), ("motor", "motores"),
+                                 ("papel", "papeles"), ("reloj", "relojes"), ("boton", "botones"),
+                                 ("ciudad", "ciudades"), ("mes", "meses"), ("clase", "clases")]:
+            with self.subTest(plural=plural):
+                self.assertEqual(stem_token(plural), stem_token(singular))
+
+    def test_columns_follow_catalog_deltas(self):
+        index = NormalizedColumnsIndex()
+        index.rebuild([{"id": "MP003", "name": "Cafetera Automática", "category": "Hogar"}])
+        self.assertEqual(index.get({"id": "MP003"})["name"], "cafetera automatica")
+        index.upsert({"id": "MP003", "name": "Cafetera Eléctrica", "category": "Cocina"})
+        self.assertEqual(index.get({"id": "MP003"})["category"], "cocina")
+        index.remove("MP003")
+        self.assertEqual(index.get({"id": "MP003", "brand": "HomeBeans"})["brand"], "homebeans") # Calculado al vuelo
+
+
+if __name__ == '__main__':
+    unittest.main()
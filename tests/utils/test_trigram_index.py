@@ -0,0 +1,45 @@
+import unittest
+from src.utils.trigram_index import TrigramIndex, text_trigrams
+
+
+class TestTrigramIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.rebuild([
+            {"id": "MP001", "name": "Smartphone Avanzado XZ100"},
+            {"id": "MP002", "name": "Auriculares Inalámbricos ProSound"},
+            {"id": "MP003", "name": "Cafetera Espresso Automática"},
+        ])
+
+    def test_trigrams_are_padded_per_word(self):
+        self.assertEqual(text_trigrams("Sol"), frozenset({" so", "sol", "ol "}))
+        self.assertEqual(text_trigrams("  "), frozenset())
+
+    def test_fuzzy_name_match(self):
+        results = self.index.search("Auriculares ProSound de AudioMax")
+        self.assertEqual(results[0][0]["id"], "MP002")
+        self.assertGreater(results[0][1], 0.5)
+
+    def test_typo_match(self):
+        results = self.index.search("cafetera espreso")
+        self.assertEqual(results[0][0]["id"], "MP003")
+
+    def test_threshold_filters_unrelated(self):
+        self.assertEqual(self.index.search("laptop gamer"), [])
+
+    def test_top_k_and_ordering(self):
+        results = self.index.search("Smartphone Avanzado", top_k=1, threshold=0.0)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0]["id"], "MP001")
+
+    def test_upsert_and_remove(self):
+        self.index.upsert({"id": "MP002", "name": "Lámpara Moderna LED"})
+        self.assertEqual(self.index.search("Auriculares ProSound"), [])
+        self.assertEqual(self.index.search("lampara moderna")[0][0]["id"], "MP002")
+        self.index.remove("MP002")
+        self.assertEqual(self.index.search("Lámpara Moderna LED"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from src.utils.vector_index import TfidfVectorIndex, tokenize
+
+
+class TestTfidfVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TfidfVectorIndex()
+        self.index.rebuild([
+            {"id": "MP001", "name": "Smartphone Avanzado XZ100", "brand": "TechGlobal",
+             "description": "Cámara de 108MP y pantalla AMOLED", "tags": ["android", "móvil"]},
+            {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "brand": "AudioMax",
+             "description": "Cancelación de ruido y sonido Hi-Fi", "tags": ["audio", "música"]},
+            {"id": "MP003", "name": "Cafetera Espresso Automática", "brand": "HomeBeans",
+             "description": "Café perfecto cada mañana", "tags": ["cocina", "café"]},
+        ])
+
+    def test_tokenize_drops_stopwords(self):
+        self.assertEqual(tokenize("Auriculares de la marca AudioMax"), ["auricular", "marca", "audiomax"])
+
+    def test_batch_query_matches_each_item(self):
+        results = self.index.query_batch(["auriculares audiomax", "café cocina", "android móvil"], top_k=1)
+        self.assertEqual([r[0][0]["id"] for r in results], ["MP002", "MP003", "MP001"])
+
+    def test_scores_are_sorted_and_bounded(self):
+        results = self.index.query("sonido audio café", top_k=3)
+        scores = [score for _, score in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(0 < score <= 1.0 for score in scores))
+
+    def test_unknown_terms_return_nothing(self):
+        self.assertEqual(self.index.query("laptop gamer"), [])
+
+    def test_delta_updates_are_visible(self):
+        self.index.upsert({"id": "MP004", "name": "Laptop Gamer Pro"})
+        self.assertEqual(self.index.query("laptop gamer")[0][0]["id"], "MP004")
+        self.index.remove("MP004")
+        self.assertEqual(self.index.query("laptop gamer"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from src.utils.wishlist_dedup import (
+    UnionFind, cluster_wishlist_items, duplicate_member_keys, merge_duplicate_items,
+)
+
+INSTAGRAM = {"user_id": "u1", "saved_items": [
+    {"post_id": "IG1", "caption": "¡Me encantan estos auriculares!", "detected_product_name": "Auriculares  ProSound"},
+    {"post_id": "IG2", "caption": "Atardecer en la playa", "detected_product_name": None},
+]}
+PINTEREST = {"user_id": "u1", "boards": [{"pins": [
+    {"pin_id": "P1", "description": "Perfectos para el gimnasio", "link": "https://example.com/products/MP002",
+     "detected_product_name": "auriculares prosound"},
+    {"pin_id": "P2", "description": "Una lámpara moderna", "link": None, "detected_product_name": "Lámpara"},
+    {"pin_id": "P3", "description": "Lámpara moderna LED para el salón", "link": None, "detected_product_name": "lámpara"},
+]}]}
+CARTS = [{"cart_id": "CART_1", "items": [{"product_id": "MP002", "quantity": 1}]}]
+
+
+class TestWishlistClusters(unittest.TestCase):
+
+    def test_union_find_merges_transitively(self):
+        union_find = UnionFind()
+        union_find.union("a", "b")
+        union_find.union("c", "b")
+        self.assertEqual(union_find.find("a"), union_find.find("c"))
+        self.assertNotEqual(union_find.find("a"), union_find.find("d"))
+
+    def test_clusters_by_name_link_and_product_id(self):
+        clusters = cluster_wishlist_items(INSTAGRAM, PINTEREST, CARTS)
+        self.assertEqual(len(clusters), 2)
+        headphones, lamp = clusters
+        self.assertEqual(headphones["product_id"], "MP002")
+        self.assertEqual({m["key"] for m in headphones["members"]}, {"IG1", "P1", "CART_1:MP002"})
+        self.assertEqual(headphones["representative"], {"source": "abandoned_cart", "key": "CART_1:MP002"})
+        # Sin carrito, el representante es el item con más texto.
+        self.assertEqual(lamp["representative"], {"source": "pinterest", "key": "P3"})
+        self.assertEqual(duplicate_member_keys(clusters),
+                         {("instagram", "IG1"), ("pinterest", "P1"), ("pinterest", "P2")})
+
+    def test_catalog_names_link_items_to_product_ids(self):
+        instagram = {"saved_items": [{"post_id": "IG9", "caption": "Quiero esta cafetera", "detected_product_name": "Cafetera Espresso"}]}
+        carts = [{"cart_id": "CART_2", "items": [{"product_id": "MP003"}]}]
+        self.assertEqual(cluster_wishlist_items(instagram, None, carts), [])
+        clusters = cluster_wishlist_items(instagram, None, carts, {"cafetera espresso": "MP003"})
+        self.assertEqual(clusters[0]["product_id"], "MP003")
+
+
+class TestMergeDuplicateItems(unittest.TestCase):
+
+    def test_items_for_same_product_are_counted_once(self):
+        product = {"id": "MP002", "name": "Auriculares Inalámbricos ProSound", "price": 149.5}
+        items = [
+            {"source": "pinterest", "original_item_details": {"pin_id": "P9"}, "original_text": "para el gym",
+             "user_sentiment_or_intent": "deseo fuerte", "marketplace_details": product},
+            {"source": "abandoned_cart", "original_item_details": {"cart_id": "CART_1", "product_id": "MP002"},
+             "user_sentiment_or_intent": "producto en carrito abandonado", "marketplace_details": product},
+            {"source": "instagram", "original_item_details": {"post_id": "IG5"}, "marketplace_details": None},
+        ]
+        clusters = [{"cluster_id": "C1", "product_id": "MP002",
+                     "representative": {"source": "abandoned_cart", "key": "CART_1:MP002"},
+                     "members": [{"source": "instagram", "key": "IG1"}, {"source": "abandoned_cart", "key": "CART_1:MP002"}]}]
+        merged = merge_duplicate_items(items, clusters)
+
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0]["source"], "abandoned_cart") # Se conserva el item del carrito
+        self.assertEqual(merged[0]["sources"], ["pinterest", "abandoned_cart", "instagram"])
+        self.assertEqual(merged[0]["merged_from"][0]["text"], "para el gym")
+        self.assertIn("deseo fuerte", merged[0]["user_sentiment_or_intent"])
+        self.assertIs(merged[1], items[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from src.utils.wishlist_watermarks import WishlistWatermarkStore
+
+
+def entry(key, ts):
+    return (key, {"post_id": key}, f"texto {key}", ts)
+
+
+class TestWishlistWatermarkStore(unittest.TestCase):
+
+    def test_only_items_after_watermark_are_pending(self):
+        store = WishlistWatermarkStore(path=None)
+        entries = [entry("A", "2023-12-01T10:00:00Z"), entry("B", "2023-12-05T10:00:00Z")]
+        self.assertEqual(len(store.pending("instagram", "u1", entries)), 2)
+        store.update("instagram", "u1", ["A", "B"], {"A": {"n": "A"}, "B": {"n": "B"}},
+                     ["2023-12-01T10:00:00Z", "2023-12-05T10:00:00Z"])
+        self.assertEqual(store.watermark("instagram", "u1"), "2023-12-05T10:00:00Z")
+
+        entries.append(entry("C", "2023-12-09T10:00:00Z"))
+        self.assertEqual([e[0] for e in store.pending("instagram", "u1", entries)], ["C"])
+        self.assertEqual(len(store.pending("instagram", "otro_usuario", entries)), 3) # Marcas por usuario
+
+    def test_failed_items_hold_back_the_watermark(self):
+        store = WishlistWatermarkStore(path=None)
+        store.update("pinterest", "u1", ["A", "B"], {"B": {"n": "B"}},
+                     processed_timestamps=["2023-12-05T00:00:00Z"], failed_timestamps=["2023-12-01T00:00:00Z"])
+        self.assertIsNone(store.watermark("pinterest", "u1"))
+        pending = store.pending("pinterest", "u1", [entry("A", "2023-12-01T00:00:00Z"), entry("B", "2023-12-05T00:00:00Z")])
+        self.assertEqual([e[0] for e in pending], ["A"]) # B ya está guardado
+
+    def test_deleted_items_are_dropped(self):
+        store = WishlistWatermarkStore(path=None)
+        store.update("instagram", "u1", ["A", "B"], {"A": {"n": "A"}, "B": {"n": "B"}}, ["t1", "t2"])
+        deleted = store.update("instagram", "u1", ["B"], {}, [])
+        self.assertEqual(deleted, 1)
+        self.assertEqual(store.items("instagram", "u1", ["A", "B"]), [{"n": "B"}])
+
+    def test_state_persists_between_runs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "wishlist_state.json")
+            store = WishlistWatermarkStore(path)
+            store.update("instagram", "u1", ["A"], {"A": {"n": "A"}}, ["2023-12-01T10:00:00Z"])
+            store.save()
+
+            reloaded = WishlistWatermarkStore(path)
+            self.assertEqual(reloaded.watermark("instagram", "u1"), "2023-12-01T10:00:00Z")
+            self.assertEqual(reloaded.items("instagram", "u1", ["A"]), [{"n": "A"}])
+
+
+if __name__ == '__main__':
+    unittest.main()